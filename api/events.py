@@ -0,0 +1,73 @@
+"""实时事件推送路由（Server-Sent Events）"""
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from auth import get_current_user
+from events import event_bus
+from profiling import ProfiledRoute
+
+router = APIRouter(prefix="/api", tags=["events"], route_class=ProfiledRoute)
+
+# 心跳间隔（秒），防止反向代理断开空闲连接
+HEARTBEAT_INTERVAL = 15
+
+
+def format_sse(event_id: Optional[str], event: str, data: dict) -> str:
+    """格式化为 SSE 消息"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = Query(None, description="从指定事件 ID 之后开始推送"),
+    username: str = Depends(get_current_user)
+):
+    """
+    订阅实时事件（新记录 created / 删除 deleted / 收藏 favorited）
+
+    浏览器 EventSource 断线重连时会自动携带 Last-Event-ID 头，
+    服务端据此补发错过的事件；无法补齐时推送 reset 事件。
+
+    需要认证: 是
+    """
+    queue, backlog = event_bus.subscribe(last_event_id or since)
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            for event_id, event, data in backlog:
+                yield format_sse(event_id, event, data)
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                # None 表示服务端关闭
+                if item is None:
+                    break
+                yield format_sse(*item)
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
@@ -1,68 +1,77 @@
+import base64
+import json
 from typing import Optional, List
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, or_, and_
+from sqlalchemy import desc, func, or_, tuple_, update
 from models import ClipboardHistory, get_db
 from auth import get_current_user
+from events import event_bus
+import search as fts
+import stats
+import changes
+import deletion
+import downloads
+import compression
+import thumbnails
+from ingest import ingest_queue
+from tasks import scheduler
 from config import Config
+from profiling import ProfiledRoute
 
-router = APIRouter(prefix="/api", tags=["history"])
+router = APIRouter(prefix="/api", tags=["history"], route_class=ProfiledRoute)
 
-@router.get("/history")
-async def get_history(
-    page: int = Query(1, ge=1, description="页码"),
-    page_size: int = Query(20, ge=1, le=10000, description="每页数量"),
-    type: Optional[str] = Query(None, description="类型筛选: Text/Image/File/Group"),
-    search: Optional[str] = Query(None, description="搜索关键词"),
-    favorited: Optional[bool] = Query(None, description="仅显示收藏"),
-    start_date: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
-    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
-    db: Session = Depends(get_db),
-    username: str = Depends(get_current_user)
+CHANGES_CHUNK_SIZE = 500  # 增量同步按 ID 查询记录时每条查询的 ID 数（受 SQLite 绑定参数数量限制）
+
+# 数据库访问是同步的：访问数据库的处理函数使用普通 def，由 FastAPI 放到线程池执行，
+# 不会阻塞事件循环；必须是 async 的处理函数用 run_in_threadpool 执行查询
+
+def encode_cursor(item: ClipboardHistory, sort: str = "time") -> str:
+    """把最后一条记录的 (排序时间, id) 编码为不透明的游标"""
+    sort_time = (item.last_seen_at or item.created_at) if sort == "recent" else item.created_at
+    raw = json.dumps([sort_time.isoformat(), item.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """解析游标，返回 (排序时间, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def filter_history(
+    query,
+    type: Optional[str] = None,
+    search: Optional[str] = None,
+    favorited: Optional[bool] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
 ):
-    """
-    获取剪贴板历史记录列表
-    
-    需要认证: 是
-    """
-    # 构建查询
-    query = db.query(ClipboardHistory)
-    
+    """为历史记录查询添加筛选条件（列表和按条件删除共用）"""
     # 类型筛选
     if type:
         query = query.filter(ClipboardHistory.type == type)
     
-    # 收藏筛选
+    # 收藏筛选（favorited 为独立的索引列）
     if favorited is not None:
-        if favorited:
-            # 只显示收藏的：extra_data 包含 "favorited": true（注意可能有空格）
-            query = query.filter(
-                ClipboardHistory.extra_data.isnot(None),
-                or_(
-                    ClipboardHistory.extra_data.contains('"favorited":true'),
-                    ClipboardHistory.extra_data.contains('"favorited": true')
-                )
-            )
-        else:
-            # 只显示未收藏的：extra_data 为 NULL 或不包含 "favorited":true
-            query = query.filter(
-                or_(
-                    ClipboardHistory.extra_data.is_(None),
-                    and_(
-                        ~ClipboardHistory.extra_data.contains('"favorited":true'),
-                        ~ClipboardHistory.extra_data.contains('"favorited": true')
-                    )
-                )
-            )
+        query = query.filter(ClipboardHistory.favorited == favorited)
     
-    # 搜索
-    if search:
+    # 搜索：优先使用全文索引，短关键词或不支持 FTS5 时使用 LIKE
+    # （压缩保存的文本 content 只有预览，两种方式都需解压后匹配）
+    if search and fts.can_use_fts(search):
+        query = query.filter(ClipboardHistory.id.in_(fts.matching_ids(search)))
+    elif search:
         query = query.filter(
             or_(
                 ClipboardHistory.content.contains(search),
-                ClipboardHistory.extra_data.contains(search)
+                ClipboardHistory.extra_data.contains(search),
+                fts.compressed_match(search)
             )
         )
     
@@ -81,24 +90,189 @@ async def get_history(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid end_date format")
     
-    # 计算总数
-    total = query.count()
+    return query
+
+def list_columns():
+    """列表模式查询的列"""
+    return (
+        ClipboardHistory.id,
+        ClipboardHistory.type,
+        func.substr(ClipboardHistory.content, 1, Config.LIST_PREVIEW_CHARS).label("content"),
+        # 压缩保存的文本 content 只有预览，长度取 content_length
+        func.coalesce(ClipboardHistory.content_length, func.length(ClipboardHistory.content)).label("content_length"),
+        ClipboardHistory.file_path,
+        ClipboardHistory.file_size,
+        ClipboardHistory.created_at,
+        ClipboardHistory.favorited,
+        ClipboardHistory.image_width,
+        ClipboardHistory.image_height,
+        ClipboardHistory.last_seen_at,
+        ClipboardHistory.occurrences,
+    )
+
+def list_item(row) -> dict:
+    """列表模式的记录（content 为预览）"""
+    content_length = row.content_length or 0
+    return {
+        "id": row.id,
+        "type": row.type,
+        "content": row.content,
+        "content_length": content_length,
+        "truncated": content_length > Config.LIST_PREVIEW_CHARS,
+        "file_path": row.file_path,
+        "file_size": row.file_size,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "favorited": bool(row.favorited),
+        "image_width": row.image_width,
+        "image_height": row.image_height,
+        "last_seen_at": row.last_seen_at.isoformat() if row.last_seen_at else None,
+        "occurrences": row.occurrences,
+        "thumb_url": thumbnails.thumb_url(row.id)
+            if row.file_path and thumbnails.is_image(row.type, row.content) else None
+    }
+
+@router.get("/history")
+def get_history(
+    page: int = Query(1, ge=1, description="页码"),
+    page_size: int = Query(20, ge=1, le=10000, description="每页数量"),
+    type: Optional[str] = Query(None, description="类型筛选: Text/Image/File/Group"),
+    search: Optional[str] = Query(None, description="搜索关键词"),
+    favorited: Optional[bool] = Query(None, description="仅显示收藏"),
+    start_date: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor，传空字符串表示第一页"),
+    with_total: Optional[bool] = Query(None, description="是否返回总数（游标模式默认不返回）"),
+    sort: str = Query("time", pattern="^(time|recent|rank)$",
+                      description="排序: time 按创建时间 / recent 按最近出现时间 / rank 按搜索相关度"),
+    mode: str = Query("full", pattern="^(full|list)$", description="full 返回完整记录 / list 只返回内容预览"),
+    db: Session = Depends(get_db),
+    username: str = Depends(get_current_user)
+):
+    """
+    获取剪贴板历史记录列表
     
-    # 排序和分页
-    items = query.order_by(desc(ClipboardHistory.created_at))\
-                 .offset((page - 1) * page_size)\
-                 .limit(page_size)\
-                 .all()
+    支持两种分页方式：
+    - 页码分页：page + page_size
+    - 游标分页：cursor + page_size，按 (排序时间, id) 定位，翻到任意深度开销相同
     
-    return {
+    sort=recent 时按最近出现时间排序（重复文本合并后会更新该时间）。
+    
+    搜索词不少于 3 个字符时走全文索引，结果附带高亮摘要 snippet。
+    
+    mode=list 时只查询列表需要的列，content 截断为预览并附带 content_length，
+    完整内容通过 /api/history/{id} 获取。
+    
+    需要认证: 是
+    """
+    cursor_mode = cursor is not None
+    if with_total is None:
+        with_total = not cursor_mode
+    
+    use_fts = bool(search) and fts.can_use_fts(search)
+    if sort == "rank" and not use_fts:
+        sort = "time"
+    if sort == "rank" and cursor_mode:
+        raise HTTPException(status_code=400, detail="Cursor pagination does not support rank sorting")
+    
+    # 构建查询
+    query = filter_history(db.query(ClipboardHistory), type, search, favorited, start_date, end_date)
+    
+    # 计算总数：没有筛选条件（或仅按类型筛选）时直接读取统计表
+    total = None
+    if with_total:
+        if not (search or favorited is not None or start_date or end_date):
+            summary = stats.get_stats(db)
+            total = summary["by_type"].get(type, 0) if type else summary["total_records"]
+        else:
+            total = query.count()
+    
+    # 排序（id 作为同一时间的次序，保证游标位置唯一）
+    sort_column = ClipboardHistory.last_seen_at if sort == "recent" else ClipboardHistory.created_at
+    if sort == "rank":
+        query = query.order_by(fts.rank_of(ClipboardHistory.id, search).nulls_last())
+    query = query.order_by(desc(sort_column), desc(ClipboardHistory.id))
+    
+    if cursor_mode:
+        if cursor:
+            cursor_time, cursor_id = decode_cursor(cursor)
+            query = query.filter(
+                tuple_(sort_column, ClipboardHistory.id) < tuple_(cursor_time, cursor_id)
+            )
+    else:
+        query = query.offset((page - 1) * page_size)
+    
+    if mode == "list":
+        # 只取需要的列，不构造 ORM 对象，也不读取完整的大文本
+        rows = query.with_entities(*list_columns()).limit(page_size).all()
+        items = [list_item(row) for row in rows]
+    else:
+        rows = query.limit(page_size).all()
+        items = [item.to_dict() for item in rows]
+    
+    # 只为当前页生成高亮摘要
+    if use_fts:
+        snippets = fts.get_snippets(db, search, [item.id for item in rows])
+        for data in items:
+            data["snippet"] = snippets.get(data["id"])
+    
+    # 取满一页时才可能还有下一页
+    next_cursor = encode_cursor(rows[-1], sort) if len(rows) == page_size and sort != "rank" else None
+    
+    return ORJSONResponse({
         "total": total,
-        "page": page,
+        "page": None if cursor_mode else page,
         "page_size": page_size,
-        "items": [item.to_dict() for item in items]
-    }
+        "next_cursor": next_cursor,
+        "items": items
+    })
+
+@router.get("/history/changes")
+def get_history_changes(
+    since: Optional[int] = Query(None, ge=0, description="上次同步到的版本，不传表示重新加载"),
+    limit: int = Query(5000, ge=1, le=10000, description="最多返回的记录数"),
+    db: Session = Depends(get_db),
+    username: str = Depends(get_current_user)
+):
+    """
+    增量同步：返回 since 版本之后新增、修改和删除的记录
+    
+    upserts 为新增或修改的记录（与 mode=list 的列表项相同），deleted 为删除的记录 ID。
+    客户端保存返回的 version，下次作为 since 传入；has_more 为 true 时应立即继续请求。
+    
+    reset 为 true 时（未传 since、版本早于变更日志的保留范围或数据库已被替换）无法增量同步：
+    客户端应清空本地缓存，通过 /api/history 重新加载全部记录，再从返回的 version 开始增量同步。
+    
+    需要认证: 是
+    """
+    result = changes.changed_since(db, since, limit)
+    if result is None:
+        return ORJSONResponse({
+            "version": changes.current_version(db),
+            "reset": True,
+            "has_more": False,
+            "upserts": [],
+            "deleted": [],
+        })
+    
+    version, ids, has_more = result
+    rows = {}
+    for i in range(0, len(ids), CHANGES_CHUNK_SIZE):
+        for row in db.query(ClipboardHistory)\
+                     .with_entities(*list_columns())\
+                     .filter(ClipboardHistory.id.in_(ids[i:i + CHANGES_CHUNK_SIZE])):
+            rows[row.id] = list_item(row)
+    
+    # 记录在读取变更之后被删除时同样按删除返回（随后的删除变更会再次返回，客户端重复处理无影响）
+    return ORJSONResponse({
+        "version": version,
+        "reset": False,
+        "has_more": has_more,
+        "upserts": [rows[record_id] for record_id in ids if record_id in rows],
+        "deleted": [record_id for record_id in ids if record_id not in rows],
+    })
 
 @router.get("/history/{id}")
-async def get_history_item(
+def get_history_item(
     id: int,
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
@@ -112,11 +286,12 @@ async def get_history_item(
     if not item:
         raise HTTPException(status_code=404, detail="Record not found")
     
-    return item.to_dict()
+    return ORJSONResponse(item.to_dict())
 
 @router.get("/file/{id}")
-async def get_file(
+def get_file(
     id: int,
+    request: Request,
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
 ):
@@ -136,39 +311,95 @@ async def get_file(
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(
-        path=str(file_path),
-        filename=item.content,
-        media_type="application/octet-stream"
-    )
+    # 压缩保存的文件：客户端接受 gzip 时原样发送，否则解压后发送
+    if compression.is_compressed_path(file_path):
+        return downloads.compressed_file_response(request, file_path, item.file_hash, item.file_size,
+                                                  filename=item.content)
+    
+    # 历史文件内容不变：强 ETag + 长期缓存，支持断点续传
+    return downloads.file_response(request, file_path, item.file_hash, filename=item.content)
 
-@router.get("/stats")
-async def get_stats(
+def _find_item(db: Session, id: int) -> Optional[ClipboardHistory]:
+    return db.query(ClipboardHistory).filter(ClipboardHistory.id == id).first()
+
+def _save_image_size(db: Session, item: ClipboardHistory, file_path):
+    size = thumbnails.image_size(file_path)
+    if size:
+        item.image_width, item.image_height = size
+        db.commit()
+
+@router.get("/thumb/{id}")
+async def get_thumbnail(
+    id: int,
+    request: Request,
+    w: int = Query(Config.THUMB_DEFAULT_WIDTH, ge=1, le=4096, description="缩略图宽度，向上取整到档位"),
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
 ):
     """
-    获取统计信息
+    获取图片记录的缩略图（WebP）
     
     需要认证: 是
     """
-    total_records = db.query(ClipboardHistory).count()
+    item = await run_in_threadpool(_find_item, db, id)
+    if not item or not item.file_path or not thumbnails.is_image(item.type, item.content):
+        raise HTTPException(status_code=404, detail="Image not found")
     
-    # 按类型统计
-    by_type = {}
-    for type_name in ["Text", "Image", "File", "Group"]:
-        count = db.query(ClipboardHistory).filter(ClipboardHistory.type == type_name).count()
-        by_type[type_name] = count
+    file_path = Config.DATA_DIR / item.file_path
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="File not found")
     
-    # 获取最新同步时间
-    latest = db.query(ClipboardHistory).order_by(desc(ClipboardHistory.created_at)).first()
-    latest_sync = latest.created_at.isoformat() if latest else None
+    # 未安装 Pillow，或旧记录没有内容哈希（缩略图缓存按哈希命名，无法区分）时直接返回原图
+    if not thumbnails.available() or not item.file_hash:
+        return downloads.file_response(request, file_path, item.file_hash,
+                                       content_disposition_type="inline")
     
-    return {
-        "total_records": total_records,
-        "by_type": by_type,
-        "latest_sync": latest_sync
-    }
+    # 缓存命中时不必检查或生成缩略图
+    width = thumbnails.bucket_width(w)
+    etag_variant = f"-w{width}"
+    etag = downloads.make_etag(item.file_hash, variant=etag_variant)
+    if item.file_hash and downloads.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": downloads.IMMUTABLE_CACHE})
+    
+    try:
+        thumb = await thumbnails.get_thumbnail(file_path, item.file_hash, width)
+    except Exception as e:
+        print(f"[Thumbnail] 生成缩略图失败 {file_path}: {e}")
+        raise HTTPException(status_code=415, detail="Unsupported image")
+    
+    # 旧记录没有尺寸信息时顺便补上
+    if item.image_width is None:
+        await run_in_threadpool(_save_image_size, db, item, file_path)
+    
+    # 缩略图路径由内容哈希决定，内容不会变化
+    return downloads.file_response(request, thumb, item.file_hash,
+                                   media_type=thumbnails.THUMB_MEDIA_TYPE,
+                                   etag_variant=etag_variant)
+
+@router.get("/stats")
+def get_stats(
+    db: Session = Depends(get_db),
+    username: str = Depends(get_current_user)
+):
+    """
+    获取统计信息
+    
+    需要认证: 是
+    """
+    # 统计信息在写入时增量维护，这里只读取汇总表
+    return stats.get_stats(db)
+
+@router.get("/compression")
+def get_compression(
+    db: Session = Depends(get_db),
+    username: str = Depends(get_current_user)
+):
+    """
+    获取压缩情况（压缩保存的文本和文件数量、原始大小、实际占用和压缩率）
+    
+    需要认证: 是
+    """
+    return compression.report(db)
 
 @router.get("/info")
 async def get_info(username: str = Depends(get_current_user)):
@@ -184,8 +415,32 @@ async def get_info(username: str = Depends(get_current_user)):
         "db_path": str(Config.DB_PATH)
     }
 
+@router.get("/ingest")
+async def get_ingest_status(username: str = Depends(get_current_user)):
+    """
+    获取入库队列状态（队列深度、入库延迟等）
+    
+    需要认证: 是
+    """
+    return ingest_queue.metrics()
+
+@router.get("/maintenance")
+async def get_maintenance_status(username: str = Depends(get_current_user)):
+    """
+    获取后台维护任务状态（上次执行时间、删除记录数、回收空间）
+    
+    需要认证: 是
+    """
+    task = scheduler.tasks.get("maintenance")
+    return {
+        "enabled": task is not None,
+        "interval_minutes": Config.MAINTENANCE_INTERVAL_MINUTES,
+        "last_run": datetime.fromtimestamp(task.last_run).isoformat() if task and task.last_run else None,
+        "report": task.last_result if task else None
+    }
+
 @router.post("/history/{id}/favorite")
-async def toggle_favorite(
+def toggle_favorite(
     id: int,
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
@@ -195,33 +450,26 @@ async def toggle_favorite(
     
     需要认证: 是
     """
-    import json
-    
-    item = db.query(ClipboardHistory).filter(ClipboardHistory.id == id).first()
-    if not item:
+    # 单条 UPDATE 原子切换，并直接返回新状态
+    favorited = db.execute(
+        update(ClipboardHistory)
+        .where(ClipboardHistory.id == id)
+        .values(favorited=~ClipboardHistory.favorited)
+        .returning(ClipboardHistory.favorited)
+    ).scalar()
+    if favorited is None:
         raise HTTPException(status_code=404, detail="Record not found")
-    
-    # 解析 extra_data
-    try:
-        extra_data = json.loads(item.extra_data) if item.extra_data else {}
-    except:
-        extra_data = {}
-    
-    # 切换收藏状态
-    is_favorited = extra_data.get('favorited', False)
-    extra_data['favorited'] = not is_favorited
-    
-    # 保存
-    item.extra_data = json.dumps(extra_data, ensure_ascii=False)
     db.commit()
     
+    event_bus.publish("favorited", {"id": id, "favorited": favorited})
+    
     return {
         "id": id,
-        "favorited": extra_data['favorited']
+        "favorited": favorited
     }
 
 @router.delete("/history/{id}")
-async def delete_history(
+def delete_history(
     id: int,
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
@@ -231,30 +479,14 @@ async def delete_history(
     
     需要认证: 是
     """
-    from config import Config
-    import os
-    
-    item = db.query(ClipboardHistory).filter(ClipboardHistory.id == id).first()
-    if not item:
+    # 关联文件在提交后由后台线程删除（不再被其他记录引用时）
+    if not deletion.delete_ids(db, [id]):
         raise HTTPException(status_code=404, detail="Record not found")
     
-    # 删除关联文件
-    if item.file_path:
-        file_path = Config.DATA_DIR / item.file_path
-        if file_path.exists():
-            try:
-                os.remove(file_path)
-            except:
-                pass
-    
-    # 删除数据库记录
-    db.delete(item)
-    db.commit()
-    
     return {"message": "Record deleted successfully"}
 
 @router.post("/history/batch-delete")
-async def batch_delete_history(
+def batch_delete_history(
     ids: List[int],
     db: Session = Depends(get_db),
     username: str = Depends(get_current_user)
@@ -264,31 +496,55 @@ async def batch_delete_history(
     
     需要认证: 是
     """
-    from config import Config
-    import os
-    
     if not ids:
         raise HTTPException(status_code=400, detail="No IDs provided")
     
-    items = db.query(ClipboardHistory).filter(ClipboardHistory.id.in_(ids)).all()
-    
-    deleted_count = 0
-    for item in items:
-        # 删除关联文件
-        if item.file_path:
-            file_path = Config.DATA_DIR / item.file_path
-            if file_path.exists():
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-        
-        # 删除数据库记录
-        db.delete(item)
-        deleted_count += 1
+    # 分块执行 DELETE ... RETURNING，每块一个短事务
+    deleted_count = len(deletion.delete_ids(db, ids))
     
-    db.commit()
+    return {
+        "message": f"Successfully deleted {deleted_count} records",
+        "deleted_count": deleted_count
+    }
+
+class DeleteFilter(BaseModel):
+    """按条件删除的筛选条件"""
+    type: Optional[str] = None
+    search: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    keep_favorites: bool = True  # 不删除收藏的记录
+    dry_run: bool = False  # 只返回将要删除的数量
+
+@router.post("/history/delete-by-filter")
+def delete_history_by_filter(
+    criteria: DeleteFilter,
+    db: Session = Depends(get_db),
+    username: str = Depends(get_current_user)
+):
+    """
+    按条件删除记录（类型、日期范围、搜索关键词）
+    
+    至少需要一个筛选条件，避免误删全部记录；dry_run 时只返回匹配数量。
+    
+    需要认证: 是
+    """
+    if not (criteria.type or criteria.search or criteria.start_date or criteria.end_date):
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    
+    query = filter_history(
+        db.query(ClipboardHistory),
+        type=criteria.type,
+        search=criteria.search,
+        favorited=False if criteria.keep_favorites else None,
+        start_date=criteria.start_date,
+        end_date=criteria.end_date
+    )
+    
+    if criteria.dry_run:
+        return {"matched_count": query.count(), "deleted_count": 0}
     
+    deleted_count = len(deletion.delete_matching(db, query))
     return {
         "message": f"Successfully deleted {deleted_count} records",
         "deleted_count": deleted_count
@@ -0,0 +1,59 @@
+"""运行指标路由（Prometheus 文本格式）"""
+from fastapi import APIRouter, Depends
+from fastapi.responses import Response
+from models import SessionLocal
+from auth import get_current_user, session_store
+from ingest import ingest_queue
+from metrics import registry, gauge, counter
+import stats
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _collect_history():
+    """历史记录数和占用字节数（读取统计汇总表）"""
+    db = SessionLocal()
+    try:
+        data = stats.get_stats(db)
+    finally:
+        db.close()
+    return [
+        gauge("clipserver_history_records", "历史记录数（按类型）",
+              [({"type": t}, count) for t, count in data["by_type"].items()]),
+        gauge("clipserver_history_bytes", "历史记录占用字节数（按类型）",
+              [({"type": t}, size) for t, size in data["bytes_by_type"].items()]),
+    ]
+
+
+def _collect_sessions():
+    return [gauge("clipserver_sessions", "当前会话数（含未清理的过期会话）", [({}, session_store.count())])]
+
+
+def _collect_ingest():
+    data = ingest_queue.metrics()
+    return [
+        gauge("clipserver_ingest_queue_depth", "入库队列中等待处理的更新数", [({}, data["queue_depth"])]),
+        counter("clipserver_ingest_updates_total",
+                "剪贴板更新数（received / ingested / coalesced / deduplicated / failed）",
+                [({"result": key}, data[key])
+                 for key in ("received", "ingested", "coalesced", "deduplicated", "failed")]),
+        gauge("clipserver_ingest_lag_max_seconds", "提交到入库完成的最大延迟",
+              [({}, data["max_lag_ms"] / 1000)]),
+    ]
+
+
+registry.add_collector(_collect_history)
+registry.add_collector(_collect_sessions)
+registry.add_collector(_collect_ingest)
+
+
+@router.get("/metrics")
+def get_metrics(username: str = Depends(get_current_user)):
+    """
+    运行指标（Prometheus 文本格式，当前工作进程的数据）
+
+    需要认证: 是
+    """
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,110 @@
+"""历史记录导出/导入路由（NDJSON 记录 + tar 文件流）"""
+import io
+import tarfile
+from datetime import datetime
+from typing import Optional
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from auth import get_current_user
+from profiling import ProfiledRoute
+import blobstore
+import transfer
+
+router = APIRouter(prefix="/api", tags=["transfer"], route_class=ProfiledRoute)
+
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format")
+
+
+def _attachment(suffix: str) -> dict:
+    filename = f"clipboard-history-{datetime.now():%Y%m%d-%H%M%S}.{suffix}"
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+class RequestReader(io.RawIOBase):
+    """把异步的请求体转为同步文件对象（只能在 anyio 工作线程中读取）"""
+
+    def __init__(self, request: Request):
+        self._stream = request.stream()
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    async def _next_chunk(self) -> bytes:
+        return await self._stream.__anext__()
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = anyio.from_thread.run(self._next_chunk)
+            except StopAsyncIteration:
+                return 0
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+@router.get("/export/history.ndjson")
+def export_history(
+    type: Optional[str] = Query(None, description="类型筛选: Text/Image/File/Group"),
+    start_date: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
+    username: str = Depends(get_current_user)
+):
+    """
+    导出历史记录（NDJSON，每行一条记录，边查询边输出）
+    
+    需要认证: 是
+    """
+    rows = transfer.export_rows(type, _parse_date(start_date, "start_date"), _parse_date(end_date, "end_date"))
+    return StreamingResponse(rows, media_type="application/x-ndjson", headers=_attachment("ndjson"))
+
+
+@router.get("/export/files.tar")
+def export_files(
+    type: Optional[str] = Query(None, description="类型筛选: Text/Image/File/Group"),
+    start_date: Optional[str] = Query(None, description="开始日期 (ISO格式)"),
+    end_date: Optional[str] = Query(None, description="结束日期 (ISO格式)"),
+    username: str = Depends(get_current_user)
+):
+    """
+    导出记录引用的文件（tar 流，筛选条件与记录导出一致）
+    
+    需要认证: 是
+    """
+    files = transfer.export_files(type, _parse_date(start_date, "start_date"), _parse_date(end_date, "end_date"))
+    return StreamingResponse(files, media_type="application/x-tar", headers=_attachment("tar"))
+
+
+@router.post("/import/files")
+async def import_files(request: Request, username: str = Depends(get_current_user)):
+    """
+    导入文件（请求体为 /api/export/files.tar 导出的 tar 流），应在导入记录之前执行
+    
+    需要认证: 是
+    """
+    reader = io.BufferedReader(RequestReader(request), buffer_size=blobstore.CHUNK_SIZE)
+    try:
+        return await anyio.to_thread.run_sync(transfer.import_files, reader)
+    except tarfile.TarError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tar archive: {e}")
+
+
+@router.post("/import/history")
+async def import_history(request: Request, username: str = Depends(get_current_user)):
+    """
+    导入历史记录（请求体为 /api/export/history.ndjson 导出的 NDJSON），重复记录跳过
+    
+    需要认证: 是
+    """
+    reader = io.BufferedReader(RequestReader(request), buffer_size=blobstore.CHUNK_SIZE)
+    return await anyio.to_thread.run_sync(transfer.import_rows, reader)
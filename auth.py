@@ -1,44 +1,302 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from sqlalchemy import delete, func, insert, select
 from config import Config
+from models import UserSession, engine
 
-# 会话存储（简单的内存存储）
-sessions = {}
 SESSION_COOKIE_NAME = "session_id"
 SESSION_EXPIRE_HOURS = 24
 
+class MemorySessionStore:
+    """进程内会话存储（只适用于单进程，重启后会话丢失）"""
+    blocking = False  # 操作是否可能阻塞（异步处理函数中需放到线程池执行）
+
+    def __init__(self):
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, key: str, username: str, expires: datetime):
+        with self._lock:
+            self.sessions[key] = {"username": username, "expires": expires}
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.sessions.get(key)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.sessions.pop(key, None)
+
+    def sweep(self, now: datetime) -> int:
+        with self._lock:
+            expired = [key for key, session in self.sessions.items() if session["expires"] <= now]
+            for key in expired:
+                del self.sessions[key]
+        return len(expired)
+
+    def count(self) -> int:
+        return len(self.sessions)
+
+    def evict_oldest(self, n: int):
+        with self._lock:
+            # dict 按插入顺序迭代，前面的即最早创建的会话
+            for key in list(self.sessions)[:n]:
+                del self.sessions[key]
+
+class SQLiteSessionStore:
+    """保存在数据库 sessions 表中的会话（WAL 模式下各工作进程并发读取）"""
+    blocking = True
+
+    def create(self, key: str, username: str, expires: datetime):
+        with engine.begin() as conn:
+            conn.execute(insert(UserSession).values(token_hash=key, username=username, expires_at=expires))
+
+    def get(self, key: str) -> Optional[dict]:
+        with engine.connect() as conn:
+            row = conn.execute(select(UserSession.username, UserSession.expires_at)
+                               .where(UserSession.token_hash == key)).first()
+        return {"username": row.username, "expires": row.expires_at} if row else None
+
+    def delete(self, key: str):
+        with engine.begin() as conn:
+            conn.execute(delete(UserSession).where(UserSession.token_hash == key))
+
+    def sweep(self, now: datetime) -> int:
+        with engine.begin() as conn:
+            return conn.execute(delete(UserSession).where(UserSession.expires_at <= now)).rowcount
+
+    def count(self) -> int:
+        with engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(UserSession)).scalar()
+
+    def evict_oldest(self, n: int):
+        oldest = select(UserSession.token_hash).order_by(UserSession.created_at).limit(n)
+        with engine.begin() as conn:
+            conn.execute(delete(UserSession).where(UserSession.token_hash.in_(oldest)))
+
+class FileSessionStore:
+    """
+    每个会话一个 JSON 文件（文件名为会话 ID 的哈希），各工作进程共享目录；
+    SESSION_DIR 指向 /dev/shm 时即为共享内存存储
+    """
+    blocking = True
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _files(self):
+        # 以 . 开头的是写入中的临时文件
+        return (entry for entry in os.scandir(self.directory) if not entry.name.startswith("."))
+
+    def create(self, key: str, username: str, expires: datetime):
+        temp_path = self.directory / f".{key}.tmp"
+        temp_path.write_text(json.dumps({"username": username, "expires": expires.isoformat()}))
+        os.replace(temp_path, self.directory / key)
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            data = json.loads((self.directory / key).read_text())
+        except (OSError, ValueError):
+            return None
+        return {"username": data["username"], "expires": datetime.fromisoformat(data["expires"])}
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.directory / key)
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, now: datetime) -> int:
+        removed = 0
+        for entry in self._files():
+            session = self.get(entry.name)
+            if session is None or session["expires"] <= now:
+                self.delete(entry.name)
+                removed += 1
+        return removed
+
+    def count(self) -> int:
+        return sum(1 for _ in self._files())
+
+    def evict_oldest(self, n: int):
+        entries = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:n]:
+            self.delete(entry.name)
+
+def create_session_store(backend: str):
+    """根据配置创建会话存储"""
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "file":
+        return FileSessionStore(Config.SESSION_DIR)
+    if backend != "sqlite":
+        print(f"[Auth] 未知的 SESSION_BACKEND={backend}，使用 sqlite")
+    return SQLiteSessionStore()
+
+session_store = create_session_store(Config.SESSION_BACKEND)
+
+def _session_key(session_id: str) -> str:
+    """存储中使用会话 ID 的哈希，存储内容泄露时无法直接冒用会话"""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+def sweep_sessions() -> int:
+    """删除所有过期会话，返回删除的数量"""
+    removed = session_store.sweep(datetime.utcnow())
+    if removed:
+        print(f"[Auth] 清理 {removed} 个过期会话")
+    return removed
+
 def create_session(username: str) -> str:
-    """创建新会话"""
+    """创建新会话（超过数量上限时先清理过期会话，仍超出则淘汰最早的会话）"""
     session_id = secrets.token_urlsafe(32)
-    sessions[session_id] = {
-        "username": username,
-        "expires": datetime.utcnow() + timedelta(hours=SESSION_EXPIRE_HOURS)
-    }
+    if session_store.count() >= Config.SESSION_MAX:
+        sweep_sessions()
+        excess = session_store.count() - Config.SESSION_MAX + 1
+        if excess > 0:
+            session_store.evict_oldest(excess)
+    session_store.create(_session_key(session_id), username,
+                         datetime.utcnow() + timedelta(hours=SESSION_EXPIRE_HOURS))
     return session_id
 
 def get_session(session_id: str) -> dict:
     """获取会话信息"""
-    if session_id in sessions:
-        session = sessions[session_id]
+    session = session_store.get(_session_key(session_id))
+    if session:
         if datetime.utcnow() < session["expires"]:
             return session
         else:
             # 会话过期，删除
-            del sessions[session_id]
+            delete_session(session_id)
     return None
 
 def delete_session(session_id: str):
     """删除会话"""
-    if session_id in sessions:
-        del sessions[session_id]
+    session_store.delete(_session_key(session_id))
+
+# 密码哈希：pbkdf2_sha256$<迭代次数>$<盐>$<哈希>（盐和哈希为 base64）
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"
+
+def hash_password(password: str, iterations: int = None, salt: bytes = None) -> str:
+    """计算密码哈希"""
+    iterations = iterations or Config.AUTH_HASH_ITERATIONS
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join([
+        PASSWORD_HASH_ALGORITHM, str(iterations),
+        base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii"),
+    ])
+
+def check_password(password: str, encoded: str) -> bool:
+    """校验密码与哈希是否匹配（计算代价由迭代次数决定）"""
+    try:
+        algorithm, iterations, salt, expected = encoded.split("$")
+        if algorithm != PASSWORD_HASH_ALGORITHM:
+            return False
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"),
+                                     base64.b64decode(salt), int(iterations))
+        return hmac.compare_digest(digest, base64.b64decode(expected))
+    except (ValueError, binascii.Error):
+        return False
+
+_password_hash = None
+
+def _stored_password_hash() -> str:
+    """配置的密码哈希；只配置了明文密码时在首次使用时计算"""
+    global _password_hash
+    if _password_hash is None:
+        _password_hash = Config.PASSWORD_HASH or hash_password(Config.PASSWORD)
+    return _password_hash
+
+class CredentialCache:
+    """
+    验证通过的凭据缓存（LRU + TTL）
+
+    只保存用户名和密码的 HMAC 摘要（密钥为进程内随机值），不保存明文；
+    命中时跳过 PBKDF2，每个请求的认证开销保持恒定。验证失败的凭据不缓存。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._key = secrets.token_bytes(32)
+        self._entries = OrderedDict()  # 摘要 -> 过期时间（time.monotonic()）
+        self._lock = threading.Lock()
+
+    def digest(self, username: str, password: str) -> bytes:
+        message = username.encode("utf-8") + b"\0" + password.encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def contains(self, digest: bytes) -> bool:
+        with self._lock:
+            expires = self._entries.get(digest)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._entries[digest]
+                return False
+            self._entries.move_to_end(digest)
+            return True
+
+    def add(self, digest: bytes):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = time.monotonic() + self.ttl
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+credential_cache = CredentialCache(Config.AUTH_CACHE_SIZE, Config.AUTH_CACHE_TTL)
 
 def verify_credentials(username: str, password: str) -> bool:
-    """验证用户名和密码"""
-    correct_username = secrets.compare_digest(username, Config.USERNAME)
-    correct_password = secrets.compare_digest(password, Config.PASSWORD)
-    return correct_username and correct_password
+    """验证用户名和密码（API、登录和 WebDAV 共用）"""
+    digest = credential_cache.digest(username, password)
+    if credential_cache.contains(digest):
+        return True
+    correct_username = secrets.compare_digest(username.encode("utf-8"), Config.USERNAME.encode("utf-8"))
+    # 用户名错误时同样计算哈希，避免通过响应时间判断用户名是否存在
+    correct_password = check_password(password, _stored_password_hash())
+    if correct_username and correct_password:
+        credential_cache.add(digest)
+        return True
+    return False
+
+async def verify_credentials_async(username: str, password: str) -> bool:
+    """在异步处理函数中验证：缓存命中直接返回，否则在线程池中计算哈希，避免阻塞事件循环"""
+    if credential_cache.contains(credential_cache.digest(username, password)):
+        return True
+    return await run_in_threadpool(verify_credentials, username, password)
+
+def parse_basic_auth(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析 Basic 认证头，返回 (用户名, 密码)，格式错误时返回 None"""
+    if not header:
+        return None
+    scheme, _, credentials = header.partition(" ")
+    if scheme.lower() != "basic":
+        return None
+    try:
+        username, sep, password = base64.b64decode(credentials.strip()).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return (username, password) if sep else None
 
 # HTTP Basic Auth（用于 WebDAV）
 security = HTTPBasic()
@@ -58,22 +316,18 @@ async def get_current_user(request: Request) -> str:
     # 首先检查会话
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
     if session_id:
-        session = get_session(session_id)
+        if session_store.blocking:
+            session = await run_in_threadpool(get_session, session_id)
+        else:
+            session = get_session(session_id)
         if session:
             return session["username"]
-    
+
     # 检查 Authorization 头（Basic Auth）
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Basic "):
-        import base64
-        try:
-            credentials = base64.b64decode(auth_header[6:]).decode("utf-8")
-            username, password = credentials.split(":", 1)
-            if verify_credentials(username, password):
-                return username
-        except:
-            pass
-    
+    credentials = parse_basic_auth(request.headers.get("Authorization"))
+    if credentials and await verify_credentials_async(*credentials):
+        return credentials[0]
+
     # 未认证
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,106 @@
+"""
+基准测试公共工具
+
+所有基准测试都使用独立的临时数据目录，必须在导入应用模块之前调用 setup_data_dir()。
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORDS = [
+    "clipboard", "sync", "hello", "world", "server", "python", "docker", "config",
+    "error", "request", "response", "token", "image", "database", "query", "index",
+    "剪贴板", "同步", "历史", "记录", "服务器", "配置", "错误", "图片", "文件", "搜索",
+]
+
+
+def setup_data_dir(path=None) -> Path:
+    """设置基准测试使用的数据目录，并把项目根目录加入 sys.path"""
+    data_dir = Path(path) if path else Path(tempfile.mkdtemp(prefix="clipbench_"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["DATA_DIR"] = str(data_dir)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    return data_dir
+
+
+def random_text(rng: random.Random, min_words: int = 3, max_words: int = 40) -> str:
+    """随机生成一段中英文混合文本"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def generate_history(rows: int, start_id: int = 0, seed: int = 42, batch: int = 10000):
+    """
+    批量插入合成历史记录（约 85% 文本，其余为图片/文件），完成后重建统计表
+
+    记录走正常的 INSERT，全文索引等触发器同样生效。
+    """
+    from models import SessionLocal, engine
+    from stats import rebuild_stats
+
+    rng = random.Random(seed + start_id)
+    base_time = datetime(2024, 1, 1)
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for offset in range(0, rows, batch):
+            values = []
+            for i in range(start_id + offset, start_id + min(offset + batch, rows)):
+                created_at = (base_time + timedelta(seconds=i * 7)).strftime("%Y-%m-%d %H:%M:%S.%f")
+                roll = rng.random()
+                if roll < 0.85:
+                    values.append(("Text", random_text(rng), None, None, None, created_at, created_at))
+                else:
+                    clip_type = "Image" if roll < 0.95 else "File"
+                    name = f"bench_{i}.png" if clip_type == "Image" else f"bench_{i}.log"
+                    values.append((clip_type, name, f"history/{name}", f"{i:064x}", rng.randint(1000, 5000000),
+                                   created_at, created_at))
+            cursor.executemany(
+                "INSERT INTO clipboard_history (type, content, file_path, file_hash, file_size, created_at, last_seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                values
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+    db = SessionLocal()
+    try:
+        rebuild_stats(db)
+    finally:
+        db.close()
+
+
+def measure(fn, repeat: int = 5) -> list:
+    """多次执行 fn，返回每次耗时（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values, p: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(timings) -> dict:
+    """汇总耗时分布"""
+    return {
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "max_ms": round(max(timings), 3) if timings else 0.0,
+        "samples": len(timings),
+    }
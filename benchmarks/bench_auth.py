@@ -0,0 +1,66 @@
+"""
+认证开销基准测试
+
+对比每次认证的耗时：
+- 未命中缓存：完整计算 PBKDF2（首次认证、错误密码）
+- 命中缓存：只计算一次 HMAC 摘要
+并发线程持续认证时，命中缓存的耗时应与单线程基本一致。
+
+用法:
+    python benchmarks/bench_auth.py --threads 8 --requests 20000
+"""
+import argparse
+import json
+import threading
+import time
+from _common import setup_data_dir, measure, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="认证开销基准测试")
+    parser.add_argument("--threads", type=int, default=8, help="并发认证线程数")
+    parser.add_argument("--requests", type=int, default=20000, help="每个线程的认证次数")
+    args = parser.parse_args()
+
+    setup_data_dir()
+    import auth
+    from config import Config
+
+    auth.credential_cache.clear()
+    uncached = measure(lambda: (auth.credential_cache.clear(),
+                                auth.verify_credentials(Config.USERNAME, Config.PASSWORD)), repeat=10)
+    wrong_password = measure(lambda: auth.verify_credentials(Config.USERNAME, "wrong"), repeat=10)
+    cached = measure(lambda: auth.verify_credentials(Config.USERNAME, Config.PASSWORD), repeat=1000)
+
+    timings = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            auth.verify_credentials(Config.USERNAME, Config.PASSWORD)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            timings.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "iterations": Config.AUTH_HASH_ITERATIONS,
+        "uncached": summarize(uncached),
+        "wrong_password": summarize(wrong_password),
+        "cached": summarize(cached),
+        "cached_concurrent": summarize(timings),
+        "cached_concurrent_per_sec": round(len(timings) / elapsed),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
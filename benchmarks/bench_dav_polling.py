@@ -0,0 +1,125 @@
+"""
+WebDAV 轮询基准测试：GET /dav/SyncClipboard.json 每秒请求数
+
+启动真实的 uvicorn 进程，先写入一次剪贴板（文本或图片），
+再由多个客户端进程持续轮询 SyncClipboard.json（以及其引用的文件），统计吞吐和延迟。
+--conditional 时客户端携带 If-None-Match，模拟内容未变化时的轮询（304）；
+--no-fastpath 关闭 ASGI 快速通道，所有请求经过 a2wsgi + WsgiDAV，用于对比。
+
+用法:
+    python benchmarks/bench_dav_polling.py --clients 8 --duration 10
+    python benchmarks/bench_dav_polling.py --conditional --with-file
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from _common import ROOT, setup_data_dir, summarize
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def poll(base_url, duration, conditional, with_file, result_queue):
+    """客户端进程：持续轮询，返回每次轮询的耗时（毫秒）"""
+    timings = []
+    statuses = {}
+    etags = {}
+    with httpx.Client(base_url=base_url, auth=(USERNAME, PASSWORD), timeout=30) as client:
+        paths = ["/dav/SyncClipboard.json"] + (["/dav/file/bench.png"] if with_file else [])
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            for path in paths:
+                headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+                r = client.get(path, headers=headers)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                if "etag" in r.headers:
+                    etags[path] = r.headers["etag"]
+            timings.append((time.perf_counter() - start) * 1000)
+    result_queue.put((timings, statuses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SyncClipboard.json 轮询吞吐基准测试")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端进程数")
+    parser.add_argument("--duration", type=float, default=10, help="测试秒数")
+    parser.add_argument("--conditional", action="store_true", help="携带 If-None-Match")
+    parser.add_argument("--with-file", action="store_true", help="同时轮询剪贴板引用的 256KB 图片")
+    parser.add_argument("--no-fastpath", action="store_true", help="关闭 ASGI 快速通道")
+    args = parser.parse_args()
+
+    data_dir = setup_data_dir()
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATA_DIR=str(data_dir), CLIP_USERNAME=USERNAME, CLIP_PASSWORD=PASSWORD,
+               DAV_FASTPATH_ENABLED="false" if args.no_fastpath else "true")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(f"{base_url}/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("服务启动失败")
+
+        with httpx.Client(base_url=base_url, auth=(USERNAME, PASSWORD)) as client:
+            if args.with_file:
+                client.put("/dav/file/bench.png", content=os.urandom(256 * 1024)).raise_for_status()
+                clip = {"Type": "Image", "Clipboard": "", "File": "bench.png"}
+            else:
+                clip = {"Type": "Text", "Clipboard": "benchmark " * 20, "File": ""}
+            client.put("/dav/SyncClipboard.json", content=json.dumps(clip).encode()).raise_for_status()
+
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue()
+        clients = [
+            context.Process(target=poll, args=(base_url, args.duration, args.conditional,
+                                               args.with_file, result_queue))
+            for _ in range(args.clients)
+        ]
+        for process in clients:
+            process.start()
+        timings = []
+        statuses = {}
+        for _ in clients:
+            client_timings, client_statuses = result_queue.get()
+            timings.extend(client_timings)
+            for status, count in client_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    print(json.dumps({
+        "clients": args.clients,
+        "conditional": args.conditional,
+        "with_file": args.with_file,
+        "fastpath": not args.no_fastpath,
+        "polls_per_sec": round(len(timings) / args.duration, 1),
+        "latency": summarize(timings),
+        "statuses": statuses,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+WebDAV 上传基准测试：并发 PUT 图片 + SyncClipboard.json 的吞吐
+
+启动真实的 uvicorn 进程，多个客户端进程按 SyncClipboard 客户端的方式同步图片：
+先 PUT /dav/file/<名称>，再 PUT /dav/SyncClipboard.json，统计每次同步的耗时和总吞吐。
+--no-fastpath 关闭 ASGI 快速通道，所有请求经过 a2wsgi + WsgiDAV，用于对比。
+
+用法:
+    python benchmarks/bench_dav_upload.py --clients 4 --size-mb 4 --duration 10
+    python benchmarks/bench_dav_upload.py --no-fastpath
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from _common import ROOT, setup_data_dir, summarize
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def upload(base_url, client_id, size, duration, result_queue):
+    """客户端进程：持续同步图片，返回每次同步的耗时（毫秒）"""
+    timings = []
+    data = os.urandom(size)
+    with httpx.Client(base_url=base_url, auth=(USERNAME, PASSWORD), timeout=120) as client:
+        deadline = time.perf_counter() + duration
+        n = 0
+        while time.perf_counter() < deadline:
+            name = f"bench_{client_id}_{n % 4}.png"
+            clip = {"Type": "Image", "Clipboard": f"{client_id}-{n}", "File": name}
+            start = time.perf_counter()
+            client.put(f"/dav/file/{name}", content=data).raise_for_status()
+            client.put("/dav/SyncClipboard.json", content=json.dumps(clip).encode()).raise_for_status()
+            timings.append((time.perf_counter() - start) * 1000)
+            n += 1
+    result_queue.put(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebDAV 并发上传基准测试")
+    parser.add_argument("--clients", type=int, default=4, help="并发客户端进程数")
+    parser.add_argument("--size-mb", type=float, default=4, help="每张图片的大小（MB）")
+    parser.add_argument("--duration", type=float, default=10, help="测试秒数")
+    parser.add_argument("--no-fastpath", action="store_true", help="关闭 ASGI 快速通道")
+    args = parser.parse_args()
+
+    data_dir = setup_data_dir()
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATA_DIR=str(data_dir), CLIP_USERNAME=USERNAME, CLIP_PASSWORD=PASSWORD,
+               DAV_FASTPATH_ENABLED="false" if args.no_fastpath else "true")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    size = int(args.size_mb * 1024 * 1024)
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(f"{base_url}/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("服务启动失败")
+
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue()
+        clients = [
+            context.Process(target=upload, args=(base_url, i, size, args.duration, result_queue))
+            for i in range(args.clients)
+        ]
+        for process in clients:
+            process.start()
+        timings = []
+        for _ in clients:
+            timings.extend(result_queue.get())
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    print(json.dumps({
+        "clients": args.clients,
+        "size_mb": args.size_mb,
+        "fastpath": not args.no_fastpath,
+        "syncs_per_sec": round(len(timings) / args.duration, 2),
+        "mb_per_sec": round(len(timings) * size / 1048576 / args.duration, 1),
+        "latency": summarize(timings),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
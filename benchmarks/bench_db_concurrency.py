@@ -0,0 +1,169 @@
+"""
+数据库并发基准测试：写入线程持续入库时的读延迟
+
+对每组数据库配置启动独立子进程（配置在导入时读取），流程：
+1. 生成合成历史数据
+2. 主进程按固定速率写入记录（与入库队列相同：插入 + 更新统计 + 提交）
+3. 多个读进程循环执行历史列表第一页、类型筛选和统计查询
+输出每组配置的读延迟分布、写入延迟和 "database is locked" 错误数。
+
+用法:
+    python benchmarks/bench_db_concurrency.py --rows 200000 --duration 10 --readers 4 --write-rate 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# 旧默认配置（rollback journal）与当前默认配置（WAL）
+PROFILES = {
+    "rollback": {
+        "DB_JOURNAL_MODE": "DELETE",
+        "DB_SYNCHRONOUS": "FULL",
+        "DB_CACHE_SIZE_KB": "2000",
+        "DB_MMAP_SIZE_MB": "0",
+    },
+    "wal": {
+        "DB_JOURNAL_MODE": "WAL",
+        "DB_SYNCHRONOUS": "NORMAL",
+        "DB_CACHE_SIZE_KB": "20000",
+        "DB_MMAP_SIZE_MB": "256",
+    },
+}
+
+
+def _reader(duration, result_queue):
+    """读进程：循环执行历史列表第一页、按类型筛选和统计查询"""
+    from sqlalchemy import desc
+    from sqlalchemy.exc import OperationalError
+    from models import ClipboardHistory, SessionLocal, engine
+    import stats
+
+    # fork 继承的连接不能在子进程中使用
+    engine.dispose(close=False)
+    timings = []
+    failed = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.query(ClipboardHistory)\
+              .order_by(desc(ClipboardHistory.created_at), desc(ClipboardHistory.id))\
+              .limit(20).all()
+            db.query(ClipboardHistory)\
+              .filter(ClipboardHistory.type == "Image")\
+              .order_by(desc(ClipboardHistory.created_at), desc(ClipboardHistory.id))\
+              .limit(20).all()
+            stats.get_stats(db)
+            timings.append((time.perf_counter() - start) * 1000)
+        except OperationalError:
+            failed += 1
+        finally:
+            db.close()
+    result_queue.put((timings, failed))
+
+
+def run_profile(rows, duration, readers, write_rate, batch):
+    """
+    在当前进程中执行一组测试（由子进程调用）
+
+    读操作放在独立进程中，避免与写入线程争用 GIL，测得的是数据库锁本身的影响。
+    """
+    import multiprocessing
+    from _common import generate_history, setup_data_dir, summarize
+    setup_data_dir()
+    from datetime import datetime
+    from sqlalchemy.exc import OperationalError
+    from models import ClipboardHistory, SessionLocal, engine, init_db
+    import stats
+
+    init_db()
+    generate_history(rows)
+    engine.dispose()
+
+    context = multiprocessing.get_context("fork")
+    result_queue = context.Queue()
+    processes = [context.Process(target=_reader, args=(duration, result_queue)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+
+    write_timings = []
+    write_errors = 0
+    interval = 1 / write_rate
+    deadline = time.perf_counter() + duration
+    next_at = time.perf_counter()
+    n = 0
+    while time.perf_counter() < deadline:
+        records = [
+            ClipboardHistory(type="Text", content=f"bench write {n} {i} " * 8, created_at=datetime.now())
+            for i in range(batch)
+        ]
+        n += 1
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.add_all(records)
+            stats.on_insert(db, records)
+            db.commit()
+            write_timings.append((time.perf_counter() - start) * 1000)
+        except OperationalError:
+            db.rollback()
+            write_errors += 1
+        finally:
+            db.close()
+        next_at += interval
+        time.sleep(max(0.0, next_at - time.perf_counter()))
+
+    read_timings = []
+    read_errors = 0
+    for _ in processes:
+        timings, failed = result_queue.get()
+        read_timings.extend(timings)
+        read_errors += failed
+    for process in processes:
+        process.join()
+
+    return {
+        "reads": summarize(read_timings),
+        "reads_per_sec": round(len(read_timings) / duration, 1),
+        "writes": summarize(write_timings),
+        "rows_written": len(write_timings) * batch,
+        "errors": {"read": read_errors, "write": write_errors},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="写入期间的并发读延迟基准测试")
+    parser.add_argument("--rows", type=int, default=200000, help="预先生成的记录数")
+    parser.add_argument("--duration", type=float, default=10, help="每组配置的测试秒数")
+    parser.add_argument("--readers", type=int, default=4, help="读进程数")
+    parser.add_argument("--write-rate", type=float, default=50, help="每秒写事务数")
+    parser.add_argument("--batch", type=int, default=1, help="每个写事务插入的记录数")
+    parser.add_argument("--profile", choices=sorted(PROFILES), nargs="+", default=sorted(PROFILES))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_profile(args.rows, args.duration, args.readers, args.write_rate, args.batch)
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for name in args.profile:
+        env = dict(os.environ, **PROFILES[name])
+        cmd = [sys.executable, __file__, "--worker",
+               "--rows", str(args.rows), "--duration", str(args.duration),
+               "--readers", str(args.readers), "--write-rate", str(args.write_rate),
+               "--batch", str(args.batch)]
+        output = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+        # 应用模块会打印日志，结果在最后一行
+        results[name] = {"config": PROFILES[name], **json.loads(output.strip().splitlines()[-1])}
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+事件循环阻塞基准测试：慢搜索执行期间 /health 的响应延迟
+
+启动真实的 uvicorn 进程（关闭 FTS，搜索走 LIKE 全表扫描），流程：
+1. 空闲时以固定间隔请求 /health，得到基线延迟
+2. 多个客户端持续请求 /api/history?search=，同时继续探测 /health
+处理函数阻塞事件循环时，第二阶段 /health 的 p99 会接近单次搜索耗时；
+数据库查询在线程池中执行时，两阶段的 /health 延迟应基本一致。
+
+用法:
+    python benchmarks/bench_event_loop.py --rows 500000 --duration 10 --searchers 4
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import httpx
+from _common import ROOT, generate_history, setup_data_dir, summarize
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def probe_health(base_url, duration, interval):
+    """按固定间隔请求 /health，返回每次耗时（毫秒）"""
+    timings = []
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get("/health").raise_for_status()
+            timings.append((time.perf_counter() - start) * 1000)
+            time.sleep(interval)
+    return timings
+
+
+def run_searches(base_url, stop, queries, timings):
+    """循环执行搜索请求直到 stop 被设置"""
+    token = base64.b64encode(f"{USERNAME}:{PASSWORD}".encode()).decode()
+    headers = {"Authorization": f"Basic {token}"}
+    with httpx.Client(base_url=base_url, timeout=120, headers=headers) as client:
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/api/history", params={"search": queries[i % len(queries)]}).raise_for_status()
+            timings.append((time.perf_counter() - start) * 1000)
+            i += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="慢搜索期间 /health 延迟基准测试")
+    parser.add_argument("--rows", type=int, default=500000, help="预先生成的记录数")
+    parser.add_argument("--duration", type=float, default=10, help="每个阶段的秒数")
+    parser.add_argument("--searchers", type=int, default=4, help="并发搜索客户端数")
+    parser.add_argument("--interval", type=float, default=0.02, help="/health 探测间隔（秒）")
+    args = parser.parse_args()
+
+    data_dir = setup_data_dir()
+    os.environ["SEARCH_FTS"] = "false"
+    from models import init_db
+    init_db()
+    generate_history(args.rows)
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATA_DIR=str(data_dir), SEARCH_FTS="false",
+               CLIP_USERNAME=USERNAME, CLIP_PASSWORD=PASSWORD)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(f"{base_url}/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("服务启动失败")
+
+        idle = probe_health(base_url, args.duration, args.interval)
+
+        stop = threading.Event()
+        search_timings = []
+        queries = ["nonexistent-term", "database index", "同步 历史"]
+        searchers = [
+            threading.Thread(target=run_searches, args=(base_url, stop, queries, search_timings))
+            for _ in range(args.searchers)
+        ]
+        for thread in searchers:
+            thread.start()
+        time.sleep(0.5)
+        loaded = probe_health(base_url, args.duration, args.interval)
+        stop.set()
+        for thread in searchers:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "searchers": args.searchers,
+        "health_idle": summarize(idle),
+        "health_during_search": summarize(loaded),
+        "search": summarize(search_timings),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+混合负载基准测试：模拟 SyncClipboard 客户端和浏览器
+
+在进程内运行应用（httpx.ASGITransport，不经过网络），对每个数据规模：
+1. 生成合成历史记录（在上一个规模的基础上补足到目标行数）
+2. 并发运行 --sync-clients 个 SyncClipboard 客户端：轮询 GET /dav/SyncClipboard.json
+   （携带 If-None-Match），每 --upload-every 次轮询上传一次剪贴板
+   （文本直接 PUT SyncClipboard.json；文件先 PUT /dav/file/ 再 PUT SyncClipboard.json）
+3. 同时运行 --browsers 个浏览器客户端（登录后使用会话），按权重随机请求历史列表
+   （首页、OFFSET 深分页、游标翻页）、/api/stats、搜索和 /api/file
+按端点输出请求数、吞吐（请求/秒）、p50/p99 延迟和错误数（JSON）。
+
+--output 保存结果；--baseline 与之前保存的结果对比，同一规模同一端点的 p99 变慢或吞吐下降
+超过 --threshold 时列出并以非零状态退出。客户端与应用共用一个事件循环，
+绝对数值包含客户端开销，适合在同一台机器上做前后对比。
+
+用法:
+    python benchmarks/bench_load.py --rows 10000,100000 --duration 10
+    python benchmarks/bench_load.py --rows 10000,100000,1000000 --output before.json
+    python benchmarks/bench_load.py --rows 10000,100000,1000000 --baseline before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+import httpx
+from PIL import Image
+from _common import generate_history, random_text, setup_data_dir, summarize
+
+USERNAME = "bench"
+PASSWORD = "bench"
+PAGE_SIZE = 50
+SEARCH_TERMS = ["database", "sync server", "剪贴板", "同步 历史", "nonexistent-term"]
+
+# 浏览器请求的权重
+BROWSER_MIX = {
+    "history_first_page": 30,
+    "history_offset_page": 10,
+    "history_cursor": 20,
+    "stats": 10,
+    "search": 15,
+    "file": 15,
+}
+
+
+class Recorder:
+    """按端点记录耗时和错误"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client, label, method, url, ok=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.timings[label].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in ok:
+            self.errors[label] += 1
+            return None
+        return response
+
+    def report(self, duration: float) -> dict:
+        labels = sorted(set(self.timings) | set(self.errors))
+        return {
+            label: {
+                "requests": len(self.timings[label]),
+                "per_sec": round(len(self.timings[label]) / duration, 1),
+                **summarize(self.timings[label]),
+                "errors": self.errors[label],
+            }
+            for label in labels
+        }
+
+
+def random_png(rng: random.Random, size_kb: int) -> bytes:
+    """随机噪点 PNG（几乎不可压缩，文件大小约为 size_kb），入库时会正常生成缩略图"""
+    side = max(1, int((size_kb * 1024 / 3) ** 0.5))
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _client(app, **kwargs):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120, **kwargs)
+
+
+async def upload(client, recorder, rng, name=None, file_kb=64):
+    """按 SyncClipboard 协议上传一次剪贴板：有文件名时先上传文件"""
+    if name:
+        data = random_png(rng, file_kb)
+        await recorder.request(client, "dav_put_file", "PUT", f"/dav/file/{name}", ok=(201, 204), content=data)
+        clip = {"Type": "Image", "Clipboard": hashlib.sha256(data).hexdigest().upper(), "File": name}
+    else:
+        clip = {"Type": "Text", "Clipboard": random_text(rng), "File": ""}
+    await recorder.request(client, "dav_put_json", "PUT", "/dav/SyncClipboard.json", ok=(201, 204),
+                           content=json.dumps(clip).encode("utf-8"))
+
+
+async def sync_client(app, recorder, index, deadline, args):
+    """SyncClipboard 客户端：轮询剪贴板，定期上传"""
+    rng = random.Random(index)
+    etag = None
+    n = 0
+    async with _client(app, auth=(USERNAME, PASSWORD)) as client:
+        while time.perf_counter() < deadline:
+            n += 1
+            if n % args.upload_every == 0:
+                name = f"load_{index}_{n}.png" if rng.random() < args.file_ratio else None
+                await upload(client, recorder, rng, name, args.file_kb)
+            else:
+                headers = {"If-None-Match": etag} if etag else {}
+                response = await recorder.request(client, "dav_poll", "GET", "/dav/SyncClipboard.json",
+                                                  ok=(200, 304), headers=headers)
+                if response is not None and "etag" in response.headers:
+                    etag = response.headers["etag"]
+            # 让出事件循环（内存中的请求可能不经过任何 await 就完成）
+            await asyncio.sleep(args.think_ms / 1000)
+
+
+async def browser(app, recorder, index, deadline, args, rows, file_ids):
+    """浏览器客户端：登录后按权重随机访问页面使用的 API"""
+    rng = random.Random(1000 + index)
+    labels = list(BROWSER_MIX)
+    weights = list(BROWSER_MIX.values())
+    cursor = ""
+    async with _client(app) as client:
+        (await client.post("/api/login", json={"username": USERNAME, "password": PASSWORD})).raise_for_status()
+        while time.perf_counter() < deadline:
+            label = rng.choices(labels, weights)[0]
+            if label == "history_first_page":
+                await recorder.request(client, label, "GET", "/api/history",
+                                       params={"page": 1, "page_size": PAGE_SIZE})
+            elif label == "history_offset_page":
+                page = rng.randint(1, max(1, rows // PAGE_SIZE))
+                await recorder.request(client, label, "GET", "/api/history",
+                                       params={"page": page, "page_size": PAGE_SIZE})
+            elif label == "history_cursor":
+                response = await recorder.request(client, label, "GET", "/api/history",
+                                                  params={"cursor": cursor, "page_size": PAGE_SIZE, "mode": "list"})
+                cursor = (response.json()["next_cursor"] or "") if response is not None else ""
+            elif label == "stats":
+                await recorder.request(client, label, "GET", "/api/stats")
+            elif label == "search":
+                await recorder.request(client, label, "GET", "/api/history",
+                                       params={"search": rng.choice(SEARCH_TERMS), "page_size": 20})
+            elif file_ids:
+                await recorder.request(client, label, "GET", f"/api/file/{rng.choice(file_ids)}")
+            await asyncio.sleep(args.think_ms / 1000)
+
+
+async def seed_files(app, count: int, file_kb: int) -> list:
+    """按同步协议上传若干图片并等待入库，返回记录 ID（用于 /api/file）"""
+    from config import Config
+
+    rng = random.Random(0)
+    recorder = Recorder()
+    async with _client(app, auth=(USERNAME, PASSWORD)) as client:
+        for i in range(count):
+            await upload(client, recorder, rng, f"seed_{i}.png", file_kb)
+            # 连续写入会被合并，间隔超过合并窗口
+            await asyncio.sleep(Config.INGEST_COALESCE_MS / 1000 + 0.1)
+        await asyncio.sleep(0.5)
+        response = await client.get("/api/history", params={"type": "Image", "page_size": count})
+        response.raise_for_status()
+        return [item["id"] for item in response.json()["items"]]
+
+
+async def run_scale(app, rows: int, args, file_ids) -> dict:
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(sync_client(app, recorder, i, deadline, args) for i in range(args.sync_clients)),
+        *(browser(app, recorder, i, deadline, args, rows, file_ids) for i in range(args.browsers)),
+    )
+    return {"rows": rows, "endpoints": recorder.report(time.perf_counter() - start)}
+
+
+async def run(args, scales) -> list:
+    import main
+    from models import SessionLocal, ClipboardHistory
+
+    results = []
+    async with main.lifespan(main.app):
+        file_ids = await seed_files(main.app, args.seed_files, args.file_kb)
+        current = 0
+        for rows in scales:
+            if rows > current:
+                print(f"[Bench] 生成记录 {current} -> {rows}", file=sys.stderr)
+                await asyncio.to_thread(generate_history, rows - current, current)
+                current = rows
+            result = await run_scale(main.app, rows, args, file_ids)
+            db = SessionLocal()
+            try:
+                result["total_records"] = db.query(ClipboardHistory).count()
+            finally:
+                db.close()
+            results.append(result)
+            print(f"[Bench] 完成 {rows} 行", file=sys.stderr)
+    return results
+
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """与基线对比，返回变差的端点描述"""
+    regressions = []
+    base_scales = {scale["rows"]: scale["endpoints"] for scale in baseline["scales"]}
+    for scale in results:
+        base_endpoints = base_scales.get(scale["rows"], {})
+        for label, current in scale["endpoints"].items():
+            base = base_endpoints.get(label)
+            if not base or not base["requests"]:
+                continue
+            # p99 低于 1ms 的变化视为噪声
+            if current["p99_ms"] > base["p99_ms"] * (1 + threshold) and current["p99_ms"] - base["p99_ms"] > 1:
+                regressions.append(f"rows={scale['rows']} {label}: p99 {base['p99_ms']} -> {current['p99_ms']} ms")
+            if current["per_sec"] < base["per_sec"] * (1 - threshold):
+                regressions.append(f"rows={scale['rows']} {label}: {base['per_sec']} -> {current['per_sec']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SyncClipboard 客户端与浏览器混合负载基准测试")
+    parser.add_argument("--rows", default="10000,100000", help="数据规模（逗号分隔，如 10000,100000,1000000）")
+    parser.add_argument("--duration", type=float, default=10, help="每个规模的测试秒数")
+    parser.add_argument("--sync-clients", type=int, default=8, help="SyncClipboard 客户端数")
+    parser.add_argument("--browsers", type=int, default=4, help="浏览器客户端数")
+    parser.add_argument("--upload-every", type=int, default=20, help="每个同步客户端每多少次轮询上传一次")
+    parser.add_argument("--file-ratio", type=float, default=0.3, help="上传中带文件的比例")
+    parser.add_argument("--file-kb", type=int, default=64, help="上传文件大小（KB）")
+    parser.add_argument("--seed-files", type=int, default=5, help="预先上传的图片数（供 /api/file 使用）")
+    parser.add_argument("--think-ms", type=float, default=0, help="每个客户端两次请求之间的间隔（毫秒）")
+    parser.add_argument("--output", help="保存结果的 JSON 文件")
+    parser.add_argument("--baseline", help="对比的基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定变差的比例")
+    args = parser.parse_args()
+    scales = sorted(int(value) for value in args.rows.split(","))
+
+    setup_data_dir()
+    os.environ.update(CLIP_USERNAME=USERNAME, CLIP_PASSWORD=PASSWORD)
+    # 应用日志输出到 stderr，stdout 只输出结果
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args, scales))
+
+    report = {
+        "config": {
+            "sync_clients": args.sync_clients,
+            "browsers": args.browsers,
+            "duration": args.duration,
+            "upload_every": args.upload_every,
+            "file_ratio": args.file_ratio,
+            "file_kb": args.file_kb,
+            "think_ms": args.think_ms,
+        },
+        "scales": results,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"[Bench] 变差: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+搜索基准测试：LIKE 全表扫描 vs FTS5 trigram 全文索引
+
+对每个数据规模，分别测量 /api/history?search= 实际执行的两条查询
+（总数 COUNT + 第一页 20 条），输出 JSON。
+
+用法:
+    python benchmarks/bench_search.py --rows 100000 1000000
+"""
+import argparse
+import json
+from _common import generate_history, measure, setup_data_dir, summarize
+
+QUERIES = ["hello", "database index", "剪贴板", "同步 历史", "nonexistent-term"]
+
+LIKE_WHERE = "(content LIKE '%' || :q || '%' OR extra_data LIKE '%' || :q || '%')"
+
+
+def run(rows_list, repeat):
+    setup_data_dir()
+    from sqlalchemy import text
+    from models import engine, init_db
+    import search
+
+    init_db()
+    if not search.fts_available:
+        raise SystemExit("当前 SQLite 不支持 FTS5 trigram，无法对比")
+
+    results = []
+    generated = 0
+    for rows in sorted(rows_list):
+        generate_history(rows - generated, start_id=generated)
+        generated = rows
+
+        with engine.connect() as conn:
+            for q in QUERIES:
+                like_sql = [
+                    text(f"SELECT count(*) FROM clipboard_history WHERE {LIKE_WHERE}"),
+                    text(f"SELECT id FROM clipboard_history WHERE {LIKE_WHERE} "
+                         "ORDER BY created_at DESC, id DESC LIMIT 20"),
+                ]
+                fts_sql = [
+                    text("SELECT count(*) FROM clipboard_history h JOIN clipboard_fts f ON f.rowid = h.id "
+                         "WHERE clipboard_fts MATCH :m"),
+                    text("SELECT h.id FROM clipboard_history h JOIN clipboard_fts f ON f.rowid = h.id "
+                         "WHERE clipboard_fts MATCH :m ORDER BY h.created_at DESC, h.id DESC LIMIT 20"),
+                ]
+                snippet_sql = text(
+                    "SELECT rowid, snippet(clipboard_fts, -1, '[', ']', '…', 32) FROM clipboard_fts "
+                    "WHERE clipboard_fts MATCH :m AND rowid IN (SELECT value FROM json_each(:ids))"
+                )
+                params = {"q": q, "m": search.match_query(q)}
+
+                def run_fts():
+                    conn.execute(fts_sql[0], params).scalar()
+                    ids = [row.id for row in conn.execute(fts_sql[1], params)]
+                    conn.execute(snippet_sql, {"m": params["m"], "ids": json.dumps(ids)}).all()
+
+                like_count = conn.execute(like_sql[0], params).scalar()
+                fts_count = conn.execute(fts_sql[0], params).scalar()
+                like_timings = measure(lambda: [conn.execute(s, params).all() for s in like_sql], repeat)
+                fts_timings = measure(run_fts, repeat)
+
+                results.append({
+                    "rows": rows,
+                    "query": q,
+                    "matches": {"like": like_count, "fts": fts_count},
+                    "like": summarize(like_timings),
+                    "fts": summarize(fts_timings),
+                })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIKE vs FTS5 搜索基准测试")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000], help="数据规模")
+    parser.add_argument("--repeat", type=int, default=5, help="每条查询重复次数")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.rows, args.repeat), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
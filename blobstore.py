@@ -0,0 +1,413 @@
+"""
+内容寻址的历史文件存储
+
+文件按 SHA-256 保存到 history/objects/<前两位>/<哈希>，相同内容只保存一份；
+开启压缩时可压缩的文件以 gzip 格式保存为 <哈希>.gz（见 compression.py）。
+记录的 file_path 指向对象文件，多条记录可以引用同一个对象；
+删除记录时只有当对象不再被任何记录引用才删除文件。
+
+通过 WebDAV 上传的文件在写入时已计算摘要（remember_upload），且上传总是写入临时文件后
+原子替换、不会原地修改，入库时不再读取文件计算哈希，直接以硬链接保存为对象。
+"""
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+from sqlalchemy.orm import Session
+from config import Config
+from locks import FileLock
+import compression
+import thumbnails
+from models import ClipboardHistory, SessionLocal
+
+# Linux FICLONE ioctl（btrfs / xfs 等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+CHUNK_SIZE = 1024 * 1024
+
+# 上传时计算的摘要最多保留的数量（只需覆盖上传到入库之间的短暂时间）
+UPLOAD_DIGEST_LIMIT = 256
+
+# 入库与删除都要在持锁状态下检查/修改对象的引用，避免并发时删除刚被引用的对象
+# （多个工作进程之间同样互斥）
+lock = FileLock(Config.LOCK_DIR / "blobstore.lock")
+
+
+class FileDigest(NamedTuple):
+    """文件摘要"""
+    sha256: str
+    md5: str
+    size: int
+
+
+class StreamHasher:
+    """增量计算 SHA-256、MD5 和大小（上传时边写边算）"""
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+        self._size = 0
+
+    def update(self, chunk: bytes):
+        self._sha256.update(chunk)
+        self._md5.update(chunk)
+        self._size += len(chunk)
+
+    def digest(self) -> FileDigest:
+        return FileDigest(self._sha256.hexdigest(), self._md5.hexdigest(), self._size)
+
+
+def hash_file(path: Path) -> FileDigest:
+    """单次读取同时计算 SHA-256 和 MD5"""
+    hasher = StreamHasher()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.digest()
+
+
+# 上传时计算的摘要，按文件标识（设备、inode、大小、修改时间）索引：
+# 文件被替换或修改后标识随之变化，不会取到过期的摘要
+_uploads = {}
+_uploads_lock = threading.Lock()
+
+
+def _identity(stat_result: os.stat_result) -> tuple:
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+def remember_upload(path, digest: FileDigest):
+    """记录上传完成的文件的摘要（文件已原子替换到 path）"""
+    identity = _identity(os.stat(path))
+    with _uploads_lock:
+        _uploads.pop(identity, None)
+        _uploads[identity] = digest
+        while len(_uploads) > UPLOAD_DIGEST_LIMIT:
+            del _uploads[next(iter(_uploads))]
+
+
+def uploaded_digest(path) -> Optional[FileDigest]:
+    """文件仍是上传时的那个文件时，返回上传时计算的摘要"""
+    try:
+        identity = _identity(os.stat(path))
+    except OSError:
+        return None
+    with _uploads_lock:
+        return _uploads.get(identity)
+
+
+def verify_client_hash(client_hash: str, digest: FileDigest) -> Optional[bool]:
+    """
+    校验客户端在 Clipboard 字段中提供的哈希
+
+    SyncClipboard 不同版本分别使用 SHA-256 / MD5，这里两者都接受。
+    没有提供哈希时返回 None。
+    """
+    if not client_hash:
+        return None
+    client_hash = client_hash.strip().lower()
+    return client_hash in (digest.sha256, digest.md5)
+
+
+def blob_path(sha256: str) -> Path:
+    """对象文件的绝对路径"""
+    return Config.BLOB_DIR / sha256[:2] / sha256
+
+
+def find_blob(sha256: str, compressed: bool = True) -> Optional[Path]:
+    """已存在的对象文件（compressed 为 False 时只查找未压缩的）"""
+    path = blob_path(sha256)
+    if path.exists():
+        return path
+    if compressed:
+        path = path.with_name(path.name + compression.GZIP_SUFFIX)
+        if path.exists():
+            return path
+    return None
+
+
+def relative_path(path: Path) -> str:
+    """相对于 DATA_DIR 的路径（保存到数据库）"""
+    return str(path.relative_to(Config.DATA_DIR))
+
+
+def _clone_file(src: Path, dst: Path):
+    """优先使用 reflink 写时复制，不支持时退回普通复制"""
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+
+def _copy_verified(src: Path, dest: Path, digest: FileDigest):
+    """复制文件并在复制的同时校验内容与 digest 一致（不再单独读取一遍计算哈希）"""
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    hasher = StreamHasher()
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            while True:
+                chunk = fsrc.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                fdst.write(chunk)
+        if hasher.digest().sha256 != digest.sha256:
+            raise OSError(f"文件在复制过程中被修改: {src}")
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _link_or_copy(src: Path, dest: Path, digest: FileDigest):
+    """为不会再被修改的文件创建硬链接，不支持时复制（digest 为调用方已计算的摘要）"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        _copy_verified(src, dest, digest)
+
+
+def _link_upload(src: Path, tmp: Path, digest: FileDigest) -> bool:
+    """
+    以硬链接保存上传的文件（上传总是原子替换，源文件之后不会被原地修改）
+
+    链接后确认链接到的仍是计算 digest 时的那个文件，否则撤销。
+    """
+    if uploaded_digest(src) != digest:
+        return False
+    try:
+        os.link(src, tmp)
+    except OSError:
+        return False
+    if uploaded_digest(tmp) == digest:
+        return True
+    tmp.unlink()
+    return False
+
+
+def _write_object(src: Path, dest: Path, digest: Optional[FileDigest] = None):
+    """写入对象文件（.gz 结尾时压缩，上传的文件以硬链接保存），先写临时文件再改名"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if compression.is_compressed_path(dest):
+            compression.gzip_file(src, tmp)
+        elif digest is None or not _link_upload(src, tmp, digest):
+            _clone_file(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def store_file(src: Path, digest: Optional[FileDigest] = None, compress: bool = False) -> tuple:
+    """
+    把文件保存到对象存储
+
+    通过 WebDAV 上传的文件直接使用上传时计算的摘要，并以硬链接保存（不再读取文件）；
+    其他文件可能被原地修改，计算摘要后复制一份。
+    compress 为 True 时允许压缩保存（是否压缩由 compression.should_compress_file 决定），
+    相同内容已有任一形式的对象时直接复用；为 False 时总是使用未压缩的对象。
+
+    Returns:
+        (相对路径, FileDigest)
+    """
+    if digest is None:
+        digest = uploaded_digest(src) or hash_file(src)
+
+    dest = find_blob(digest.sha256, compressed=compress)
+    if dest is None:
+        dest = blob_path(digest.sha256)
+        if compress and compression.should_compress_file(src, digest.size):
+            dest = dest.with_name(dest.name + compression.GZIP_SUFFIX)
+        _write_object(src, dest, digest)
+
+    return relative_path(dest), digest
+
+
+def ensure_stored(src: Path, rel_path: str, digest: FileDigest):
+    """
+    确认对象文件仍然存在（调用方需持有 lock）
+
+    store_file 与入库提交之间对象可能被并发删除，此时重新保存一份。
+    """
+    dest = Config.DATA_DIR / rel_path
+    if not dest.exists():
+        _write_object(src, dest, digest)
+
+
+def unreferenced_paths(db: Session, rel_paths: Iterable[str]) -> list:
+    """
+    在当前事务中查找已不再被任何记录引用的文件（调用方需持有 lock）
+
+    需要在删除记录并 flush 之后调用，提交后再删除返回的文件。
+    """
+    db.flush()
+    orphaned = []
+    for rel_path in set(p for p in rel_paths if p):
+        still_used = db.query(ClipboardHistory.id)\
+                       .filter(ClipboardHistory.file_path == rel_path)\
+                       .first()
+        if still_used is None:
+            orphaned.append(Config.DATA_DIR / rel_path)
+    return orphaned
+
+
+def remove_files(paths: Iterable[Path]):
+    """删除文件，忽略已不存在的文件"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[BlobStore] 删除文件失败 {path}: {e}")
+
+
+def remove_if_unreferenced(rel_paths: Iterable[str], batch_size: int = 100):
+    """
+    删除不再被任何记录引用的文件（可在后台线程中调用）
+
+    删除记录的事务提交后调用。每批文件在持锁状态下重新确认引用关系，
+    避免误删在此期间被新入库记录引用的对象；分批持锁，不长时间阻塞入库。
+    """
+    rel_paths = sorted(set(p for p in rel_paths if p))
+    db = SessionLocal()
+    try:
+        for i in range(0, len(rel_paths), batch_size):
+            with lock:
+                orphaned = unreferenced_paths(db, rel_paths[i:i + batch_size])
+                remove_files(orphaned)
+    finally:
+        db.close()
+
+
+def dedupe_history(db: Session, dry_run: bool = False, batch_size: int = 500) -> dict:
+    """
+    把旧版按时间戳命名的历史文件迁移到对象存储并去重
+
+    旧文件以硬链接方式转为对象文件，内容重复的文件直接删除，
+    记录的 file_path / file_hash 更新为对象路径和 SHA-256。
+    """
+    report = {"records": 0, "missing": 0, "objects_created": 0, "duplicates_removed": 0, "bytes_reclaimed": 0}
+    prefix = relative_path(Config.BLOB_DIR) + os.sep
+    migrated = {}  # 旧路径 -> (新路径, 摘要)
+    created = set()  # 本次新建的对象（dry_run 时不会真正写入磁盘）
+    last_id = 0
+
+    while True:
+        items = db.query(ClipboardHistory)\
+                  .filter(ClipboardHistory.id > last_id)\
+                  .filter(ClipboardHistory.file_path.isnot(None))\
+                  .order_by(ClipboardHistory.id)\
+                  .limit(batch_size)\
+                  .all()
+        if not items:
+            break
+        last_id = items[-1].id
+
+        to_remove = []
+        with lock:
+            for item in items:
+                if item.file_path.startswith(prefix):
+                    continue
+                report["records"] += 1
+
+                if item.file_path in migrated:
+                    new_path, digest = migrated[item.file_path]
+                else:
+                    src = Config.DATA_DIR / item.file_path
+                    if not src.exists():
+                        report["missing"] += 1
+                        continue
+                    digest = hash_file(src)
+                    dest = blob_path(digest.sha256)
+                    if dest.exists() or digest.sha256 in created:
+                        report["duplicates_removed"] += 1
+                        report["bytes_reclaimed"] += digest.size
+                        to_remove.append(src)
+                    else:
+                        report["objects_created"] += 1
+                        created.add(digest.sha256)
+                        if not dry_run:
+                            # 先建立硬链接，提交后再删除旧文件，中途失败也不会丢数据
+                            _link_or_copy(src, dest, digest)
+                        to_remove.append(src)
+                    new_path = relative_path(dest)
+                    migrated[item.file_path] = (new_path, digest)
+
+                if not dry_run:
+                    item.file_path = new_path
+                    item.file_hash = digest.sha256
+                    item.file_size = digest.size
+
+            if dry_run:
+                db.rollback()
+            else:
+                db.commit()
+                remove_files(to_remove)
+
+    return report
+
+
+def compress_objects(db: Session, batch_size: int = 500) -> dict:
+    """
+    把已有的未压缩对象文件中值得压缩的改为 gzip 保存（被图片记录引用的对象除外）
+
+    先写入 .gz 对象并更新引用它的记录，提交后再删除不再被引用的原文件。
+    """
+    report = {"objects": 0, "bytes_before": 0, "bytes_after": 0}
+    prefix = relative_path(Config.BLOB_DIR) + os.sep
+    last_path = ""
+
+    while True:
+        paths = [path for (path,) in db.query(ClipboardHistory.file_path)
+                                       .filter(ClipboardHistory.file_path > last_path)
+                                       .filter(ClipboardHistory.file_path.startswith(prefix))
+                                       .filter(ClipboardHistory.file_path.notlike(f"%{compression.GZIP_SUFFIX}"))
+                                       .distinct()
+                                       .order_by(ClipboardHistory.file_path)
+                                       .limit(batch_size)]
+        if not paths:
+            break
+        last_path = paths[-1]
+
+        # 缩略图直接读取原图，被图片记录引用的对象保持不压缩
+        images = {row.file_path for row in db.query(ClipboardHistory.file_path, ClipboardHistory.type,
+                                                    ClipboardHistory.content)
+                                              .filter(ClipboardHistory.file_path.in_(paths))
+                  if thumbnails.is_image(row.type, row.content)}
+
+        with lock:
+            for rel_path in paths:
+                src = Config.DATA_DIR / rel_path
+                if rel_path in images or not src.exists():
+                    continue
+                size = src.stat().st_size
+                if not compression.should_compress_file(src, size):
+                    continue
+                dest = src.with_name(src.name + compression.GZIP_SUFFIX)
+                if not dest.exists():
+                    _write_object(src, dest)
+                db.query(ClipboardHistory)\
+                  .filter(ClipboardHistory.file_path == rel_path)\
+                  .update({ClipboardHistory.file_path: relative_path(dest)}, synchronize_session=False)
+                report["objects"] += 1
+                report["bytes_before"] += size
+                report["bytes_after"] += dest.stat().st_size
+            db.flush()
+            orphaned = unreferenced_paths(db, paths)
+            db.commit()
+            remove_files(orphaned)
+
+    return report
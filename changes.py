@@ -0,0 +1,111 @@
+"""
+历史记录变更日志（增量同步）
+
+clipboard_changes 由 clipboard_history 上的触发器写入：插入、删除，以及列表中显示的列
+（内容预览、文件、收藏、图片尺寸、最近出现时间、出现次数）发生变化时各记录一条，
+version 为单调递增的变更版本（AUTOINCREMENT，删除旧日志后也不会重复使用）。
+任何写入途径（入库、导入、删除、收藏、维护任务）都会被记录。
+
+客户端保存上次同步到的版本，通过 /api/history/changes?since=<版本> 只获取之后变化的记录；
+日志只保留最近 CHANGELOG_MAX_ROWS 条，版本早于保留范围时客户端需要重新加载全部记录。
+"""
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from config import Config
+from models import ClipboardChange, engine
+
+CHANGES_TABLE = "clipboard_changes"
+
+PRUNE_BATCH_SIZE = 5000  # 清理旧日志时每个事务删除的版本数，避免长时间占用写锁
+
+# 列表中显示、变化后需要同步给客户端的列
+SYNCED_COLUMNS = ("content", "file_path", "favorited", "image_width", "image_height",
+                  "last_seen_at", "occurrences")
+
+CHANGE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_changes_ai AFTER INSERT ON clipboard_history BEGIN
+        INSERT INTO {CHANGES_TABLE}(record_id, op) VALUES (new.id, 'insert');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_changes_ad AFTER DELETE ON clipboard_history BEGIN
+        INSERT INTO {CHANGES_TABLE}(record_id, op) VALUES (old.id, 'delete');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_changes_au AFTER UPDATE OF {", ".join(SYNCED_COLUMNS)}
+    ON clipboard_history
+    WHEN {" OR ".join(f"new.{column} IS NOT old.{column}" for column in SYNCED_COLUMNS)}
+    BEGIN
+        INSERT INTO {CHANGES_TABLE}(record_id, op) VALUES (new.id, 'update');
+    END
+    """,
+]
+
+
+def ensure_changelog():
+    """创建变更日志触发器（表由 create_all 创建）"""
+    with engine.begin() as conn:
+        for statement in CHANGE_TRIGGERS:
+            conn.execute(text(statement))
+
+
+def current_version(db: Session) -> int:
+    """最新的变更版本（没有任何变更时为 0）"""
+    version = db.execute(
+        text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": CHANGES_TABLE}
+    ).scalar()
+    return version or 0
+
+
+def oldest_version(db: Session, current: int) -> int:
+    """日志能够回答的最早版本：since 不小于该值时可以增量同步"""
+    first = db.query(func.min(ClipboardChange.version)).scalar()
+    return first - 1 if first is not None else current
+
+
+def changed_since(db: Session, since: int, limit: int):
+    """
+    since 之后变化的记录
+
+    同一条记录的多次变化只返回一次；按最后一次变化的版本排序，最多 limit 条。
+    since 为 None、大于当前版本（数据库被替换）或早于日志保留范围时无法增量同步，返回 None。
+
+    Returns:
+        (同步到的版本, [变化的记录 id], 是否还有更多)
+    """
+    current = current_version(db)
+    if since is None or since > current or since < oldest_version(db, current):
+        return None
+
+    last_change = func.max(ClipboardChange.version).label("version")
+    rows = db.query(ClipboardChange.record_id, last_change)\
+             .filter(ClipboardChange.version > since)\
+             .filter(ClipboardChange.version <= current)\
+             .group_by(ClipboardChange.record_id)\
+             .order_by(last_change)\
+             .limit(limit + 1)\
+             .all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    version = rows[-1].version if has_more else current
+    return version, [row.record_id for row in rows], has_more
+
+
+def prune_changes(db: Session, keep: int = None) -> int:
+    """只保留最近 keep 条变更日志（按版本区间分批删除，每批单独提交），返回删除的条数"""
+    keep = Config.CHANGELOG_MAX_ROWS if keep is None else keep
+    cutoff = current_version(db) - keep
+    first = db.query(func.min(ClipboardChange.version)).scalar()
+    if cutoff <= 0 or first is None:
+        return 0
+    deleted = 0
+    for lo in range(first, cutoff + 1, PRUNE_BATCH_SIZE):
+        hi = min(lo + PRUNE_BATCH_SIZE - 1, cutoff)
+        deleted += db.query(ClipboardChange)\
+                     .filter(ClipboardChange.version >= lo)\
+                     .filter(ClipboardChange.version <= hi)\
+                     .delete(synchronize_session=False)
+        db.commit()
+    return deleted
@@ -0,0 +1,190 @@
+"""
+大文本和历史文件的透明压缩
+
+- 文本：UTF-8 超过 TEXT_COMPRESS_MIN_KB 的记录把完整文本压缩后保存到 content_z，
+  content 只保留前 LIST_PREVIEW_CHARS 个字符，content_length / file_size 记录原文的字符数和字节数。
+  列表预览直接读取 content，只有读取完整记录（/api/history/{id} 等）时才解压
+- 历史文件：超过 BLOB_COMPRESS_MIN_KB 且压缩效果明显的文件以 gzip 格式保存为
+  objects/<前两位>/<哈希>.gz（哈希仍为原文件的 SHA-256）；图片不压缩（缩略图直接读取原图）。
+  下载时客户端接受 gzip 则原样发送，否则边读边解压
+- 全文索引只包含压缩文本的预览，搜索时通过 SQLite 函数 clip_text() 解压压缩的记录匹配完整文本
+
+文本默认使用 zlib；COMPRESSION_CODEC=zstd 且安装了 zstandard 时使用 zstd。
+解压时按数据头识别算法，切换配置后已有数据仍可读取。
+"""
+import gzip
+import shutil
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+from config import Config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_SUFFIX = ".gz"
+
+# 压缩后至少节省这个比例才压缩保存，否则保持原样
+MIN_SAVING = 0.1
+# 判断文件是否值得压缩时试压缩的样本大小
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+if Config.COMPRESSION_CODEC == "zstd" and zstandard is None:
+    print("[Compression] 未安装 zstandard，文本压缩使用 zlib")
+
+
+def _zlib_level() -> int:
+    # zstd 的级别范围更大，zlib / gzip 最高为 9
+    return max(1, min(Config.COMPRESSION_LEVEL, 9))
+
+
+def compress_bytes(data: bytes) -> bytes:
+    if Config.COMPRESSION_CODEC == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=Config.COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, _zlib_level())
+
+
+def decompress_bytes(data: bytes) -> bytes:
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的内容需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def full_text(content: Optional[str], content_z: Optional[bytes]) -> Optional[str]:
+    """完整文本（压缩保存时解压，否则即 content）；同时注册为 SQLite 函数 clip_text"""
+    if content_z is None:
+        return content
+    return decompress_bytes(content_z).decode("utf-8")
+
+
+def apply_text(record) -> bool:
+    """
+    文本超过阈值时改为压缩保存（修改 record 的 content / content_z / content_length / file_size）
+
+    record 可以是 ClipboardHistory 或具有相同属性的对象，content 需为完整文本。
+    """
+    if not Config.COMPRESSION_ENABLED or record.type != "Text" or not record.content:
+        return False
+    raw = record.content.encode("utf-8")
+    if len(raw) < Config.TEXT_COMPRESS_MIN_KB * 1024:
+        return False
+    packed = compress_bytes(raw)
+    if len(packed) > len(raw) * (1 - MIN_SAVING):
+        return False
+    record.content_length = len(record.content)
+    record.file_size = len(raw)
+    record.content = record.content[:Config.LIST_PREVIEW_CHARS]
+    record.content_z = packed
+    return True
+
+
+def compress_texts(db, batch_size: int = 500) -> int:
+    """按当前配置压缩已有的大文本记录，返回压缩的记录数"""
+    from sqlalchemy import LargeBinary, cast, func
+    from models import ClipboardHistory
+
+    compressed = 0
+    last_id = 0
+    while True:
+        items = db.query(ClipboardHistory)\
+                  .filter(ClipboardHistory.id > last_id)\
+                  .filter(ClipboardHistory.type == "Text")\
+                  .filter(ClipboardHistory.content_z.is_(None))\
+                  .filter(func.length(cast(ClipboardHistory.content, LargeBinary)) >= Config.TEXT_COMPRESS_MIN_KB * 1024)\
+                  .order_by(ClipboardHistory.id)\
+                  .limit(batch_size)\
+                  .all()
+        if not items:
+            return compressed
+        last_id = items[-1].id
+        compressed += sum(apply_text(item) for item in items)
+        db.commit()
+
+
+def should_compress_file(path: Path, size: int) -> bool:
+    """文件是否值得压缩保存（超过阈值，且开头的样本压缩后明显变小）"""
+    if not Config.COMPRESSION_ENABLED or size < Config.BLOB_COMPRESS_MIN_KB * 1024:
+        return False
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_SIZE)
+    return len(zlib.compress(sample, 1)) <= len(sample) * (1 - MIN_SAVING)
+
+
+def gzip_file(src: Path, dest: Path):
+    """以 gzip 格式写入 dest（不记录文件名和时间，相同内容得到相同结果）"""
+    with open(src, "rb") as fsrc, open(dest, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=_zlib_level(),
+                           filename="", mtime=0) as fdst:
+            shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+
+def is_compressed_path(path) -> bool:
+    return str(path).endswith(GZIP_SUFFIX)
+
+
+def read_head(path: Path, size: int = 16) -> bytes:
+    """读取原文件开头（用于识别文件类型）"""
+    opener = gzip.open if is_compressed_path(path) else open
+    try:
+        with opener(path, "rb") as f:
+            return f.read(size)
+    except OSError:
+        return b""
+
+
+def iter_decompressed(path: Path) -> Iterator[bytes]:
+    """逐块解压 gzip 保存的文件"""
+    with gzip.open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def report(db) -> dict:
+    """压缩情况：压缩保存的文本和文件数量、原始大小、实际占用和压缩率"""
+    from sqlalchemy import LargeBinary, cast, func
+    from models import ClipboardHistory
+
+    text_rows, text_original, text_stored = db.query(
+        func.count(ClipboardHistory.id),
+        func.sum(ClipboardHistory.file_size),
+        func.sum(func.length(ClipboardHistory.content_z) + func.length(cast(ClipboardHistory.content, LargeBinary))),
+    ).filter(ClipboardHistory.content_z.isnot(None)).one()
+
+    files = 0
+    file_original = 0
+    file_stored = 0
+    for file_path, size in db.query(ClipboardHistory.file_path, func.max(ClipboardHistory.file_size))\
+                             .filter(ClipboardHistory.file_path.like(f"%{GZIP_SUFFIX}"))\
+                             .group_by(ClipboardHistory.file_path):
+        try:
+            file_stored += (Config.DATA_DIR / file_path).stat().st_size
+        except FileNotFoundError:
+            continue
+        files += 1
+        file_original += size or 0
+
+    def section(count, original, stored):
+        original = original or 0
+        stored = stored or 0
+        return {
+            "count": count,
+            "original_bytes": original,
+            "stored_bytes": stored,
+            "ratio": round(stored / original, 4) if original else None,
+        }
+
+    return {
+        "enabled": Config.COMPRESSION_ENABLED,
+        "codec": "zstd" if Config.COMPRESSION_CODEC == "zstd" and zstandard is not None else "zlib",
+        "text": section(text_rows, text_original, text_stored),
+        "files": section(files, file_original, file_stored),
+    }
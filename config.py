@@ -5,16 +5,42 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+def _parse_type_limits(value: str) -> dict:
+    """解析按类型配置的上限，如 "Image:500,File:2000" -> {"Image": 500, "File": 2000}"""
+    limits = {}
+    for part in value.split(","):
+        if ":" in part:
+            clip_type, limit = part.split(":", 1)
+            limits[clip_type.strip()] = int(limit)
+    return limits
+
 class Config:
     """应用配置"""
     
     # 认证配置
     USERNAME: str = os.getenv("CLIP_USERNAME", "admin")
     PASSWORD: str = os.getenv("CLIP_PASSWORD", "admin")
+    # 密码哈希（python manage.py hash-password 生成），设置后不再使用 CLIP_PASSWORD
+    PASSWORD_HASH: str = os.getenv("CLIP_PASSWORD_HASH", "")
+    # PBKDF2 迭代次数（只配置明文密码时，启动后按该参数计算哈希）
+    AUTH_HASH_ITERATIONS: int = int(os.getenv("AUTH_HASH_ITERATIONS", "260000"))
+    # 验证通过的凭据缓存：条目数上限、有效期（秒），任一为 0 时不缓存
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "256"))
+    AUTH_CACHE_TTL: int = int(os.getenv("AUTH_CACHE_TTL", "300"))
+    # 会话存储：sqlite（保存在数据库中）、file（每个会话一个文件，SESSION_DIR 可指向 /dev/shm）、
+    # memory（进程内，只适用于单进程，重启后需要重新登录）
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "sqlite").lower()
+    # 会话数量上限、过期会话的清理间隔（分钟）
+    SESSION_MAX: int = int(os.getenv("SESSION_MAX", "1000"))
+    SESSION_SWEEP_MINUTES: int = int(os.getenv("SESSION_SWEEP_MINUTES", "10"))
     
     # 服务器配置
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
+    # 工作进程数（python main.py 启动时生效），大于 1 时会话需使用 sqlite 或 file 存储
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    # 代码修改后自动重启（仅用于开发，不能与多进程同时使用）
+    RELOAD: bool = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
     
     # 时区配置（默认北京时间）
     TIMEZONE: str = os.getenv("TZ", "Asia/Shanghai")
@@ -24,9 +50,82 @@ class Config:
     _data_dir_env: str = os.getenv("DATA_DIR", "webdav_data")
     DATA_DIR: Path = Path(_data_dir_env) if _data_dir_env.startswith("/") else BASE_DIR / _data_dir_env
     HISTORY_DIR: Path = DATA_DIR / "history"
+    BLOB_DIR: Path = HISTORY_DIR / "objects"  # 按内容哈希去重的历史文件
+    THUMB_DIR: Path = DATA_DIR / "thumbs"  # 图片缩略图缓存
     FILE_DIR: Path = DATA_DIR / "file"
     DB_PATH: Path = DATA_DIR / "clipboard.db"
     SYNC_JSON_PATH: Path = DATA_DIR / "SyncClipboard.json"
+    LOCK_DIR: Path = DATA_DIR / "locks"  # 跨进程文件锁
+    PROFILE_DIR: Path = DATA_DIR / "profiles"  # 性能分析报告
+    SESSION_DIR: Path = Path(os.getenv("SESSION_DIR", str(DATA_DIR / "sessions")))  # file 会话存储目录
+    
+    # 数据库配置（SQLite）
+    DB_JOURNAL_MODE: str = os.getenv("DB_JOURNAL_MODE", "WAL")  # WAL 允许读写并发；网络文件系统上可改为 DELETE
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # WAL 下 NORMAL 只在断电时可能丢失最后几个事务
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "20000"))  # 每个连接的页缓存大小
+    DB_MMAP_SIZE_MB: int = int(os.getenv("DB_MMAP_SIZE_MB", "256"))  # 内存映射读取的大小，0 表示关闭
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # 等待写锁的最长时间
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))  # 连接池常驻连接数
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # 连接池满时允许额外创建的连接数
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待空闲连接的最长秒数
+    # 同步处理函数（数据库查询）的线程数上限，默认与连接池容量一致，避免线程等待连接
+    API_THREADS: int = int(os.getenv("API_THREADS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+    
+    # WebDAV 热缓存：SyncClipboard.json 及其引用的文件保存在内存中（超过上限的文件不缓存）
+    DAV_CACHE_ENABLED: bool = os.getenv("DAV_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    DAV_CACHE_MAX_MB: int = int(os.getenv("DAV_CACHE_MAX_MB", "8"))
+    # 命中缓存时检查文件是否已被修改（多进程时其他进程的写入不会使本进程的缓存失效）
+    DAV_CACHE_REVALIDATE: bool = os.getenv("DAV_CACHE_REVALIDATE", "true" if WORKERS > 1 else "false").lower() in ("1", "true", "yes")
+    # WebDAV 快速通道：SyncClipboard 的 GET/HEAD/PUT 直接在 ASGI 层处理，不经过 WSGI 适配
+    DAV_FASTPATH_ENABLED: bool = os.getenv("DAV_FASTPATH_ENABLED", "true").lower() in ("1", "true", "yes")
+    
+    # 运行指标（/metrics，Prometheus 文本格式）；超过 SLOW_REQUEST_MS 的请求打印日志（0 表示不打印）
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    SLOW_REQUEST_MS: int = int(os.getenv("SLOW_REQUEST_MS", "1000"))
+    # 按请求开启 cProfile 分析（?profile=1 或 X-Profile: 1），报告保存到 PROFILE_DIR
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_TOP_N: int = int(os.getenv("PROFILE_TOP_N", "40"))  # 文本报告中列出的函数数
+    
+    # 历史列表（mode=list）中文本预览的最大字符数
+    LIST_PREVIEW_CHARS: int = int(os.getenv("LIST_PREVIEW_CHARS", "200"))
+    
+    # 透明压缩：超过阈值的文本和可压缩的历史文件压缩保存，读取时解压
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "false").lower() in ("1", "true", "yes")
+    COMPRESSION_CODEC: str = os.getenv("COMPRESSION_CODEC", "zlib").lower()  # 文本压缩算法：zlib / zstd（需安装 zstandard）
+    COMPRESSION_LEVEL: int = int(os.getenv("COMPRESSION_LEVEL", "6"))
+    TEXT_COMPRESS_MIN_KB: int = int(os.getenv("TEXT_COMPRESS_MIN_KB", "64"))  # 文本超过该大小才压缩
+    BLOB_COMPRESS_MIN_KB: int = int(os.getenv("BLOB_COMPRESS_MIN_KB", "64"))  # 文件超过该大小才压缩
+    
+    # 搜索配置（SQLite 支持时使用 FTS5 trigram 全文索引，否则退回 LIKE）
+    SEARCH_FTS: bool = os.getenv("SEARCH_FTS", "true").lower() in ("1", "true", "yes")
+    
+    # 入库队列配置（SyncClipboard.json 写入后在后台解析入库）
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))  # 队列容量
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "2"))  # 工作线程数
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "50"))  # 每个事务最多插入的记录数
+    INGEST_COALESCE_MS: int = int(os.getenv("INGEST_COALESCE_MS", "300"))  # 相同内容连续写入的合并窗口，0 表示不合并
+    INGEST_PUT_TIMEOUT: float = float(os.getenv("INGEST_PUT_TIMEOUT", "5"))  # 队列满时最长等待秒数
+    # 重复文本合并：off 不合并 / window 在窗口内重复时合并 / always 与任意已有记录相同即合并
+    DEDUP_MODE: str = os.getenv("DEDUP_MODE", "window").lower()
+    DEDUP_WINDOW_MINUTES: int = int(os.getenv("DEDUP_WINDOW_MINUTES", "60"))  # window 模式：距上次出现的最长间隔
+    # 增量同步变更日志最多保留的条数（客户端版本早于保留范围时重新加载全部记录）
+    CHANGELOG_MAX_ROWS: int = int(os.getenv("CHANGELOG_MAX_ROWS", "200000"))
+    
+    # 缩略图配置
+    THUMB_DEFAULT_WIDTH: int = int(os.getenv("THUMB_DEFAULT_WIDTH", "256"))  # 列表中使用的缩略图宽度
+    THUMB_WORKERS: int = int(os.getenv("THUMB_WORKERS", "2"))  # 生成缩略图的进程数
+    
+    # 保留策略（0 表示不限制），由后台维护任务定期执行
+    RETENTION_MAX_AGE_DAYS: int = int(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))  # 记录最长保留天数
+    RETENTION_MAX_ROWS: int = int(os.getenv("RETENTION_MAX_ROWS", "0"))  # 最多保留的记录数
+    RETENTION_MAX_MB_PER_TYPE: dict = _parse_type_limits(os.getenv("RETENTION_MAX_MB_PER_TYPE", ""))  # 如 Image:500,File:2000
+    RETENTION_KEEP_FAVORITES: bool = os.getenv("RETENTION_KEEP_FAVORITES", "true").lower() in ("1", "true", "yes")  # 收藏不受保留策略影响
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))  # 每个删除事务的记录数
+    
+    # 后台维护任务（保留策略、孤立文件清理、数据库整理）
+    MAINTENANCE_ENABLED: bool = os.getenv("MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+    MAINTENANCE_INTERVAL_MINUTES: int = int(os.getenv("MAINTENANCE_INTERVAL_MINUTES", "60"))  # 执行间隔
+    MAINTENANCE_VACUUM_FREE_PERCENT: int = int(os.getenv("MAINTENANCE_VACUUM_FREE_PERCENT", "20"))  # 空闲页超过该比例时 VACUUM
     
     # 静态文件目录
     STATIC_DIR: Path = BASE_DIR / "static"
@@ -36,7 +135,10 @@ class Config:
         """确保所有必要的目录存在"""
         cls.DATA_DIR.mkdir(parents=True, exist_ok=True)
         cls.HISTORY_DIR.mkdir(parents=True, exist_ok=True)
+        cls.BLOB_DIR.mkdir(parents=True, exist_ok=True)
+        cls.THUMB_DIR.mkdir(parents=True, exist_ok=True)
         cls.FILE_DIR.mkdir(parents=True, exist_ok=True)
+        cls.LOCK_DIR.mkdir(parents=True, exist_ok=True)
         cls.STATIC_DIR.mkdir(parents=True, exist_ok=True)
 
 # 初始化目录
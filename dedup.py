@@ -0,0 +1,127 @@
+"""
+重复文本合并
+
+SyncClipboard 客户端会反复上传相同的剪贴板内容。入库时按 content_hash 查找已有的文本记录，
+找到时只更新该记录的 last_seen_at 和 occurrences，不再插入新记录：
+- DEDUP_MODE=window：距该内容上次出现不超过 DEDUP_WINDOW_MINUTES 分钟时合并
+- DEDUP_MODE=always：与任意已有记录相同即合并
+- DEDUP_MODE=off：总是插入新记录
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import desc, func
+from sqlalchemy.orm import Session
+from config import Config
+from models import ClipboardHistory
+import deletion
+
+MERGE_BATCH_SIZE = 500  # 合并已有记录时每次查询的哈希数
+
+
+def enabled() -> bool:
+    return Config.DEDUP_MODE in ("window", "always")
+
+
+def _window() -> Optional[timedelta]:
+    """合并窗口（always 模式为 None）"""
+    if Config.DEDUP_MODE == "always":
+        return None
+    return timedelta(minutes=Config.DEDUP_WINDOW_MINUTES)
+
+
+def _naive(value: datetime) -> datetime:
+    # 数据库中的时间按配置时区的本地时间保存（不带时区信息）
+    return value.replace(tzinfo=None)
+
+
+def _within(record: ClipboardHistory, seen_at: datetime) -> bool:
+    window = _window()
+    return window is None or seen_at - _naive(record.last_seen_at) <= window
+
+
+def find_existing(db: Session, content_hash: str, seen_at: datetime) -> Optional[ClipboardHistory]:
+    """查找可以合并的已有文本记录（最近出现的一条）"""
+    query = db.query(ClipboardHistory)\
+              .filter(ClipboardHistory.content_hash == content_hash)\
+              .filter(ClipboardHistory.type == "Text")
+    window = _window()
+    if window is not None:
+        query = query.filter(ClipboardHistory.last_seen_at >= seen_at - window)
+    return query.order_by(desc(ClipboardHistory.last_seen_at)).first()
+
+
+def merge_batch(db: Session, records: List[ClipboardHistory]) -> Tuple[List[ClipboardHistory], List[ClipboardHistory]]:
+    """
+    合并一批待插入记录中的重复文本（调用方需持有 blobstore.lock 并负责提交）
+
+    记录需已设置 content_hash 和 last_seen_at；同一批内的重复内容也会合并。
+
+    Returns:
+        (需要插入的记录, 被更新的已有记录)
+    """
+    if not enabled():
+        return records, []
+
+    new_records = []
+    latest = {}  # content_hash -> 本批中该内容对应的记录（新记录或已有记录）
+    updated = {}
+    for record in records:
+        if record.type != "Text" or not record.content_hash:
+            new_records.append(record)
+            continue
+
+        seen_at = _naive(record.created_at)
+        target = latest.get(record.content_hash)
+        if target is None or not _within(target, seen_at):
+            target = find_existing(db, record.content_hash, seen_at)
+        if target is None:
+            latest[record.content_hash] = record
+            new_records.append(record)
+            continue
+
+        target.last_seen_at = max(_naive(target.last_seen_at), seen_at)
+        target.occurrences = (target.occurrences or 1) + 1
+        latest[record.content_hash] = target
+        if target.id is not None:
+            updated[target.id] = target
+    return new_records, list(updated.values())
+
+
+def merge_existing(db: Session) -> dict:
+    """按当前 DEDUP_MODE 合并已有的重复文本记录（保留最早的一条，累加出现次数）"""
+    report = {"groups": 0, "merged": 0}
+    last_hash = ""
+    while True:
+        hashes = [content_hash for (content_hash,) in
+                  db.query(ClipboardHistory.content_hash)
+                    .filter(ClipboardHistory.type == "Text")
+                    .filter(ClipboardHistory.content_hash > last_hash)
+                    .group_by(ClipboardHistory.content_hash)
+                    .having(func.count() > 1)
+                    .order_by(ClipboardHistory.content_hash)
+                    .limit(MERGE_BATCH_SIZE)]
+        if not hashes:
+            return report
+        last_hash = hashes[-1]
+
+        to_delete = []
+        for content_hash in hashes:
+            rows = db.query(ClipboardHistory)\
+                     .filter(ClipboardHistory.content_hash == content_hash)\
+                     .filter(ClipboardHistory.type == "Text")\
+                     .order_by(ClipboardHistory.created_at, ClipboardHistory.id)\
+                     .all()
+            keeper = rows[0]
+            for row in rows[1:]:
+                if not _within(keeper, row.created_at):
+                    keeper = row
+                    continue
+                keeper.last_seen_at = max(keeper.last_seen_at, row.last_seen_at or row.created_at)
+                keeper.occurrences = (keeper.occurrences or 1) + (row.occurrences or 1)
+                keeper.favorited = keeper.favorited or row.favorited
+                to_delete.append(row.id)
+            report["groups"] += 1
+
+        # 先提交合并后的出现次数，再删除重复记录（同时更新统计）
+        db.commit()
+        report["merged"] += len(deletion.delete_ids(db, to_delete))
@@ -0,0 +1,76 @@
+"""
+批量删除历史记录
+
+按 id 分块执行 DELETE ... WHERE id IN (...) RETURNING，每块一个短事务，
+统计信息用 RETURNING 的类型和字节数更新；关联文件在事务提交后交给后台线程删除，
+删除前重新确认没有被其他记录引用。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+from sqlalchemy import delete
+from sqlalchemy.orm import Query, Session
+from models import ClipboardHistory
+from events import event_bus
+import blobstore
+import stats
+
+# 每个删除事务的记录数（同时受 SQLite 绑定参数数量限制）
+DELETE_CHUNK_SIZE = 500
+
+_file_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="file-remove")
+
+
+def delete_ids(db: Session, ids: Iterable[int]) -> List[int]:
+    """
+    删除指定 id 的记录
+
+    Returns:
+        实际删除的 id（不存在的 id 会被忽略）
+    """
+    ids = list(dict.fromkeys(ids))
+    deleted = []
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        chunk = ids[i:i + DELETE_CHUNK_SIZE]
+        rows = db.execute(
+            delete(ClipboardHistory)
+            .where(ClipboardHistory.id.in_(chunk))
+            .returning(ClipboardHistory.id, ClipboardHistory.type,
+                       stats.size_expression().label("size"), ClipboardHistory.file_path),
+            execution_options={"synchronize_session": False}
+        ).all()
+        if not rows:
+            db.rollback()
+            continue
+        stats.on_delete_sizes(db, ((row.type, row.size) for row in rows))
+        db.commit()
+
+        chunk_deleted = [row.id for row in rows]
+        deleted.extend(chunk_deleted)
+        file_paths = [row.file_path for row in rows if row.file_path]
+        if file_paths:
+            _file_executor.submit(blobstore.remove_if_unreferenced, file_paths)
+        event_bus.publish("deleted", {"ids": chunk_deleted})
+    return deleted
+
+
+def delete_matching(db: Session, query: Query, limit: int = None) -> List[int]:
+    """
+    删除查询匹配的记录（query 需以 ClipboardHistory 为主实体，可带筛选和连接）
+
+    按 id 从小到大分块取出匹配的 id 再删除，不会一次性加载全部结果。
+    """
+    deleted = []
+    last_id = 0
+    while limit is None or len(deleted) < limit:
+        size = DELETE_CHUNK_SIZE if limit is None else min(DELETE_CHUNK_SIZE, limit - len(deleted))
+        ids = [row.id for row in query.with_entities(ClipboardHistory.id)
+                                      .filter(ClipboardHistory.id > last_id)
+                                      .order_by(None)
+                                      .order_by(ClipboardHistory.id)
+                                      .limit(size)]
+        if not ids:
+            break
+        last_id = ids[-1]
+        deleted.extend(delete_ids(db, ids))
+    return deleted
+
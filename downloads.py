@@ -0,0 +1,293 @@
+"""
+历史文件下载
+
+历史文件入库后内容不会再变化（对象存储按内容哈希命名），因此：
+- 使用由文件哈希生成的强 ETag，并允许浏览器长期缓存（immutable）
+- If-None-Match 命中时返回 304
+- 支持单段 Range 请求（206），大文件可以断点续传
+- 根据文件头识别常见格式的 Content-Type
+- gzip 压缩保存的文件：客户端接受 gzip 时原样发送，否则边读边解压（不支持 Range）
+"""
+import mimetypes
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import compression
+
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+
+# 文件头 -> Content-Type，只识别不会被浏览器当作页面执行的格式
+MAGIC_TYPES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (b"Rar!\x1a\x07", "application/vnd.rar"),
+    (b"ID3", "audio/mpeg"),
+    (b"OggS", "audio/ogg"),
+    (b"fLaC", "audio/flac"),
+]
+
+# 扩展名推断出这些类型时不直接使用，避免在站点下渲染上传的页面
+UNSAFE_TYPES = {"text/html", "application/xhtml+xml", "image/svg+xml", "text/javascript", "application/javascript"}
+
+
+def sniff_media_type(path: Path, filename: Optional[str] = None) -> str:
+    """根据文件头识别 Content-Type，无法识别时按文件名推断（压缩保存的文件按解压后的内容识别）"""
+    head = compression.read_head(path)
+
+    for magic, media_type in MAGIC_TYPES:
+        if head.startswith(magic):
+            # zip 容器（docx/xlsx/apk 等）优先使用扩展名给出的具体类型
+            if media_type == "application/zip" and filename:
+                return mimetypes.guess_type(filename)[0] or media_type
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+
+    media_type = mimetypes.guess_type(filename or str(path))[0]
+    if not media_type or media_type in UNSAFE_TYPES:
+        return "application/octet-stream"
+    return media_type
+
+
+def make_etag(file_hash: Optional[str], stat_result: Optional[os.stat_result] = None, variant: str = "") -> str:
+    """有内容哈希时生成强 ETag，否则按修改时间和大小生成弱 ETag"""
+    if file_hash:
+        return f'"{file_hash}{variant}"'
+    return f'W/"{int(stat_result.st_mtime)}-{stat_result.st_size}{variant}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较（忽略 W/ 前缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 请求头
+
+    Returns:
+        (start, end)，end 为闭区间；多段或格式不支持时返回 None（返回完整文件）
+    Raises:
+        ValueError: 范围无法满足（416）
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, sep, end_str = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # bytes=-N 表示最后 N 个字节
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            start = max(0, size - suffix)
+            end = size - 1
+    except ValueError:
+        if start_str.isdigit() or end_str.isdigit():
+            raise
+        return None
+
+    if start < 0 or start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class PartialFileResponse(FileResponse):
+    """只发送文件指定区间的 206 响应"""
+
+    def __init__(self, path, start: int, end: int, size: int, **kwargs):
+        self.start = start
+        self.end = end
+        super().__init__(path, status_code=206, **kwargs)
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        super().set_stat_headers(stat_result)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            remaining = self.end - self.start + 1
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    })
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(
+    request: Request,
+    path: Path,
+    file_hash: Optional[str] = None,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+    etag_variant: str = "",
+    content_disposition_type: str = "attachment",
+) -> Response:
+    """
+    返回带缓存校验和 Range 支持的文件响应
+
+    Args:
+        request: 当前请求（读取 If-None-Match / Range / If-Range）
+        path: 文件路径
+        file_hash: 文件内容哈希，用作 ETag
+        filename: 下载文件名（Content-Disposition）
+        media_type: 指定 Content-Type，不指定时按文件头识别
+        etag_variant: 同一内容的不同表示（如缩略图宽度）附加到 ETag
+    """
+    stat_result = os.stat(path)
+    etag = make_etag(file_hash, stat_result, etag_variant)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE})
+
+    if media_type is None:
+        media_type = sniff_media_type(path, filename)
+
+    kwargs = dict(
+        headers=headers,
+        media_type=media_type,
+        filename=filename,
+        stat_result=stat_result,
+        method=request.method,
+        content_disposition_type=content_disposition_type,
+    )
+
+    range_header = request.headers.get("range")
+    # If-Range 与当前 ETag 不一致时（文件已变化）忽略 Range，返回完整文件
+    if range_header and request.headers.get("if-range", etag) == etag:
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{size}", "ETag": etag}
+            )
+        if byte_range is not None:
+            return PartialFileResponse(path, *byte_range, size, **kwargs)
+
+    return FileResponse(path, **kwargs)
+
+
+def accepts_gzip(request: Request) -> bool:
+    """客户端是否接受 gzip 编码（Accept-Encoding 中 gzip 或 * 且 q 不为 0）"""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() != "q":
+            return True
+        try:
+            return float(value) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _content_disposition(disposition_type: str, filename: str) -> str:
+    """与 FileResponse 相同的 Content-Disposition（非 ASCII 文件名使用 RFC 5987 编码）"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def compressed_file_response(
+    request: Request,
+    path: Path,
+    file_hash: Optional[str],
+    size: Optional[int],
+    filename: Optional[str] = None,
+    content_disposition_type: str = "attachment",
+) -> Response:
+    """
+    返回 gzip 压缩保存的文件
+
+    客户端接受 gzip 时直接发送压缩文件（Content-Encoding: gzip），不需要解压；
+    否则在线程池中边读边解压，Content-Length 为原文件大小 size。
+    两种表示使用不同的 ETag，都不支持 Range。
+    """
+    stat_result = os.stat(path)
+    encoded = accepts_gzip(request)
+    etag = make_etag(file_hash, stat_result, "-gzip" if encoded else "")
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE,
+        "Vary": "Accept-Encoding",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE,
+                                                  "Vary": "Accept-Encoding"})
+
+    media_type = sniff_media_type(path, filename)
+    if encoded:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(path, headers=headers, media_type=media_type, filename=filename,
+                            stat_result=stat_result, method=request.method,
+                            content_disposition_type=content_disposition_type)
+
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    if filename:
+        headers["Content-Disposition"] = _content_disposition(content_disposition_type, filename)
+    body = compression.iter_decompressed(path) if request.method != "HEAD" else iter(())
+    return StreamingResponse(body, media_type=media_type, headers=headers)
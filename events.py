@@ -0,0 +1,109 @@
+import asyncio
+import secrets
+import threading
+from collections import deque
+from typing import Optional
+
+
+class EventBus:
+    """
+    进程内事件总线
+
+    WebDAV 线程和 API 处理函数通过 publish() 发布事件，
+    SSE 连接通过 subscribe() 订阅；最近的事件保存在环形缓冲区中，
+    客户端断线重连时可以凭 Last-Event-ID 补发错过的事件。
+    """
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 1000):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self._queue_size = queue_size
+        self._subscribers = set()
+        self._seq = 0
+        # 每次进程启动生成新的纪元，重启后旧的事件 ID 失效
+        self._epoch = secrets.token_hex(4)
+
+    def _format_id(self, seq: int) -> str:
+        return f"{self._epoch}-{seq}"
+
+    def _parse_id(self, event_id: Optional[str]) -> Optional[int]:
+        """解析事件 ID，纪元不匹配或格式错误返回 None"""
+        if not event_id:
+            return None
+        epoch, _, seq = event_id.partition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, event: str, data: dict):
+        """发布事件（线程安全，可在任意线程调用）"""
+        with self._lock:
+            self._seq += 1
+            item = (self._format_id(self._seq), event, data)
+            self._history.append((self._seq, item))
+            subscribers = list(self._subscribers)
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, item)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, item):
+        """在订阅者的事件循环中投递事件，队列满时改为通知客户端重新加载"""
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(item if item is None else (None, "reset", {}))
+
+    def subscribe(self, last_event_id: Optional[str] = None):
+        """
+        订阅事件
+
+        Returns:
+            (queue, backlog): backlog 为需要补发的事件列表；
+            如果 Last-Event-ID 已不在缓冲区内，backlog 为一个 reset 事件
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self._queue_size)
+
+        with self._lock:
+            self._subscribers.add((loop, queue))
+            backlog = []
+            if last_event_id:
+                seq = self._parse_id(last_event_id)
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                if seq is None or seq > self._seq or seq < oldest - 1:
+                    # 无法补齐中间的事件，让客户端全量刷新
+                    backlog = [(None, "reset", {})]
+                else:
+                    backlog = [item for s, item in self._history if s > seq]
+
+        return queue, backlog
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        with self._lock:
+            self._subscribers = {s for s in self._subscribers if s[1] is not queue}
+
+    def close(self):
+        """关闭所有订阅（应用退出时调用）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, None)
+            except RuntimeError:
+                pass
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+# 全局事件总线
+event_bus = EventBus()
@@ -0,0 +1,294 @@
+"""
+剪贴板入库队列
+
+WebDAV 写入 SyncClipboard.json 后只把原始内容放入有界队列并立即返回，
+由后台工作线程完成 JSON 解析、文件入库和数据库写入：
+- 同一批次内短时间连续写入的相同剪贴板内容（类型、内容/哈希、文件名均相同）只保留最后一次，
+  内容不同的写入总是分别入库
+- 与已有记录相同的文本按 DEDUP_MODE 合并到已有记录（更新 last_seen_at 和 occurrences）
+- 一个批次的记录在同一个事务中插入
+- 队列满时阻塞写入线程（反压），超时后退回同步处理，不丢数据
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+from config import Config
+from models import SessionLocal, ClipboardHistory, text_hash
+from events import event_bus
+from metrics import INGEST_STAGE
+import blobstore
+import compression
+import dedup
+import stats
+import thumbnails
+
+
+class ClipboardUpdate(NamedTuple):
+    """一次 SyncClipboard.json 写入"""
+    raw: bytes  # 写入完成时读取的 JSON 原文
+    received_at: datetime  # 接收时间（作为记录时间）
+    received_mono: float  # time.monotonic()，用于计算入库延迟
+
+
+def build_record(update: ClipboardUpdate):
+    """
+    解析 SyncClipboard.json 并生成数据库记录，文件类型同时保存到对象存储
+
+    Returns:
+        (record, stored): stored 为 (源文件, 相对路径, 摘要) 或 None
+    """
+    with INGEST_STAGE.time("parse"):
+        data = json.loads(update.raw.decode("utf-8"))
+
+    clip_type = data.get("Type", "")
+    content = data.get("Clipboard", "")
+    filename = data.get("File", "")
+
+    record = ClipboardHistory(
+        type=clip_type,
+        content=content if clip_type == "Text" else filename,
+        created_at=update.received_at,
+        last_seen_at=update.received_at
+    )
+    if clip_type == "Text":
+        record.content_hash = text_hash(content)
+    # 大文本压缩保存
+    compression.apply_text(record)
+
+    # 如果是文件或图片类型，保存到 history 对象存储（相同内容只保存一份）
+    stored = None
+    if clip_type in ["Image", "File", "Group"] and filename:
+        source_file = Config.FILE_DIR / filename
+        if source_file.exists():
+            with INGEST_STAGE.time("file"):
+                # 图片保持原样（缩略图直接读取），其他文件可压缩保存
+                rel_path, digest = blobstore.store_file(
+                    source_file, compress=not thumbnails.is_image(clip_type, filename))
+            stored = (source_file, rel_path, digest)
+
+            # 记录文件信息
+            record.file_path = rel_path
+            record.file_size = digest.size
+            record.file_hash = digest.sha256
+            
+            # 图片在入库时生成列表用的缩略图并记录尺寸
+            if thumbnails.is_image(clip_type, filename):
+                with INGEST_STAGE.time("thumbnail"):
+                    size = thumbnails.prepare(Config.DATA_DIR / rel_path, digest.sha256)
+                if size:
+                    record.image_width, record.image_height = size
+
+            # 校验客户端提供的哈希，不一致时保留原值以便排查
+            if blobstore.verify_client_hash(content, digest) is False:
+                print(f"[Ingest] 文件哈希不一致: {filename} client={content} server={digest.sha256}")
+                record.extra_data = json.dumps({"client_hash": content}, ensure_ascii=False)
+
+    return record, stored
+
+
+def _item_key(update: ClipboardUpdate) -> Optional[tuple]:
+    """剪贴板内容的标识 (Type, Clipboard, File)；无法解析时返回 None（不参与合并）"""
+    try:
+        data = json.loads(update.raw.decode("utf-8"))
+        return data.get("Type", ""), data.get("Clipboard", ""), data.get("File", "")
+    except (ValueError, AttributeError):
+        return None
+
+
+def coalesce(updates: List[ClipboardUpdate], window: float) -> List[ClipboardUpdate]:
+    """
+    合并短时间内的重复写入：后一次写入在 window 秒内到达且内容相同时丢弃前一次
+
+    内容不同的写入即使间隔很短也都保留（只在间隔小于 window 时才解析比较）。
+    """
+    if window <= 0:
+        return list(updates)
+    kept = []
+    for current, following in zip(updates, updates[1:]):
+        if following.received_mono - current.received_mono >= window:
+            kept.append(current)
+            continue
+        key = _item_key(current)
+        if key is None or key != _item_key(following):
+            kept.append(current)
+    kept.append(updates[-1])
+    return kept
+
+
+class IngestQueue:
+    """有界入库队列 + 工作线程池"""
+
+    def __init__(self, maxsize: int, workers: int, batch_size: int,
+                 coalesce_window: float, put_timeout: float):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._workers = max(1, workers)
+        self._batch_size = max(1, batch_size)
+        self._coalesce_window = coalesce_window
+        self._put_timeout = put_timeout
+        self._threads = []
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        # 同一时刻只有一个线程在收集批次，保证一次连续写入落在同一批次里合并
+        self._collect_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "received": 0,
+            "ingested": 0,
+            "coalesced": 0,
+            "deduplicated": 0,
+            "failed": 0,
+            "batches": 0,
+            "sync_fallbacks": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "total_lag_ms": 0.0,
+        }
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """处理完队列中剩余的更新后停止工作线程"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, update: ClipboardUpdate):
+        """提交一次更新；队列满时等待，超时后在当前线程同步处理"""
+        self.start()
+        self._count("received")
+        try:
+            self._queue.put(update, timeout=self._put_timeout)
+        except queue.Full:
+            print("[Ingest] 入库队列已满，同步处理")
+            self._count("sync_fallbacks")
+            self._process([update])
+
+    def _count(self, key: str, value: int = 1):
+        with self._metrics_lock:
+            self._metrics[key] += value
+
+    def _collect_batch(self) -> List[ClipboardUpdate]:
+        """取出一批更新：拿到第一条后继续等待 coalesce 窗口内的后续写入"""
+        with self._collect_lock:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                return []
+
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self._coalesce_window or 0.001))
+                except queue.Empty:
+                    break
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self._process(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _process(self, batch: List[ClipboardUpdate]):
+        """处理一批更新：合并、生成记录，并在一个事务中写入数据库"""
+        updates = coalesce(sorted(batch, key=lambda u: u.received_mono), self._coalesce_window)
+        self._count("coalesced", len(batch) - len(updates))
+
+        prepared = []
+        for update in updates:
+            try:
+                prepared.append((update, *build_record(update)))
+            except Exception as e:
+                self._count("failed")
+                print(f"[Ingest] 解析剪贴板更新失败: {e}")
+        if not prepared:
+            return
+
+        records = [record for _, record, _ in prepared]
+        # 提交后仍需读取记录属性生成事件，避免逐条重新查询
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            with INGEST_STAGE.time("commit"), blobstore.lock:
+                for _, _, stored in prepared:
+                    if stored:
+                        blobstore.ensure_stored(*stored)
+                records, seen = dedup.merge_batch(db, records)
+                db.add_all(records)
+                stats.on_insert(db, records)
+                stats.on_seen(db, seen)
+                db.commit()
+            events = [record.to_dict() for record in records]
+            seen_events = [{"id": record.id, "last_seen_at": record.last_seen_at.isoformat(),
+                            "occurrences": record.occurrences} for record in seen]
+        except Exception as e:
+            db.rollback()
+            self._count("failed", len(records))
+            print(f"[Ingest] 数据库错误: {e}")
+            return
+        finally:
+            db.close()
+
+        now = time.monotonic()
+        with self._metrics_lock:
+            self._metrics["ingested"] += len(records)
+            self._metrics["deduplicated"] += len(prepared) - len(records)
+            self._metrics["batches"] += 1
+            for update, _, _ in prepared:
+                lag_ms = (now - update.received_mono) * 1000
+                self._metrics["last_lag_ms"] = lag_ms
+                self._metrics["max_lag_ms"] = max(self._metrics["max_lag_ms"], lag_ms)
+                self._metrics["total_lag_ms"] += lag_ms
+
+        for record, data in zip(records, events):
+            print(f"[Ingest] 记录已保存: type={record.type}, content={(data['content'] or '')[:50]}")
+            event_bus.publish("created", data)
+        for data in seen_events:
+            event_bus.publish("seen", data)
+
+    def metrics(self) -> dict:
+        """队列深度与入库延迟"""
+        with self._metrics_lock:
+            data = dict(self._metrics)
+        total_lag = data.pop("total_lag_ms")
+        data["avg_lag_ms"] = round(total_lag / data["ingested"], 3) if data["ingested"] else 0.0
+        data["last_lag_ms"] = round(data["last_lag_ms"], 3)
+        data["max_lag_ms"] = round(data["max_lag_ms"], 3)
+        data["queue_depth"] = self._queue.qsize()
+        data["queue_capacity"] = self._queue.maxsize
+        data["workers"] = len(self._threads)
+        return data
+
+
+def new_update(raw: bytes) -> ClipboardUpdate:
+    """以当前时间创建一次更新"""
+    return ClipboardUpdate(raw, datetime.now(ZoneInfo(Config.TIMEZONE)), time.monotonic())
+
+
+# 全局入库队列
+ingest_queue = IngestQueue(
+    maxsize=Config.INGEST_QUEUE_SIZE,
+    workers=Config.INGEST_WORKERS,
+    batch_size=Config.INGEST_BATCH_SIZE,
+    coalesce_window=Config.INGEST_COALESCE_MS / 1000,
+    put_timeout=Config.INGEST_PUT_TIMEOUT,
+)
@@ -0,0 +1,52 @@
+"""
+跨进程文件锁
+
+多进程（uvicorn --workers）部署时，入库/删除对象文件、数据库初始化和后台维护任务
+需要在所有工作进程之间互斥。FileLock 在进程内是可重入的线程锁，
+进程之间通过 fcntl.flock 互斥；不支持 flock 的平台（Windows）上只在进程内互斥。
+"""
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class FileLock:
+    """进程内可重入、进程间互斥的锁"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._rlock.acquire(blocking=blocking):
+            return False
+        if self._depth == 0 and fcntl is not None:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._rlock.release()
+                return False
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -1,27 +1,73 @@
+from contextlib import asynccontextmanager
+import anyio
 from fastapi import FastAPI, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse, JSONResponse
 from pydantic import BaseModel
 from a2wsgi import WSGIMiddleware
-from models import init_db
+from models import init_db, engine
 from config import Config
 from auth import (
-    get_current_user, verify_credentials, create_session, 
-    delete_session, SESSION_COOKIE_NAME
+    get_current_user, verify_credentials_async, create_session, 
+    delete_session, sweep_sessions, SESSION_COOKIE_NAME
 )
 from api.history import router as history_router
+from api.events import router as events_router
+from api.metrics import router as metrics_router
+from api.transfer import router as transfer_router
+from events import event_bus
+from ingest import ingest_queue
+import thumbnails
+import retention
+from tasks import scheduler
 from webdav_server import create_webdav_app
+from webdav_fastpath import DAVFastPath
+import metrics
+from profiling import ProfilingMiddleware
 
 # 初始化数据库
 init_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台入库线程，退出时关闭后台资源"""
+    # 限制同时执行的同步处理函数数量（数据库查询在线程池中执行）
+    anyio.to_thread.current_default_thread_limiter().total_tokens = Config.API_THREADS
+    ingest_queue.start()
+    # 定期执行保留策略和存储整理（启动一分钟后首次执行）
+    if Config.MAINTENANCE_ENABLED:
+        scheduler.add("maintenance", Config.MAINTENANCE_INTERVAL_MINUTES * 60,
+                      retention.run_maintenance, initial_delay=60, exclusive=True)
+    # 定期清理过期会话
+    scheduler.add("sessions", Config.SESSION_SWEEP_MINUTES * 60, sweep_sessions,
+                  initial_delay=Config.SESSION_SWEEP_MINUTES * 60, exclusive=True)
+    scheduler.start()
+    yield
+    scheduler.stop()
+    # 结束所有 SSE 连接，避免阻塞退出
+    event_bus.close()
+    # 处理完队列中剩余的剪贴板更新
+    ingest_queue.stop()
+    # 关闭缩略图进程池
+    thumbnails.shutdown()
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="Clipboard History Server",
     description="剪贴板历史记录查看系统（集成 WebDAV 服务端）",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 运行指标：记录请求耗时和 SQL 执行耗时
+if Config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+# 按请求开启的性能分析（?profile=1）
+if Config.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # 登录请求模型
 class LoginRequest(BaseModel):
     username: str
@@ -31,8 +77,8 @@ class LoginRequest(BaseModel):
 @app.post("/api/login")
 async def login(request: LoginRequest, response: Response):
     """用户登录"""
-    if verify_credentials(request.username, request.password):
-        session_id = create_session(request.username)
+    if await verify_credentials_async(request.username, request.password):
+        session_id = await run_in_threadpool(create_session, request.username)
         response = JSONResponse(content={"message": "登录成功"})
         response.set_cookie(
             key=SESSION_COOKIE_NAME,
@@ -54,7 +100,7 @@ async def logout(request: Request, response: Response):
     """用户登出"""
     session_id = request.cookies.get(SESSION_COOKIE_NAME)
     if session_id:
-        delete_session(session_id)
+        await run_in_threadpool(delete_session, session_id)
     response = JSONResponse(content={"message": "已登出"})
     response.delete_cookie(SESSION_COOKIE_NAME)
     return response
@@ -71,10 +117,30 @@ async def check_auth(request: Request):
 
 # 注册 API 路由（需要认证）
 app.include_router(history_router)
+app.include_router(events_router)
+app.include_router(transfer_router)
+if Config.METRICS_ENABLED:
+    app.include_router(metrics_router)
 
-# 挂载 WebDAV 服务（通过 a2wsgi 适配）
+# 挂载 WebDAV 服务（通过 a2wsgi 适配），SyncClipboard 的读写请求走快速通道
 webdav_app = create_webdav_app()
-app.mount("/dav", WSGIMiddleware(webdav_app))
+if Config.DAV_FASTPATH_ENABLED:
+    app.mount("/dav", DAVFastPath(webdav_app, WSGIMiddleware(webdav_app)))
+else:
+    app.mount("/dav", WSGIMiddleware(webdav_app))
+
+def _collect_dav_cache():
+    cache = webdav_app.provider_map["/"].hot_cache
+    if cache is None:
+        return []
+    data = cache.metrics()
+    return [
+        metrics.counter("clipserver_dav_cache_lookups_total", "WebDAV 内存缓存查询次数",
+                        [({"result": "hit"}, data["hits"]), ({"result": "miss"}, data["misses"])]),
+        metrics.gauge("clipserver_dav_cache_bytes", "WebDAV 内存缓存占用字节数", [({}, data["bytes"])]),
+    ]
+
+metrics.registry.add_collector(_collect_dav_cache)
 
 # 根路由重定向
 @app.get("/")
@@ -103,9 +169,18 @@ if __name__ == "__main__":
     print(f"Username: {Config.USERNAME}")
     print(f"Password: {'*' * len(Config.PASSWORD)}")
     
+    reload = Config.RELOAD
+    if reload and Config.WORKERS > 1:
+        print("RELOAD 不能与多进程同时使用，已关闭 RELOAD")
+        reload = False
+    if Config.WORKERS > 1 and Config.SESSION_BACKEND == "memory":
+        print("警告: SESSION_BACKEND=memory 时会话不在进程间共享，多进程部署请使用 sqlite 或 file")
+    print(f"Workers: {Config.WORKERS}")
+    
     uvicorn.run(
         "main:app",
         host=Config.HOST,
         port=Config.PORT,
-        reload=True
+        reload=reload,
+        workers=Config.WORKERS
     )
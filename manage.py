@@ -0,0 +1,249 @@
+"""
+命令行管理工具
+
+用法:
+    python manage.py rebuild-stats    # 根据历史记录重建统计信息
+    python manage.py rebuild-fts      # 重建全文搜索索引
+    python manage.py dedupe-history   # 旧版历史文件迁移到去重存储
+    python manage.py generate-thumbnails  # 为已有图片生成缩略图并补充尺寸
+    python manage.py maintenance      # 执行保留策略、清理孤立文件并整理数据库
+    python manage.py hash-password    # 生成 CLIP_PASSWORD_HASH
+    python manage.py export --rows history.ndjson --files files.tar  # 导出记录和文件
+    python manage.py import --files files.tar --rows history.ndjson  # 导入（先文件后记录）
+    python manage.py compress --files # 压缩已有的大文本（和文件），输出压缩率
+    python manage.py dedupe-text      # 按 DEDUP_MODE 合并已有的重复文本记录
+"""
+import argparse
+import json
+from models import SessionLocal, init_db
+
+
+def cmd_rebuild_stats(args):
+    """重建 clipboard_stats 统计表"""
+    from stats import rebuild_stats
+
+    db = SessionLocal()
+    try:
+        result = rebuild_stats(db)
+    finally:
+        db.close()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def cmd_rebuild_fts(args):
+    """重建全文搜索索引（旧数据回填或索引损坏时使用）"""
+    from search import rebuild_fts
+
+    count = rebuild_fts()
+    print(f"已索引 {count} 条记录")
+
+
+def cmd_dedupe_history(args):
+    """把 history/ 中的旧文件迁移到内容寻址存储并去重"""
+    from blobstore import dedupe_history
+
+    db = SessionLocal()
+    try:
+        report = dedupe_history(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+    report["mb_reclaimed"] = round(report["bytes_reclaimed"] / 1048576, 2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def cmd_generate_thumbnails(args):
+    """为已有图片记录生成默认宽度缩略图，并补充图片尺寸"""
+    import thumbnails
+    from config import Config
+    from models import ClipboardHistory
+
+    if not thumbnails.available():
+        raise SystemExit("未安装 Pillow，无法生成缩略图")
+
+    db = SessionLocal()
+    report = {"images": 0, "generated": 0, "failed": 0}
+    last_id = 0
+    try:
+        while True:
+            items = db.query(ClipboardHistory)\
+                      .filter(ClipboardHistory.id > last_id)\
+                      .filter(ClipboardHistory.type.in_(["Image", "File"]))\
+                      .filter(ClipboardHistory.file_path.isnot(None))\
+                      .order_by(ClipboardHistory.id)\
+                      .limit(500)\
+                      .all()
+            if not items:
+                break
+            last_id = items[-1].id
+
+            for item in items:
+                if not item.file_hash or not thumbnails.is_image(item.type, item.content):
+                    continue
+                report["images"] += 1
+                size = thumbnails.prepare(Config.DATA_DIR / item.file_path, item.file_hash)
+                if size:
+                    report["generated"] += 1
+                    item.image_width, item.image_height = size
+                else:
+                    report["failed"] += 1
+            db.commit()
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def cmd_maintenance(args):
+    """立即执行一次维护任务（与后台定时任务相同）"""
+    from retention import run_maintenance
+
+    report = run_maintenance(force_vacuum=args.vacuum)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def cmd_hash_password(args):
+    """生成密码哈希，写入 CLIP_PASSWORD_HASH 后可以不再配置明文密码"""
+    import getpass
+    from auth import hash_password
+
+    password = getpass.getpass("密码: ")
+    if password != getpass.getpass("再次输入: "):
+        raise SystemExit("两次输入的密码不一致")
+    print(hash_password(password, iterations=args.iterations))
+
+
+def _parse_date(value):
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        raise SystemExit(f"无效的日期: {value}")
+
+
+def cmd_export(args):
+    """导出历史记录（NDJSON）和记录引用的文件（tar）"""
+    import transfer
+
+    if not (args.rows or args.files):
+        raise SystemExit("至少需要 --rows 或 --files")
+    filters = (args.type, _parse_date(args.start_date), _parse_date(args.end_date))
+    report = {}
+    for path, export, key in ((args.rows, transfer.export_rows, "rows_bytes"),
+                              (args.files, transfer.export_files, "files_bytes")):
+        if not path:
+            continue
+        size = 0
+        with open(path, "wb") as f:
+            for chunk in export(*filters):
+                f.write(chunk)
+                size += len(chunk)
+        report[key] = size
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def cmd_import(args):
+    """导入 export 生成的文件和记录（先导入文件，记录才能引用到）"""
+    import transfer
+
+    if not (args.rows or args.files):
+        raise SystemExit("至少需要 --rows 或 --files")
+    report = {}
+    if args.files:
+        with open(args.files, "rb") as f:
+            report["files"] = transfer.import_files(f)
+    if args.rows:
+        with open(args.rows, "rb") as f:
+            report["rows"] = transfer.import_rows(f, batch_size=args.batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def cmd_compress(args):
+    """按当前压缩配置压缩已有记录，并输出压缩情况"""
+    import compression
+    from blobstore import compress_objects
+    from config import Config
+
+    if not Config.COMPRESSION_ENABLED:
+        raise SystemExit("请先设置 COMPRESSION_ENABLED=true")
+
+    db = SessionLocal()
+    try:
+        texts = compression.compress_texts(db)
+        print(f"已压缩 {texts} 条文本记录")
+        if args.files:
+            print(json.dumps(compress_objects(db), ensure_ascii=False, indent=2))
+        print(json.dumps(compression.report(db), ensure_ascii=False, indent=2))
+    finally:
+        db.close()
+
+
+def cmd_dedupe_text(args):
+    """按当前 DEDUP_MODE 合并已有的重复文本记录"""
+    import dedup
+    from config import Config
+
+    if not dedup.enabled():
+        raise SystemExit(f"DEDUP_MODE={Config.DEDUP_MODE}，未开启重复文本合并")
+
+    db = SessionLocal()
+    try:
+        report = dedup.merge_existing(db)
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clipboard History Server 管理工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("rebuild-stats", help="根据历史记录重建统计信息")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = subparsers.add_parser("rebuild-fts", help="重建全文搜索索引")
+    p.set_defaults(func=cmd_rebuild_fts)
+
+    p = subparsers.add_parser("dedupe-history", help="旧版历史文件迁移到去重存储")
+    p.add_argument("--dry-run", action="store_true", help="只统计，不修改文件和数据库")
+    p.set_defaults(func=cmd_dedupe_history)
+
+    p = subparsers.add_parser("generate-thumbnails", help="为已有图片生成缩略图并补充尺寸")
+    p.set_defaults(func=cmd_generate_thumbnails)
+
+    p = subparsers.add_parser("maintenance", help="执行保留策略、清理孤立文件并整理数据库")
+    p.add_argument("--vacuum", action="store_true", help="无论空闲页比例多少都执行 VACUUM")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = subparsers.add_parser("hash-password", help="生成 CLIP_PASSWORD_HASH")
+    p.add_argument("--iterations", type=int, default=None, help="PBKDF2 迭代次数（默认 AUTH_HASH_ITERATIONS）")
+    p.set_defaults(func=cmd_hash_password, skip_db=True)
+
+    p = subparsers.add_parser("export", help="导出历史记录（NDJSON）和文件（tar）")
+    p.add_argument("--rows", help="记录输出文件")
+    p.add_argument("--files", help="文件输出的 tar 文件")
+    p.add_argument("--type", help="类型筛选: Text/Image/File/Group")
+    p.add_argument("--start-date", help="开始时间（ISO 格式）")
+    p.add_argument("--end-date", help="结束时间（ISO 格式）")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser("import", help="导入 export 生成的记录和文件，重复记录跳过")
+    p.add_argument("--rows", help="NDJSON 记录文件")
+    p.add_argument("--files", help="tar 文件（先于记录导入）")
+    p.add_argument("--batch-size", type=int, default=5000, help="每个事务插入的记录数")
+    p.set_defaults(func=cmd_import)
+
+    p = subparsers.add_parser("compress", help="压缩已有的大文本和文件，输出压缩率")
+    p.add_argument("--files", action="store_true", help="同时压缩已有的非图片文件")
+    p.set_defaults(func=cmd_compress)
+
+    p = subparsers.add_parser("dedupe-text", help="按 DEDUP_MODE 合并已有的重复文本记录")
+    p.set_defaults(func=cmd_dedupe_text)
+
+    args = parser.parse_args()
+    if not getattr(args, "skip_db", False):
+        init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+运行指标（Prometheus 文本格式）
+
+进程内收集请求延迟、WebDAV 请求数、入库各阶段耗时和 SQL 执行耗时；
+记录数、会话数等当前值由注册的收集函数在输出 /metrics 时读取。
+多进程部署时各工作进程分别统计，/metrics 返回处理该请求的进程的数据。
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+from sqlalchemy import event
+from config import Config
+
+# 延迟直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Sample(NamedTuple):
+    name: str
+    labels: Dict[str, str]
+    value: float
+
+
+class MetricFamily(NamedTuple):
+    """一个指标的说明和所有样本"""
+    name: str
+    type: str  # counter / gauge / histogram
+    help: str
+    samples: List[Sample]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增计数器"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            values = dict(self._values)
+        samples = [Sample(self.name, dict(zip(self.labels, key)), value) for key, value in values.items()]
+        return MetricFamily(self.name, "counter", self.help, samples)
+
+
+class Histogram:
+    """按标签分组的延迟直方图"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各桶计数..., 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        samples = []
+        for key, values in series.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                samples.append(Sample(f"{self.name}_bucket", {**labels, "le": _format_value(upper)}, cumulative))
+            samples.append(Sample(f"{self.name}_sum", labels, values[-2]))
+            samples.append(Sample(f"{self.name}_count", labels, values[-1]))
+        return MetricFamily(self.name, "histogram", self.help, samples)
+
+
+def gauge(name: str, help: str, values: Iterable[Tuple[Dict[str, str], float]]) -> MetricFamily:
+    """由收集函数生成的当前值"""
+    return MetricFamily(name, "gauge", help, [Sample(name, labels, value) for labels, value in values])
+
+
+def counter(name: str, help: str, values: Iterable[Tuple[Dict[str, str], float]]) -> MetricFamily:
+    """由收集函数读取的累计值（如组件自身维护的计数）"""
+    return MetricFamily(name, "counter", help, [Sample(name, labels, value) for labels, value in values])
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]):
+        """注册收集函数，输出指标时调用；收集失败只记录日志"""
+        self._collectors.append(collector)
+
+    def collect(self) -> List[MetricFamily]:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"[Metrics] 收集指标失败: {e}")
+        return families
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for family in self.collect():
+            lines.append(f"# HELP {family.name} {_escape(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for sample in family.samples:
+                labels = ",".join(f'{key}="{_escape(value)}"' for key, value in sample.labels.items())
+                name = f"{sample.name}{{{labels}}}" if labels else sample.name
+                lines.append(f"{name} {_format_value(sample.value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "clipserver_http_request_duration_seconds", "HTTP 请求耗时（按路由）", ("method", "route", "status")))
+DAV_REQUESTS = registry.register(Counter(
+    "clipserver_dav_requests_total", "WebDAV 请求数（handler 为 fastpath 或 wsgidav）",
+    ("method", "handler", "status")))
+INGEST_STAGE = registry.register(Histogram(
+    "clipserver_ingest_stage_seconds", "剪贴板入库各阶段耗时（parse / file / thumbnail / commit）", ("stage",)))
+DB_QUERY = registry.register(Histogram(
+    "clipserver_db_query_duration_seconds", "SQL 语句执行耗时（按语句类型）", ("operation",)))
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "WITH", "BEGIN", "COMMIT", "ANALYZE", "VACUUM"}
+
+# 由 WebDAV 快速通道在 scope 中标记，用于区分处理方式
+DAV_HANDLER_SCOPE_KEY = "clipserver.dav_handler"
+
+
+def instrument_engine(engine):
+    """通过 SQLAlchemy 事件记录每条 SQL 的执行耗时"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        DB_QUERY.observe(time.perf_counter() - start, operation if operation in SQL_OPERATIONS else "OTHER")
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+def _route_label(scope, path: str) -> str:
+    """路由模板作为标签（避免原始路径导致标签数量无限增长）"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if path == "/dav" or path.startswith("/dav/"):
+        return "/dav"
+    return "static"
+
+
+class MetricsMiddleware:
+    """记录每个请求的耗时和状态码，并打印慢请求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # 路由匹配 Mount 后会改写 scope["path"]，先保存原始路径
+        path = scope["path"]
+        start = time.perf_counter()
+        response = {"status": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streaming"] = any(key == b"content-type" and value.startswith(b"text/event-stream")
+                                            for key, value in message.get("headers", []))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"]
+            status = str(response["status"])
+            route = _route_label(scope, path)
+            REQUEST_DURATION.observe(duration, method, route, status)
+            if route == "/dav":
+                DAV_REQUESTS.inc(method, scope.get(DAV_HANDLER_SCOPE_KEY, "wsgidav"), status)
+            if not response["streaming"] and duration * 1000 >= Config.SLOW_REQUEST_MS > 0:
+                print(f"[Metrics] 慢请求 {method} {path} {status} {duration * 1000:.0f}ms")
@@ -1,54 +1,258 @@
+import hashlib
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Index, create_engine
+from sqlalchemy import Boolean, Column, Integer, LargeBinary, String, Text, DateTime, Index, create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import Config
+from locks import FileLock
+import compression
+import thumbnails
 
 Base = declarative_base()
 
+def text_hash(content) -> str:
+    """文本内容的 SHA-256（content_hash 列）"""
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+def _clip_hash(content, content_z):
+    return text_hash(compression.full_text(content, content_z))
+
+def _default_last_seen(context):
+    """新记录的最近出现时间默认等于创建时间"""
+    return context.get_current_parameters().get("created_at") or datetime.utcnow()
+
 class ClipboardHistory(Base):
     """剪贴板历史记录模型"""
     __tablename__ = "clipboard_history"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     type = Column(String(20), nullable=False, index=True)  # Text/Image/File/Group
-    content = Column(Text)  # 文本内容或文件名
+    content = Column(Text)  # 文本内容或文件名（文本压缩保存时为开头的预览）
     file_path = Column(String(500))  # 文件在 history 目录中的路径
-    file_hash = Column(String(64))  # 文件哈希值
-    file_size = Column(Integer)  # 文件大小（字节）
+    file_hash = Column(String(64))  # 文件内容的 SHA-256
+    file_size = Column(Integer)  # 文件大小（字节）；压缩保存的文本为原文的 UTF-8 字节数
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     extra_data = Column(Text)  # JSON 格式的额外元数据（改名避免与 metadata 冲突）
+    favorited = Column(Boolean, nullable=False, default=False, server_default=text("0"))  # 是否收藏
+    image_width = Column(Integer)  # 图片宽度（像素）
+    image_height = Column(Integer)  # 图片高度（像素）
+    content_z = Column(LargeBinary)  # 压缩保存的完整文本（未压缩时为空）
+    content_length = Column(Integer)  # 压缩保存的文本的字符数
+    content_hash = Column(String(64))  # 文本完整内容的 SHA-256（入库时合并重复文本）
+    last_seen_at = Column(DateTime, default=_default_last_seen)  # 最近一次出现的时间
+    occurrences = Column(Integer, nullable=False, default=1, server_default=text("1"))  # 出现次数
     
     # 组合索引，优化常见查询
     __table_args__ = (
         Index('idx_created_type', 'created_at', 'type'),
+        Index('idx_type_created', 'type', 'created_at'),  # 按类型筛选后按时间分页
+        Index('idx_favorited_created', 'favorited', 'created_at'),  # 收藏筛选
+        Index('idx_file_path', 'file_path'),  # 删除时检查文件是否仍被引用
+        Index('idx_content_hash', 'content_hash', 'last_seen_at'),  # 查找重复文本
+        Index('idx_last_seen', 'last_seen_at', 'id'),  # 按最近出现时间排序
+        Index('idx_type_last_seen', 'type', 'last_seen_at'),  # 删除后重新计算各类型的最新时间
+        Index('idx_compressed', 'id', sqlite_where=text('content_z IS NOT NULL')),  # 搜索时解压匹配压缩的文本
     )
     
+    def full_content(self):
+        """完整文本（压缩保存时解压）"""
+        return compression.full_text(self.content, self.content_z)
+    
     def to_dict(self):
         """转换为字典"""
         return {
             "id": self.id,
             "type": self.type,
-            "content": self.content,
+            "content": self.full_content(),
             "file_path": self.file_path,
             "file_hash": self.file_hash,
             "file_size": self.file_size,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "extra_data": self.extra_data
+            "extra_data": self.extra_data,
+            "favorited": bool(self.favorited),
+            "image_width": self.image_width,
+            "image_height": self.image_height,
+            "last_seen_at": self.last_seen_at.isoformat() if self.last_seen_at else None,
+            "occurrences": self.occurrences,
+            "thumb_url": thumbnails.thumb_url(self.id)
+                if self.file_path and thumbnails.is_image(self.type, self.content) else None
         }
 
+class ClipboardStats(Base):
+    """按类型汇总的统计信息（随插入/删除增量维护，避免全表 COUNT）"""
+    __tablename__ = "clipboard_stats"
+    
+    type = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)  # 记录数
+    total_bytes = Column(Integer, nullable=False, default=0)  # 文本字节数或文件大小之和
+    latest_at = Column(DateTime)  # 该类型最新记录时间
+
+class ClipboardChange(Base):
+    """历史记录变更日志（由触发器写入，供 /api/history/changes 增量同步）"""
+    __tablename__ = "clipboard_changes"
+    
+    version = Column(Integer, primary_key=True, autoincrement=True)  # 单调递增的变更版本
+    record_id = Column(Integer, nullable=False)  # 变化的记录 ID
+    op = Column(String(10), nullable=False)  # insert/update/delete
+    
+    __table_args__ = {"sqlite_autoincrement": True}  # 删除旧日志后版本号也不会重复使用
+
+class UserSession(Base):
+    """登录会话（SESSION_BACKEND=sqlite 时使用，多个工作进程共享）"""
+    __tablename__ = "sessions"
+    
+    token_hash = Column(String(64), primary_key=True)  # 会话 ID 的 SHA-256，不保存原始 ID
+    username = Column(String(255), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 # 创建数据库引擎
 engine = create_engine(
     f"sqlite:///{Config.DB_PATH}",
-    connect_args={"check_same_thread": False}
+    connect_args={
+        "check_same_thread": False,
+        "timeout": Config.DB_BUSY_TIMEOUT_MS / 1000
+    },
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT
 )
 
+def sqlite_pragmas() -> dict:
+    """每个新连接执行的 PRAGMA"""
+    return {
+        "journal_mode": Config.DB_JOURNAL_MODE,
+        "synchronous": Config.DB_SYNCHRONOUS,
+        "cache_size": -Config.DB_CACHE_SIZE_KB,  # 负数表示以 KiB 为单位
+        "mmap_size": Config.DB_MMAP_SIZE_MB * 1024 * 1024,
+        "busy_timeout": Config.DB_BUSY_TIMEOUT_MS,
+    }
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """新建连接时注册函数并应用 PRAGMA（journal_mode=WAL 会持久化到数据库文件）"""
+    # 搜索压缩保存的文本时通过 clip_text() 解压匹配（只在查询中使用，触发器不依赖应用注册的函数）
+    dbapi_connection.create_function("clip_text", 2, compression.full_text, deterministic=True)
+    # 旧数据库补充 content_hash 时使用
+    dbapi_connection.create_function("clip_hash", 2, _clip_hash, deterministic=True)
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 旧数据库新增列后的回填语句，按 id 区间分批执行，避免长时间持有写锁
+COLUMN_BACKFILLS = {
+    # 收藏状态原先保存在 extra_data JSON 中，迁移到独立列后从 JSON 中移除
+    ("clipboard_history", "favorited"): """
+        UPDATE clipboard_history
+        SET favorited = 1,
+            extra_data = NULLIF(json_remove(extra_data, '$.favorited'), '{}')
+        WHERE id BETWEEN :lo AND :hi
+          AND json_valid(extra_data)
+          AND json_extract(extra_data, '$.favorited') = 1
+    """,
+    ("clipboard_history", "content_hash"): """
+        UPDATE clipboard_history
+        SET content_hash = clip_hash(content, content_z)
+        WHERE id BETWEEN :lo AND :hi AND type = 'Text'
+    """,
+    ("clipboard_history", "last_seen_at"): """
+        UPDATE clipboard_history
+        SET last_seen_at = created_at
+        WHERE id BETWEEN :lo AND :hi AND last_seen_at IS NULL
+    """,
+}
+BACKFILL_BATCH_SIZE = 5000
+
+# last_seen_at 只有 Python 端默认值：直接 INSERT 且未提供时（脚本、基准测试等）插入后补为创建时间，
+# 否则按最近出现时间排序、游标分页和保留策略都会漏掉这些记录
+LAST_SEEN_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS clipboard_last_seen_ai AFTER INSERT ON clipboard_history
+    WHEN new.last_seen_at IS NULL BEGIN
+        UPDATE clipboard_history SET last_seen_at = new.created_at WHERE id = new.id;
+    END
+"""
+
+def _add_missing_columns():
+    """给已存在的表补充模型中新增的列，并按需回填数据"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            column_type = column.type.compile(dialect=engine.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg.text}" if not column.nullable \
+                    else f" DEFAULT {column.server_default.arg.text}"
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+            print(f"[DB] 已添加列 {table.name}.{column.name}")
+            
+            backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+            if backfill:
+                _run_backfill(table.name, backfill)
+
+def _run_backfill(table_name: str, statement: str):
+    """按 id 区间分批执行回填语句，每批单独提交"""
+    with engine.connect() as conn:
+        max_id = conn.execute(text(f"SELECT max(id) FROM {table_name}")).scalar() or 0
+    for lo in range(1, max_id + 1, BACKFILL_BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(text(statement), {"lo": lo, "hi": lo + BACKFILL_BATCH_SIZE - 1})
+
+def _ensure_last_seen():
+    """创建补充 last_seen_at 的触发器，并回填已有的空值"""
+    with engine.begin() as conn:
+        conn.execute(text(LAST_SEEN_TRIGGER))
+        missing = conn.execute(text(
+            "SELECT 1 FROM clipboard_history WHERE last_seen_at IS NULL LIMIT 1"
+        )).first()
+    if missing:
+        _run_backfill("clipboard_history", COLUMN_BACKFILLS[("clipboard_history", "last_seen_at")])
+        print("[DB] 已补充缺失的 last_seen_at")
+
 def init_db():
-    """初始化数据库"""
+    """初始化数据库（多个工作进程同时启动时依次执行）"""
+    with FileLock(Config.LOCK_DIR / "init_db.lock"):
+        _init_db()
+
+def _init_db():
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+    if journal_mode.lower() != Config.DB_JOURNAL_MODE.lower():
+        print(f"[DB] 无法启用 journal_mode={Config.DB_JOURNAL_MODE}，当前为 {journal_mode}")
+    
     Base.metadata.create_all(bind=engine)
+    
+    # create_all 不会给已存在的表补充新增的列
+    _add_missing_columns()
+    
+    # create_all 不会给已存在的表补建索引，这里逐个检查
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    _ensure_last_seen()
+    
+    # 旧数据库首次启动时生成统计信息
+    from stats import ensure_stats
+    ensure_stats()
+    
+    # 全文索引及同步触发器
+    from search import ensure_fts
+    ensure_fts()
+    
+    # 增量同步的变更日志触发器
+    from changes import ensure_changelog
+    ensure_changelog()
 
 def get_db():
     """获取数据库会话（用于依赖注入）"""
@@ -0,0 +1,133 @@
+"""
+按请求开启的性能分析
+
+PROFILING_ENABLED=true 时，带 ?profile=1 参数或 X-Profile: 1 头的 API 请求会用 cProfile
+分析处理函数的执行（同步处理函数在线程池中执行，分析器在该线程中开启），
+请求结束后把 pstats 数据（.prof，可用 snakeviz 等工具查看）和按累计耗时排序的文本报告
+保存到 PROFILE_DIR。异步处理函数在 await 期间，同一事件循环上的其他任务也会被计入。
+
+同一线程（Python 3.12 起为整个进程）同时只能有一个分析器：异步处理函数共用事件循环线程，
+同一时间只分析一个，其他同时到达的请求不分析；开启分析器失败时同样跳过本次分析。
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import re
+import time
+from urllib.parse import parse_qs
+import anyio
+from fastapi.routing import APIRoute
+from config import Config
+
+# 当前请求的分析器列表（None 表示当前请求不需要分析）
+_profilers: contextvars.ContextVar = contextvars.ContextVar("profilers", default=None)
+
+# 事件循环线程上正在分析的异步处理函数
+_async_lock = asyncio.Lock()
+
+
+def _start(profilers: list):
+    """开启分析器；已有分析器在运行（Python 3.12+ 会报错）时返回 None，本次不分析"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        print("[Profile] 已有分析器在运行，跳过本次分析")
+        return None
+    profilers.append(profiler)
+    return profiler
+
+
+def profiled(endpoint):
+    """包装处理函数：当前请求需要分析时，在执行处理函数的线程中开启 cProfile"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            profilers = _profilers.get()
+            if profilers is None:
+                return await endpoint(*args, **kwargs)
+            if _async_lock.locked():
+                # 同一线程上再开启分析器会覆盖（3.11）或报错（3.12+）正在进行的分析
+                print("[Profile] 已有异步请求正在分析，跳过本次分析")
+                return await endpoint(*args, **kwargs)
+            async with _async_lock:
+                profiler = _start(profilers)
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profilers = _profilers.get()
+        if profilers is None:
+            return endpoint(*args, **kwargs)
+        profiler = _start(profilers)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """开启性能分析时包装处理函数的路由类（APIRouter(route_class=ProfiledRoute)）"""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint) if Config.PROFILING_ENABLED else endpoint, **kwargs)
+
+
+def _requested(scope) -> bool:
+    for key, value in scope["headers"]:
+        if key == b"x-profile" and value.strip() in (b"1", b"true"):
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[0] in ("1", "true")
+
+
+def write_report(profilers, method: str, path: str) -> str:
+    """合并分析结果并保存，返回文本报告的路径"""
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+
+    Config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    base = Config.PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_{method}_{name}"
+    stats.dump_stats(f"{base}.prof")
+
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats("cumulative").print_stats(Config.PROFILE_TOP_N)
+    report = f"{base}.txt"
+    with open(report, "w", encoding="utf-8") as f:
+        f.write(f"{method} {path}\n\n{text.getvalue()}")
+    return report
+
+
+class ProfilingMiddleware:
+    """为带分析标记的请求准备分析器，请求结束后保存报告"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        profilers = []
+        token = _profilers.set(profilers)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _profilers.reset(token)
+            if profilers:
+                report = await anyio.to_thread.run_sync(write_report, profilers, scope["method"], path)
+                print(f"[Profile] {scope['method']} {path} 分析报告: {report}")
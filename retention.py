@@ -0,0 +1,230 @@
+"""
+保留策略与存储整理
+
+后台维护任务依次执行：
+1. 保留策略：按最长保留时间、最大记录数、每种类型的最大字节数删除最旧的记录（收藏默认不删除）；
+   记录的新旧按最近出现时间 last_seen_at 判断，反复出现的文本不会因创建较早被删除
+2. 一致性清理：删除文件已丢失的记录，以及没有记录引用的 history 文件和缩略图
+3. 变更日志：只保留最近 CHANGELOG_MAX_ROWS 条（增量同步）
+4. 数据库整理：ANALYZE / PRAGMA optimize，空闲页比例较高时 VACUUM
+删除按批次进行，每批一个短事务，不会长时间占用写锁。
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+from sqlalchemy.orm import Session
+from config import Config
+from models import ClipboardHistory, SessionLocal, engine
+import blobstore
+import changes
+import deletion
+import search
+import stats
+
+# 文件可能已写入对象存储但记录尚未提交，修改时间在该时间内的文件不当作孤立文件
+ORPHAN_GRACE_SECONDS = 3600
+
+# 挑选待删除记录时读取的列（计算字节数、检查文件是否存在）
+CANDIDATE_COLUMNS = (
+    ClipboardHistory.id,
+    ClipboardHistory.type,
+    ClipboardHistory.content,
+    ClipboardHistory.file_size,
+    ClipboardHistory.file_path,
+    ClipboardHistory.created_at,
+)
+
+
+def delete_rows(db: Session, rows) -> int:
+    """删除一批记录（分块短事务，关联文件在提交后由后台线程删除）"""
+    return len(deletion.delete_ids(db, [row.id for row in rows]))
+
+
+def _oldest(db: Session, *filters, limit: int):
+    """按最近出现时间从旧到新取可删除的记录"""
+    query = db.query(*CANDIDATE_COLUMNS).filter(*filters)
+    if Config.RETENTION_KEEP_FAVORITES:
+        query = query.filter(ClipboardHistory.favorited == False)  # noqa: E712
+    return query.order_by(ClipboardHistory.last_seen_at, ClipboardHistory.id).limit(limit).all()
+
+
+def enforce_max_age(db: Session, days: int) -> int:
+    """删除超过保留天数没有再出现的记录"""
+    # 时间按配置时区的本地时间保存（不带时区信息）
+    cutoff = datetime.now(ZoneInfo(Config.TIMEZONE)).replace(tzinfo=None) - timedelta(days=days)
+    deleted = 0
+    while True:
+        rows = _oldest(db, ClipboardHistory.last_seen_at < cutoff, limit=Config.RETENTION_BATCH_SIZE)
+        if not rows:
+            return deleted
+        deleted += delete_rows(db, rows)
+
+
+def enforce_max_rows(db: Session, max_rows: int) -> int:
+    """记录总数超过上限时删除最旧的记录"""
+    excess = stats.get_stats(db)["total_records"] - max_rows
+    deleted = 0
+    while excess > 0:
+        rows = _oldest(db, limit=min(Config.RETENTION_BATCH_SIZE, excess))
+        if not rows:
+            break
+        count = delete_rows(db, rows)
+        deleted += count
+        excess -= count
+    return deleted
+
+
+def enforce_max_bytes(db: Session, clip_type: str, max_bytes: int) -> int:
+    """某类型的总字节数超过上限时删除该类型最旧的记录"""
+    excess = stats.get_stats(db)["bytes_by_type"].get(clip_type, 0) - max_bytes
+    deleted = 0
+    while excess > 0:
+        rows = _oldest(db, ClipboardHistory.type == clip_type, limit=Config.RETENTION_BATCH_SIZE)
+        if not rows:
+            break
+        batch = []
+        for row in rows:
+            batch.append(row)
+            excess -= stats.record_bytes(row)
+            if excess <= 0:
+                break
+        deleted += delete_rows(db, batch)
+    return deleted
+
+
+def enforce_retention(db: Session) -> dict:
+    """执行所有已配置的保留策略"""
+    report = {}
+    if Config.RETENTION_MAX_AGE_DAYS > 0:
+        report["max_age"] = enforce_max_age(db, Config.RETENTION_MAX_AGE_DAYS)
+    if Config.RETENTION_MAX_ROWS > 0:
+        report["max_rows"] = enforce_max_rows(db, Config.RETENTION_MAX_ROWS)
+    for clip_type, max_mb in Config.RETENTION_MAX_MB_PER_TYPE.items():
+        report[f"max_bytes_{clip_type}"] = enforce_max_bytes(db, clip_type, max_mb * 1024 * 1024)
+    return report
+
+
+def remove_missing_file_rows(db: Session) -> int:
+    """删除关联文件已经不存在的记录"""
+    deleted = 0
+    last_id = 0
+    while True:
+        rows = db.query(*CANDIDATE_COLUMNS)\
+                 .filter(ClipboardHistory.id > last_id)\
+                 .filter(ClipboardHistory.file_path.isnot(None))\
+                 .order_by(ClipboardHistory.id)\
+                 .limit(Config.RETENTION_BATCH_SIZE)\
+                 .all()
+        if not rows:
+            return deleted
+        last_id = rows[-1].id
+        missing = [row for row in rows if not (Config.DATA_DIR / row.file_path).exists()]
+        if missing:
+            print(f"[Retention] {len(missing)} 条记录的文件已丢失，删除记录")
+            deleted += delete_rows(db, missing)
+
+
+def _old_files(directory: Path):
+    """遍历目录中超过保护期的文件"""
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = Path(root) / name
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat_result.st_mtime < cutoff:
+                yield path, stat_result.st_size
+
+
+def remove_orphan_files(db: Session) -> dict:
+    """删除没有记录引用的 history 文件和缩略图"""
+    report = {"files": 0, "thumbnails": 0, "bytes": 0}
+
+    # history 目录：先在不持锁的情况下找出候选文件，再持锁逐个确认后删除
+    referenced = {path for (path,) in db.query(ClipboardHistory.file_path)
+                                        .filter(ClipboardHistory.file_path.isnot(None))
+                                        .distinct()}
+    candidates = {}
+    for path, size in _old_files(Config.HISTORY_DIR):
+        rel_path = blobstore.relative_path(path)
+        if rel_path not in referenced:
+            candidates[rel_path] = size
+    if candidates:
+        with blobstore.lock:
+            orphaned = blobstore.unreferenced_paths(db, candidates)
+            blobstore.remove_files(orphaned)
+        report["files"] = len(orphaned)
+        report["bytes"] += sum(candidates[blobstore.relative_path(path)] for path in orphaned)
+
+    # 缩略图按文件哈希命名（<hash>_<width>.webp），可随时重新生成
+    hashes = {file_hash for (file_hash,) in db.query(ClipboardHistory.file_hash)
+                                              .filter(ClipboardHistory.file_path.isnot(None))
+                                              .distinct()}
+    stale = []
+    for path, size in _old_files(Config.THUMB_DIR):
+        if path.name.split("_", 1)[0] not in hashes:
+            stale.append(path)
+            report["bytes"] += size
+    blobstore.remove_files(stale)
+    report["thumbnails"] = len(stale)
+    return report
+
+
+def _database_bytes() -> int:
+    """数据库文件（含 WAL）的大小"""
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(f"{Config.DB_PATH}{suffix}")
+        except OSError:
+            pass
+    return total
+
+
+def optimize_database(force_vacuum: bool = False) -> dict:
+    """更新查询统计信息，空闲页较多时 VACUUM 回收空间"""
+    report = {"vacuumed": False, "bytes_before": _database_bytes()}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # 抽样 ANALYZE，大表上也只需要很短时间
+        conn.exec_driver_sql("PRAGMA analysis_limit=1000")
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql("PRAGMA optimize")
+        if search.fts_available:
+            conn.exec_driver_sql("INSERT INTO clipboard_fts(clipboard_fts) VALUES('optimize')")
+
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        freelist = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        report["free_percent"] = round(freelist * 100 / page_count, 1) if page_count else 0.0
+        if force_vacuum or report["free_percent"] >= Config.MAINTENANCE_VACUUM_FREE_PERCENT:
+            conn.exec_driver_sql("VACUUM")
+            report["vacuumed"] = True
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    report["bytes_after"] = _database_bytes()
+    report["bytes_reclaimed"] = max(0, report["bytes_before"] - report["bytes_after"])
+    return report
+
+
+def run_maintenance(force_vacuum: bool = False) -> dict:
+    """执行一次完整的维护：保留策略、一致性清理、变更日志清理、数据库整理"""
+    db = SessionLocal()
+    try:
+        report = {
+            "retention": enforce_retention(db),
+            "missing_file_rows": remove_missing_file_rows(db),
+            "orphans": remove_orphan_files(db),
+            "changelog_pruned": changes.prune_changes(db),
+        }
+    finally:
+        db.close()
+    report["database"] = optimize_database(force_vacuum)
+
+    deleted = sum(report["retention"].values()) + report["missing_file_rows"]
+    reclaimed_mb = (report["orphans"]["bytes"] + report["database"]["bytes_reclaimed"]) / 1048576
+    print(f"[Retention] 删除 {deleted} 条记录、{report['orphans']['files']} 个孤立文件，"
+          f"回收 {reclaimed_mb:.1f} MB")
+    return report
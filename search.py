@@ -0,0 +1,187 @@
+"""
+全文搜索（SQLite FTS5）
+
+clipboard_fts 是以 clipboard_history 为数据源的外部内容索引，使用 trigram 分词，中日韩文本也能按子串检索；
+索引通过 clipboard_history 上的触发器保持同步。触发器只读取普通列，不依赖应用注册的 SQL 函数，
+其他程序（sqlite3 命令行等）写入数据库时索引同样会更新。
+
+压缩保存的文本只有 content 中的预览进入索引，搜索时另外解压这些记录匹配完整文本
+（通过部分索引 idx_compressed 找到压缩的记录，记录数通常很少）。
+SQLite 不支持 FTS5 / trigram 时自动退回 LIKE 搜索。
+"""
+import html
+from sqlalchemy import and_, column, func, literal_column, select, table, text, union_all
+from sqlalchemy.exc import OperationalError
+from config import Config
+from models import ClipboardHistory, engine
+
+FTS_TABLE = "clipboard_fts"
+FTS_SOURCE = "clipboard_history"
+# 旧版索引的数据源视图（通过 clip_text() 读取完整文本，其他连接写入时会失败）
+OUTDATED_VIEW = "clipboard_fts_source"
+FTS_TRIGGERS = ("clipboard_fts_ai", "clipboard_fts_ad", "clipboard_fts_au")
+
+# trigram 分词至少需要 3 个字符才能使用索引
+MIN_QUERY_LENGTH = 3
+
+# 搜索摘要中标记命中位置的控制字符，输出前替换为 <mark>
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, extra_data,
+        content='{FTS_SOURCE}', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_fts_ai AFTER INSERT ON clipboard_history BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content, extra_data)
+        VALUES (new.id, new.content, new.extra_data);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_fts_ad AFTER DELETE ON clipboard_history BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, extra_data)
+        VALUES ('delete', old.id, old.content, old.extra_data);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_fts_au
+    AFTER UPDATE OF content, extra_data ON clipboard_history BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, extra_data)
+        VALUES ('delete', old.id, old.content, old.extra_data);
+        INSERT INTO {FTS_TABLE}(rowid, content, extra_data)
+        VALUES (new.id, new.content, new.extra_data);
+    END
+    """,
+]
+
+# 供查询使用的表对象
+fts_table = table(FTS_TABLE, column("rowid"), column("rank"))
+
+# 当前数据库是否可以使用全文索引（ensure_fts 后确定）
+fts_available = False
+
+
+def _drop_outdated(conn) -> bool:
+    """旧版索引以视图为数据源、触发器调用 clip_text()，删除后按新结构重建；返回是否删除"""
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE}
+    ).scalar()
+    if sql is not None and f"content='{FTS_SOURCE}'" in sql:
+        return False
+    for trigger in FTS_TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(text(f"DROP VIEW IF EXISTS {OUTDATED_VIEW}"))
+    if sql is None:
+        return False
+    conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+    return True
+
+
+def ensure_fts():
+    """创建全文索引和同步触发器；新建索引时对已有记录做一次回填"""
+    global fts_available
+
+    if not Config.SEARCH_FTS:
+        fts_available = False
+        return
+
+    try:
+        with engine.begin() as conn:
+            if _drop_outdated(conn):
+                print("[Search] 全文索引结构已更新，需要重建")
+            existed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE}
+            ).first() is not None
+            for statement in FTS_SCHEMA:
+                conn.execute(text(statement))
+            if not existed:
+                has_rows = conn.execute(text("SELECT 1 FROM clipboard_history LIMIT 1")).first()
+                if has_rows:
+                    print("[Search] 正在为已有记录建立全文索引...")
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        fts_available = True
+    except OperationalError as e:
+        # 编译 SQLite 时未启用 FTS5 或版本过旧（trigram 需要 3.34+）
+        print(f"[Search] 全文索引不可用，使用 LIKE 搜索: {e}")
+        fts_available = False
+
+
+def rebuild_fts() -> int:
+    """根据 clipboard_history 重建全文索引，返回索引的记录数"""
+    with engine.begin() as conn:
+        _drop_outdated(conn)
+        for statement in FTS_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        return conn.execute(text("SELECT count(*) FROM clipboard_history")).scalar()
+
+
+def can_use_fts(search: str) -> bool:
+    """搜索词是否可以走全文索引"""
+    return fts_available and len(search) >= MIN_QUERY_LENGTH
+
+
+def match_query(search: str) -> str:
+    """把搜索词转换为 FTS5 短语查询（trigram 下等价于子串匹配）"""
+    return '"' + search.replace('"', '""') + '"'
+
+
+def match_clause(search: str):
+    """WHERE clipboard_fts MATCH ? 条件"""
+    return literal_column(FTS_TABLE).op("MATCH")(match_query(search))
+
+
+def compressed_match(search: str):
+    """压缩保存的文本解压后包含搜索词（content_z 条件可以使用部分索引 idx_compressed）"""
+    return and_(
+        ClipboardHistory.content_z.isnot(None),
+        func.clip_text(ClipboardHistory.content, ClipboardHistory.content_z).contains(search)
+    )
+
+
+def matching_ids(search: str):
+    """命中搜索词的记录 id：全文索引命中的记录，加上完整文本命中的压缩记录"""
+    return union_all(
+        select(fts_table.c.rowid).where(match_clause(search)),
+        select(ClipboardHistory.id).where(compressed_match(search)),
+    )
+
+
+def rank_of(id_column, search: str):
+    """记录在全文索引中的相关度（越小越相关），只通过完整文本命中的压缩记录为 NULL"""
+    return select(fts_table.c.rank)\
+        .where(match_clause(search))\
+        .where(fts_table.c.rowid == id_column)\
+        .scalar_subquery()
+
+
+def snippet_html(snippet: str) -> str:
+    """转义摘要并用 <mark> 标出命中位置"""
+    if not snippet:
+        return snippet
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def get_snippets(db, search: str, ids, tokens: int = 32) -> dict:
+    """
+    为指定记录生成命中摘要，返回 {id: html}
+
+    snippet() 开销较大，只对当前页的记录单独计算，
+    避免在排序前为所有命中行生成摘要。
+    """
+    if not ids:
+        return {}
+    snippet = func.snippet(literal_column(FTS_TABLE), -1, _MARK_START, _MARK_END, "…", tokens)
+    rows = db.execute(
+        select(fts_table.c.rowid, snippet)
+        .where(match_clause(search))
+        .where(fts_table.c.rowid.in_(list(ids)))
+    ).all()
+    return {rowid: snippet_html(text_) for rowid, text_ in rows}
@@ -9,10 +9,30 @@ const state = {
     sortField: 'id',
     sortOrder: 'desc',
     isLoading: false,
-    selectedIds: []  // 选中的记录ID
+    liveUpdates: false,  // 是否已订阅服务端推送
+    selectedIds: [],  // 选中的记录ID
+    pageItems: [],  // 当前页的记录
+    visibleRange: null  // 虚拟列表当前渲染的行范围
+};
+
+// 本地缓存（cache.js）：就绪后未搜索时在本地筛选、排序和分页，搜索仍由服务端完成
+const cache = {
+    ready: false,
+    items: new Map(),  // id -> 列表项
+    version: null,  // 已同步到的变更版本
+    revision: 0,  // 缓存内容变化时递增
+    view: null,  // 当前筛选和排序的结果 { key, items }
+    syncing: false,
+    pending: false  // 同步期间又收到变化，结束后再同步一次
 };
 
 const API_BASE = '/api';
+const SYNC_PAGE_SIZE = 5000;  // 同步和重新加载时每次请求的记录数
+const ALL_PAGE_SIZE = 10000;  // "全部" 选项
+// 当前页超过 VIRTUAL_THRESHOLD 行时只渲染可见的行（行高固定为 ROW_HEIGHT）
+const VIRTUAL_THRESHOLD = 200;
+const VIRTUAL_OVERSCAN = 10;
+const ROW_HEIGHT = 65;
 
 // 格式化时间
 function formatTime(isoString) {
@@ -27,11 +47,35 @@ function formatTime(isoString) {
     });
 }
 
+// 时间单元格：重复出现的文本附带出现次数，悬停显示最近出现时间
+function timeHtml(item) {
+    if (!item.occurrences || item.occurrences <= 1) return formatTime(item.created_at);
+    return `<span title="最近出现: ${formatTime(item.last_seen_at)}">${formatTime(item.created_at)}</span>` +
+        `<span class="occurrences">×${item.occurrences}</span>`;
+}
+
+// 文本长度（列表模式下 content 为预览，使用服务端返回的 content_length）
+function textLength(item) {
+    return item.content_length ?? (item.content || '').length;
+}
+
+// 获取完整文本内容（列表中的预览被截断时向服务端请求）
+async function getFullContent(item) {
+    if (item.truncated) {
+        const res = await fetch(`${API_BASE}/history/${item.id}`);
+        if (!res.ok) throw new Error('获取完整内容失败');
+        const data = await res.json();
+        item.content = data.content;
+        item.truncated = false;
+    }
+    return item.content || '';
+}
+
 // 格式化大小/长度
-function formatSize(bytes, type, content) {
+function formatSize(bytes, type, length) {
     // 文本类型显示字符数
-    if (type === 'Text' && content) {
-        return content.length + ' 字符';
+    if (type === 'Text' && length) {
+        return length + ' 字符';
     }
 
     // 文件类型显示字节数
@@ -49,7 +93,7 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
-// 检查登录状态
+// 检查登录状态（已登录时返回用户名）
 async function checkAuth() {
     try {
         const res = await fetch('/api/check-auth');
@@ -59,7 +103,7 @@ async function checkAuth() {
             return false;
         }
         document.getElementById('username').textContent = data.username;
-        return true;
+        return data.username;
     } catch (e) {
         window.location.href = '/login.html';
         return false;
@@ -69,6 +113,7 @@ async function checkAuth() {
 // 登出
 async function logout() {
     await fetch('/api/logout', { method: 'POST' });
+    await historyCache.destroy();
     window.location.href = '/login.html';
 }
 
@@ -92,7 +137,8 @@ async function loadHistory() {
     try {
         const params = new URLSearchParams({
             page: state.currentPage,
-            page_size: state.pageSize
+            page_size: state.pageSize,
+            mode: 'list'
         });
 
         if (state.currentType) params.append('type', state.currentType);
@@ -102,109 +148,16 @@ async function loadHistory() {
         const res = await fetch(`${API_BASE}/history?${params}`);
         const data = await res.json();
 
+        // 加载期间本地缓存已就绪，由缓存显示
+        if (useCache()) return;
+
         state.totalRecords = data.total;
         document.getElementById('total-records').textContent = data.total;
 
-        if (data.items.length === 0) {
-            emptyState.style.display = 'block';
-        } else {
-            // 本地排序
-            let items = [...data.items];
-            if (state.sortField) {
-                items.sort((a, b) => {
-                    let va = a[state.sortField];
-                    let vb = b[state.sortField];
-                    if (state.sortField === 'created_at') {
-                        va = new Date(va).getTime();
-                        vb = new Date(vb).getTime();
-                    } else if (state.sortField === 'size') {
-                        // 大小排序：文本用字符数，其他用文件大小
-                        va = a.type === 'Text' ? (a.content || '').length : (a.file_size || 0);
-                        vb = b.type === 'Text' ? (b.content || '').length : (b.file_size || 0);
-                    }
-                    if (va < vb) return state.sortOrder === 'asc' ? -1 : 1;
-                    if (va > vb) return state.sortOrder === 'asc' ? 1 : -1;
-                    return 0;
-                });
-            }
-
-            items.forEach(item => {
-                const tr = document.createElement('tr');
-
-                const typeClass = item.type.toLowerCase();
-                const content = item.type === 'Text' ? item.content : item.content;
-                const contentPreview = content ? content.substring(0, 100) : '';
-                const hasMore = content && content.length > 100;
-
-                // 解析收藏状态
-                let favorited = false;
-                try {
-                    const extraData = item.extra_data ? JSON.parse(item.extra_data) : {};
-                    favorited = extraData.favorited || false;
-                } catch (e) { }
-
-                const isChecked = state.selectedIds.includes(item.id);
-
-                tr.innerHTML = `
-                    <td><input type="checkbox" class="row-checkbox" data-id="${item.id}" ${isChecked ? 'checked' : ''}></td>
-                    <td>${item.id}</td>
-                    <td><span class="type-tag ${typeClass}">${item.type}</span></td>
-                    <td class="content-cell" title="${hasMore ? '点击查看完整内容' : escapeHtml(content)}">
-                        ${escapeHtml(contentPreview)}${hasMore ? '<span class="ellipsis"> ···</span>' : ''}
-                    </td>
-                    <td>${formatSize(item.file_size, item.type, content)}</td>
-                    <td>${formatTime(item.created_at)}</td>
-                    <td style="text-align: center;"><button class="action-btn copy-btn" data-id="${item.id}" title="复制内容">复制</button></td>
-                    <td style="text-align: center;"><span class="favorite-btn ${favorited ? 'favorited' : ''}" data-id="${item.id}">★</span></td>
-                    <td style="text-align: center;">
-                        <button class="action-btn delete-btn" data-id="${item.id}" style="color:#ff4d4f;border-color:#ffccc7;">删除</button>
-                    </td>
-                `;
-
-                // 复选框事件
-                tr.querySelector('.row-checkbox').addEventListener('change', (e) => {
-                    if (e.target.checked) {
-                        if (!state.selectedIds.includes(item.id)) {
-                            state.selectedIds.push(item.id);
-                        }
-                    } else {
-                        state.selectedIds = state.selectedIds.filter(id => id !== item.id);
-                    }
-                    // Assuming updateBatchDeleteBtn and updateSelectAllCheckbox are defined elsewhere
-                    updateBatchDeleteBtn();
-                    updateSelectAllCheckbox();
-                });
-
-                // 点击内容单元格
-                tr.querySelector('.content-cell').addEventListener('click', () => {
-                    if (item.type === 'Text') {
-                        showTextModal(item.content);
-                    } else {
-                        handleRowClick(item);
-                    }
-                });
-
-                // 收藏按钮事件
-                tr.querySelector('.favorite-btn').addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    toggleFavorite(item.id, e.target);
-                });
-
-                // 复制按钮事件
-                tr.querySelector('.copy-btn').addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    copyContent(item, e);
-                });
-
-                // 删除按钮事件
-                tr.querySelector('.delete-btn').addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    deleteRecord(item.id);
-                });
-
-                tableBody.appendChild(tr);
-            });
-        }
+        // 本地排序
+        const items = [...data.items];
+        if (state.sortField) items.sort(compareItems);
+        renderRows(items);
 
         updatePagination();
     } catch (e) {
@@ -216,12 +169,166 @@ async function loadHistory() {
     }
 }
 
+// 排序值（created_at 为同一格式的 ISO 时间，可以直接按字符串比较）
+function sortValue(item, field) {
+    // 大小排序：文本用字符数，其他用文件大小
+    if (field === 'size') return item.type === 'Text' ? textLength(item) : (item.file_size || 0);
+    return item[field];
+}
+
+function compareItems(a, b) {
+    const order = state.sortOrder === 'asc' ? 1 : -1;
+    const va = sortValue(a, state.sortField);
+    const vb = sortValue(b, state.sortField);
+    if (va < vb) return -order;
+    if (va > vb) return order;
+    return (a.id - b.id) * order;
+}
+
+// 显示一页记录：行数较多时使用虚拟列表
+function renderRows(items) {
+    const container = document.querySelector('.table-container');
+    const tableBody = document.getElementById('table-body');
+    const virtual = items.length > VIRTUAL_THRESHOLD;
+
+    state.pageItems = items;
+    state.visibleRange = null;
+    container.classList.toggle('virtual', virtual);
+    document.getElementById('empty-state').style.display = items.length === 0 ? 'block' : 'none';
+
+    if (virtual) {
+        renderVisibleRows();
+    } else {
+        tableBody.innerHTML = '';
+        items.forEach(item => tableBody.appendChild(createRow(item)));
+    }
+    updateSelectAllCheckbox();
+}
+
+// 占位行（撑开虚拟列表中未渲染部分的高度）
+function spacerRow(height) {
+    const tr = document.createElement('tr');
+    tr.className = 'spacer-row';
+    tr.innerHTML = `<td colspan="9" style="height:${height}px"></td>`;
+    return tr;
+}
+
+// 虚拟列表：只渲染可见区域及上下少量行
+function renderVisibleRows() {
+    const container = document.querySelector('.table-container');
+    const items = state.pageItems;
+    const first = Math.max(0, Math.floor(container.scrollTop / ROW_HEIGHT) - VIRTUAL_OVERSCAN);
+    const last = Math.min(items.length, first + Math.ceil(container.clientHeight / ROW_HEIGHT) + VIRTUAL_OVERSCAN * 2);
+    const range = `${first}-${last}`;
+    if (state.visibleRange === range) return;
+    state.visibleRange = range;
+
+    const fragment = document.createDocumentFragment();
+    fragment.appendChild(spacerRow(first * ROW_HEIGHT));
+    for (let i = first; i < last; i++) {
+        fragment.appendChild(createRow(items[i]));
+    }
+    fragment.appendChild(spacerRow((items.length - last) * ROW_HEIGHT));
+
+    const tableBody = document.getElementById('table-body');
+    tableBody.innerHTML = '';
+    tableBody.appendChild(fragment);
+}
+
+// 创建表格行
+// 图片缩略图（懒加载，预先给出尺寸避免加载时表格抖动）
+const THUMB_HEIGHT = 40;
+
+function thumbnailHtml(item) {
+    if (!item.thumb_url) return '';
+    let size = '';
+    if (item.image_width && item.image_height) {
+        const height = Math.min(THUMB_HEIGHT, item.image_height);
+        const width = Math.max(1, Math.round(item.image_width * height / item.image_height));
+        size = ` width="${width}" height="${height}"`;
+    }
+    return `<img class="thumb" src="${item.thumb_url}" loading="lazy" decoding="async" alt=""${size}>`;
+}
+
+function createRow(item) {
+    const tr = document.createElement('tr');
+    tr.dataset.id = item.id;
+
+    const typeClass = item.type.toLowerCase();
+    const content = item.type === 'Text' ? item.content : item.content;
+    const contentPreview = content ? content.substring(0, 100) : '';
+    const hasMore = content && textLength(item) > 100;
+
+    const favorited = item.favorited || false;
+
+    const isChecked = state.selectedIds.includes(item.id);
+
+    tr.innerHTML = `
+        <td><input type="checkbox" class="row-checkbox" data-id="${item.id}" ${isChecked ? 'checked' : ''}></td>
+        <td>${item.id}</td>
+        <td><span class="type-tag ${typeClass}">${item.type}</span></td>
+        <td class="content-cell" title="${hasMore ? '点击查看完整内容' : escapeHtml(content)}">
+            ${thumbnailHtml(item)}${item.snippet ? item.snippet : escapeHtml(contentPreview) + (hasMore ? '<span class="ellipsis"> ···</span>' : '')}
+        </td>
+        <td>${formatSize(item.file_size, item.type, textLength(item))}</td>
+        <td class="time-cell" data-created="${item.created_at}">${timeHtml(item)}</td>
+        <td style="text-align: center;"><button class="action-btn copy-btn" data-id="${item.id}" title="复制内容">复制</button></td>
+        <td style="text-align: center;"><span class="favorite-btn ${favorited ? 'favorited' : ''}" data-id="${item.id}">★</span></td>
+        <td style="text-align: center;">
+            <button class="action-btn delete-btn" data-id="${item.id}" style="color:#ff4d4f;border-color:#ffccc7;">删除</button>
+        </td>
+    `;
+
+    // 复选框事件
+    tr.querySelector('.row-checkbox').addEventListener('change', (e) => {
+        if (e.target.checked) {
+            if (!state.selectedIds.includes(item.id)) {
+                state.selectedIds.push(item.id);
+            }
+        } else {
+            state.selectedIds = state.selectedIds.filter(id => id !== item.id);
+        }
+        // Assuming updateBatchDeleteBtn and updateSelectAllCheckbox are defined elsewhere
+        updateBatchDeleteBtn();
+        updateSelectAllCheckbox();
+    });
+
+    // 点击内容单元格
+    tr.querySelector('.content-cell').addEventListener('click', async () => {
+        if (item.type === 'Text') {
+            showTextModal(await getFullContent(item));
+        } else {
+            handleRowClick(item);
+        }
+    });
+
+    // 收藏按钮事件
+    tr.querySelector('.favorite-btn').addEventListener('click', (e) => {
+        e.stopPropagation();
+        toggleFavorite(item.id, e.target);
+    });
+
+    // 复制按钮事件
+    tr.querySelector('.copy-btn').addEventListener('click', (e) => {
+        e.stopPropagation();
+        copyContent(item, e);
+    });
+
+    // 删除按钮事件
+    tr.querySelector('.delete-btn').addEventListener('click', (e) => {
+        e.stopPropagation();
+        deleteRecord(item.id);
+    });
+
+    return tr;
+}
+
 // 处理行点击
-function handleRowClick(item) {
+async function handleRowClick(item) {
     if (item.type === 'Text') {
-        copyText(item.content);
+        copyText(await getFullContent(item));
     } else if (item.type === 'Image' && item.file_path) {
-        showImage(item.id);
+        showImage(item);
     } else if (item.file_path) {
         downloadFile(item.id);
     }
@@ -242,16 +349,14 @@ async function copyContent(item, event) {
     try {
         if (item.type === 'Text') {
             // 复制文本
-            await navigator.clipboard.writeText(item.content || '');
+            await navigator.clipboard.writeText(await getFullContent(item));
             showTooltip(event?.target || document.body, '已复制');
         } else if (item.type === 'Image' && item.file_path) {
             // 复制图片到剪贴板（需要转换为 PNG 格式）
             await copyImageToClipboard(item.id, event);
         } else if (item.type === 'File' && item.file_path) {
-            // 文件类型：检查是否为图片文件，如果是则复制图片，否则下载
-            const imageExtensions = ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'];
-            const ext = (item.file_path || '').toLowerCase().split('.').pop();
-            if (imageExtensions.some(e => e.slice(1) === ext)) {
+            // 文件类型：图片文件（服务端提供缩略图）复制图片，否则下载
+            if (item.thumb_url) {
                 // 图片文件，复制图片
                 await copyImageToClipboard(item.id, event);
             } else {
@@ -344,10 +449,11 @@ async function copyModalText() {
 }
 
 // 显示图片
-function showImage(id) {
+function showImage(item) {
     const modal = document.getElementById('image-modal');
     const img = document.getElementById('modal-image');
-    img.src = `/api/file/${id}`;
+    // 预览使用大尺寸缩略图，下载和复制仍使用原图
+    img.src = item.thumb_url ? `/api/thumb/${item.id}?w=1024` : `/api/file/${item.id}`;
     modal.classList.add('active');
 }
 
@@ -362,6 +468,9 @@ async function toggleFavorite(id, element) {
         const res = await fetch(`${API_BASE}/history/${id}/favorite`, { method: 'POST' });
         const data = await res.json();
 
+        const cached = cache.items.get(id);
+        if (cached) cached.favorited = data.favorited;
+
         if (data.favorited) {
             element.classList.add('favorited');
         } else {
@@ -423,7 +532,8 @@ async function deleteRecord(id) {
         const res = await fetch(`${API_BASE}/history/${id}`, { method: 'DELETE' });
         if (res.ok) {
             state.selectedIds = state.selectedIds.filter(selectedId => selectedId !== id); // Remove from selectedIds
-            loadHistory();
+            // 开启推送时由 deleted 事件刷新列表
+            if (!state.liveUpdates) refreshHistory();
             updateBatchDeleteBtn(); // Update batch delete button state
             updateSelectAllCheckbox(); // Update select all checkbox state
         } else {
@@ -453,7 +563,7 @@ async function batchDelete() {
 
         if (res.ok) {
             state.selectedIds = [];
-            loadHistory();
+            if (!state.liveUpdates) refreshHistory();
             updateBatchDeleteBtn();
             updateSelectAllCheckbox();
         } else {
@@ -476,13 +586,14 @@ function updateBatchDeleteBtn() {
     }
 }
 
-// 更新全选复选框状态
+// 更新全选复选框状态（按当前页的全部记录计算，虚拟列表中未渲染的行也包含在内）
 function updateSelectAllCheckbox() {
     const selectAll = document.getElementById('select-all');
-    const checkboxes = document.querySelectorAll('.row-checkbox');
-    const checkedCount = document.querySelectorAll('.row-checkbox:checked').length;
+    const selected = new Set(state.selectedIds);
+    const total = state.pageItems.length;
+    const checkedCount = state.pageItems.filter(item => selected.has(item.id)).length;
 
-    if (checkboxes.length === 0) { // No checkboxes to select
+    if (total === 0) { // No checkboxes to select
         selectAll.checked = false;
         selectAll.indeterminate = false;
         return;
@@ -491,7 +602,7 @@ function updateSelectAllCheckbox() {
     if (checkedCount === 0) {
         selectAll.checked = false;
         selectAll.indeterminate = false;
-    } else if (checkedCount === checkboxes.length) {
+    } else if (checkedCount === total) {
         selectAll.checked = true;
         selectAll.indeterminate = false;
     } else {
@@ -500,11 +611,18 @@ function updateSelectAllCheckbox() {
     }
 }
 
+// 每页记录数（使用本地缓存时"全部"即一页显示全部记录）
+function effectivePageSize() {
+    if (useCache() && state.pageSize >= ALL_PAGE_SIZE) return Math.max(state.totalRecords, 1);
+    return state.pageSize;
+}
+
 // 更新分页
 function updatePagination() {
-    const totalPages = Math.ceil(state.totalRecords / state.pageSize);
-    const start = state.totalRecords > 0 ? (state.currentPage - 1) * state.pageSize + 1 : 0;
-    const end = Math.min(state.currentPage * state.pageSize, state.totalRecords);
+    const pageSize = effectivePageSize();
+    const totalPages = Math.ceil(state.totalRecords / pageSize);
+    const start = state.totalRecords > 0 ? (state.currentPage - 1) * pageSize + 1 : 0;
+    const end = Math.min(state.currentPage * pageSize, state.totalRecords);
 
     document.getElementById('page-range').textContent =
         state.totalRecords > 0 ? `${start}-${end} / ${state.totalRecords}` : '无记录';
@@ -556,21 +674,26 @@ function debounce(fn, wait) {
 function initEvents() {
     // 全选复选框
     document.getElementById('select-all').addEventListener('change', (e) => {
-        const checkboxes = document.querySelectorAll('.row-checkbox');
-        checkboxes.forEach(cb => {
+        const pageIds = new Set(state.pageItems.map(item => item.id));
+        const others = state.selectedIds.filter(id => !pageIds.has(id));
+        state.selectedIds = e.target.checked ? others.concat([...pageIds]) : others;
+        document.querySelectorAll('.row-checkbox').forEach(cb => {
             cb.checked = e.target.checked;
-            const id = parseInt(cb.dataset.id);
-            if (e.target.checked) {
-                if (!state.selectedIds.includes(id)) {
-                    state.selectedIds.push(id);
-                }
-            } else {
-                state.selectedIds = state.selectedIds.filter(i => i !== id);
-            }
         });
         updateBatchDeleteBtn();
     });
 
+    // 虚拟列表滚动时渲染新进入可见区域的行
+    const container = document.querySelector('.table-container');
+    let scrollFrame = null;
+    container.addEventListener('scroll', () => {
+        if (scrollFrame || !container.classList.contains('virtual')) return;
+        scrollFrame = requestAnimationFrame(() => {
+            scrollFrame = null;
+            renderVisibleRows();
+        });
+    });
+
     // 批量删除按钮
     document.getElementById('batch-delete-btn').addEventListener('click', batchDelete);
 
@@ -578,49 +701,49 @@ function initEvents() {
     document.getElementById('type-filter').addEventListener('change', (e) => {
         state.currentType = e.target.value;
         state.currentPage = 1;
-        loadHistory();
+        showHistory();
     });
 
     // 收藏筛选
     document.getElementById('favorite-filter').addEventListener('change', (e) => {
         state.favoriteFilter = e.target.value;
         state.currentPage = 1;
-        loadHistory();
+        showHistory();
     });
 
     // 搜索
     document.getElementById('search-input').addEventListener('input', debounce((e) => {
         state.searchQuery = e.target.value;
         state.currentPage = 1;
-        loadHistory();
+        showHistory();
     }, 400));
 
     // 分页
     document.getElementById('prev-btn').addEventListener('click', () => {
         if (state.currentPage > 1) {
             state.currentPage--;
-            loadHistory();
+            showHistory();
         }
     });
 
     document.getElementById('next-btn').addEventListener('click', () => {
-        const totalPages = Math.ceil(state.totalRecords / state.pageSize);
+        const totalPages = Math.ceil(state.totalRecords / effectivePageSize());
         if (state.currentPage < totalPages) {
             state.currentPage++;
-            loadHistory();
+            showHistory();
         }
     });
 
     document.getElementById('page-size-select').addEventListener('change', (e) => {
         state.pageSize = parseInt(e.target.value);
         state.currentPage = 1;
-        loadHistory();
+        showHistory();
     });
 
     // 页面选择下拉框
     document.getElementById('page-select').addEventListener('change', (e) => {
         state.currentPage = parseInt(e.target.value);
-        loadHistory();
+        showHistory();
     });
 
     // 排序
@@ -634,7 +757,7 @@ function initEvents() {
                 state.sortOrder = 'desc';
             }
             updateSortIndicators();
-            loadHistory();
+            showHistory();
         });
     });
 
@@ -653,36 +776,235 @@ function initEvents() {
     document.getElementById('logout-btn').addEventListener('click', logout);
 }
 
-// 检查是否有新记录
-async function checkForUpdates() {
-    // 如果用户正在搜索或筛选，不自动刷新
-    if (state.searchQuery || state.currentType || state.favoriteFilter) {
-        return;
+// 是否处于未筛选状态（只有此时才根据推送事件增量更新列表）
+function isUnfiltered() {
+    return !state.searchQuery && !state.currentType && !state.favoriteFilter;
+}
+
+// 新记录：第一页时直接插入到表格顶部
+function onRecordCreated(item) {
+    if (!isUnfiltered()) return;
+
+    state.totalRecords++;
+    document.getElementById('total-records').textContent = state.totalRecords;
+
+    if (state.currentPage === 1 && !state.isLoading) {
+        renderRows([item, ...state.pageItems].slice(0, state.pageSize));
+    }
+    updatePagination();
+}
+
+// 记录被删除：当前页受影响时重新加载补齐，否则只更新总数
+function onRecordsDeleted(ids) {
+    let visible = false;
+    ids.forEach(id => {
+        const tr = document.querySelector(`#table-body tr[data-id="${id}"]`);
+        if (tr) {
+            tr.remove();
+            visible = true;
+        }
+    });
+    state.selectedIds = state.selectedIds.filter(id => !ids.includes(id));
+    updateBatchDeleteBtn();
+    updateSelectAllCheckbox();
+
+    if (visible) {
+        loadHistory();
+    } else if (isUnfiltered()) {
+        state.totalRecords = Math.max(0, state.totalRecords - ids.length);
+        document.getElementById('total-records').textContent = state.totalRecords;
+        updatePagination();
+    }
+}
+
+// 重复文本合并到已有记录：更新出现次数
+function onRecordSeen(data) {
+    const cell = document.querySelector(`#table-body tr[data-id="${data.id}"] .time-cell`);
+    if (!cell) return;
+    const created = cell.dataset.created;
+    cell.innerHTML = timeHtml({ ...data, created_at: created });
+}
+
+// 收藏状态变化：更新星标
+function onRecordFavorited(id, favorited) {
+    const btn = document.querySelector(`#table-body tr[data-id="${id}"] .favorite-btn`);
+    if (btn) btn.classList.toggle('favorited', favorited);
+}
+
+// 订阅服务端推送事件（替代轮询 /api/stats）
+// 使用本地缓存时收到事件只触发增量同步；搜索结果仍按事件直接更新
+function connectEvents() {
+    if (!window.EventSource) return;
+
+    // 浏览器断线后会自动重连，并携带 Last-Event-ID 补齐错过的事件
+    const source = new EventSource(`${API_BASE}/events`);
+    state.liveUpdates = true;
+    const on = (event, handler) => source.addEventListener(event, (e) => {
+        if (historyCache.db) scheduleSync();
+        if (!useCache()) handler(JSON.parse(e.data));
+    });
+    on('created', (data) => onRecordCreated(data));
+    on('deleted', (data) => onRecordsDeleted(data.ids));
+    on('seen', (data) => onRecordSeen(data));
+    on('favorited', (data) => onRecordFavorited(data.id, data.favorited));
+    // 服务端无法补齐事件时，重新加载当前页（本地缓存按版本同步，不受影响）
+    source.addEventListener('reset', () => refreshHistory());
+}
+
+// 是否由本地缓存显示当前列表
+function useCache() {
+    return cache.ready && !state.searchQuery;
+}
+
+// 按当前筛选条件显示列表
+function showHistory() {
+    if (useCache()) {
+        renderFromCache();
+    } else {
+        loadHistory();
     }
+}
+
+// 数据变化后刷新：同步本地缓存，搜索结果由服务端重新加载
+function refreshHistory() {
+    if (historyCache.db) syncChanges();
+    if (!useCache()) loadHistory();
+}
+
+// 本地缓存中符合筛选条件的记录（已排序，缓存和筛选条件不变时复用）
+function cacheView() {
+    const key = [cache.revision, state.currentType, state.favoriteFilter, state.sortField, state.sortOrder].join('|');
+    if (cache.view && cache.view.key === key) return cache.view.items;
+
+    let items = [...cache.items.values()];
+    if (state.currentType) items = items.filter(item => item.type === state.currentType);
+    if (state.favoriteFilter) items = items.filter(item => item.favorited);
+    items.sort(compareItems);
+    cache.view = { key, items };
+    return items;
+}
+
+// 从本地缓存显示当前页
+function renderFromCache() {
+    const items = cacheView();
+    state.totalRecords = items.length;
+    document.getElementById('total-records').textContent = items.length;
+
+    const pageSize = effectivePageSize();
+    const totalPages = Math.max(1, Math.ceil(items.length / pageSize));
+    state.currentPage = Math.min(state.currentPage, totalPages);
+    const start = (state.currentPage - 1) * pageSize;
+    renderRows(items.slice(start, start + pageSize));
+    updatePagination();
+}
 
+// 打开本地缓存并立即显示缓存中的记录（浏览器不支持时返回 false）
+async function openCache(username) {
     try {
-        const res = await fetch(`${API_BASE}/stats`);
+        await historyCache.open(username);
+        const cached = await historyCache.load();
+        if (cached.version !== null) {
+            cache.items = new Map(cached.items.map(item => [item.id, item]));
+            cache.version = cached.version;
+            cache.ready = true;
+            cache.revision++;
+        }
+        return true;
+    } catch (e) {
+        console.warn('本地缓存不可用:', e);
+        return false;
+    }
+}
+
+// 重新加载全部记录到本地缓存，随后从 version 开始增量同步
+async function rebuildCache(version) {
+    const items = [];
+    let cursor = '';
+    do {
+        const params = new URLSearchParams({ cursor, page_size: SYNC_PAGE_SIZE, mode: 'list' });
+        const res = await fetch(`${API_BASE}/history?${params}`);
+        if (!res.ok) throw new Error(`加载历史记录失败: ${res.status}`);
         const data = await res.json();
-        if (data.total_records !== state.totalRecords) {
-            // 有新记录，刷新列表
-            loadHistory();
+        items.push(...data.items);
+        cursor = data.next_cursor;
+    } while (cursor);
+
+    await historyCache.replace(items, version);
+    cache.items = new Map(items.map(item => [item.id, item]));
+    cache.version = version;
+    cache.ready = true;
+}
+
+// 拉取上次同步之后的变化并写入本地缓存，返回缓存是否有变化
+async function fetchChanges() {
+    let changed = false;
+    while (true) {
+        const params = new URLSearchParams({ limit: SYNC_PAGE_SIZE });
+        if (cache.version !== null) params.append('since', cache.version);
+        const res = await fetch(`${API_BASE}/history/changes?${params}`);
+        if (!res.ok) throw new Error(`同步失败: ${res.status}`);
+        const data = await res.json();
+
+        if (data.reset) {
+            await rebuildCache(data.version);
+            changed = true;
+            continue;
+        }
+        if (data.version !== cache.version) {
+            await historyCache.apply(data.upserts, data.deleted, data.version);
+            data.upserts.forEach(item => cache.items.set(item.id, item));
+            data.deleted.forEach(id => cache.items.delete(id));
+            cache.version = data.version;
+            changed = changed || data.upserts.length > 0 || data.deleted.length > 0;
+        }
+        if (!data.has_more) return changed;
+    }
+}
+
+// 增量同步本地缓存（同时只运行一个，期间再次请求时结束后重新同步）
+async function syncChanges() {
+    if (cache.syncing) {
+        cache.pending = true;
+        return;
+    }
+    cache.syncing = true;
+    try {
+        let changed = false;
+        do {
+            cache.pending = false;
+            changed = (await fetchChanges()) || changed;
+        } while (cache.pending);
+
+        if (changed) {
+            cache.revision++;
+            state.selectedIds = state.selectedIds.filter(id => cache.items.has(id));
+            updateBatchDeleteBtn();
+            if (useCache()) renderFromCache();
         }
     } catch (e) {
-        // 忽略错误
+        console.error('同步失败:', e);
+    } finally {
+        cache.syncing = false;
     }
 }
 
+const scheduleSync = debounce(syncChanges, 200);
+
 // 初始化
 async function init() {
-    const auth = await checkAuth();
-    if (!auth) return;
+    const username = await checkAuth();
+    if (!username) return;
 
     initEvents();
     updateSortIndicators();
-    loadHistory();
 
-    // 每3秒检查一次是否有新内容
-    setInterval(checkForUpdates, 1000);
+    // 有本地缓存时立即显示，否则先从服务端加载当前页，同时在后台建立缓存
+    const cacheAvailable = await openCache(username);
+    showHistory();
+    if (cacheAvailable) syncChanges();
+
+    // 通过服务端推送获取新内容
+    connectEvents();
 }
 
 document.addEventListener('DOMContentLoaded', init);
@@ -0,0 +1,85 @@
+// 历史记录本地缓存（IndexedDB）
+// 保存列表项（与 /api/history?mode=list 相同）和已同步到的变更版本，
+// 页面打开时先显示缓存中的记录，再通过 /api/history/changes 增量同步
+
+// 等待事务完成
+function transactionDone(tx) {
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+        tx.onabort = () => reject(tx.error || new Error('事务已中止'));
+    });
+}
+
+const historyCache = {
+    db: null,
+    name: null,
+
+    // 打开当前用户的缓存数据库（不同用户使用不同的数据库）
+    open(username) {
+        return new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                reject(new Error('浏览器不支持 IndexedDB'));
+                return;
+            }
+            const name = `clipboard-history-${username}`;
+            const request = indexedDB.open(name, 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('items', { keyPath: 'id' });
+                db.createObjectStore('meta');
+            };
+            request.onsuccess = () => {
+                this.db = request.result;
+                this.name = name;
+                // 其他页面登出时删除数据库：关闭连接，之后不再使用缓存
+                this.db.onversionchange = () => {
+                    this.db.close();
+                    this.db = null;
+                };
+                resolve();
+            };
+            request.onerror = () => reject(request.error);
+        });
+    },
+
+    // 读取全部缓存：{ version, items }，还没有缓存时 version 为 null
+    async load() {
+        const tx = this.db.transaction(['items', 'meta'], 'readonly');
+        const items = tx.objectStore('items').getAll();
+        const version = tx.objectStore('meta').get('version');
+        await transactionDone(tx);
+        return { version: version.result ?? null, items: items.result };
+    },
+
+    // 写入一次增量同步的结果（与版本在同一事务中保存，中途关闭页面不会漏掉变化）
+    apply(upserts, deleted, version) {
+        const tx = this.db.transaction(['items', 'meta'], 'readwrite');
+        const items = tx.objectStore('items');
+        upserts.forEach(item => items.put(item));
+        deleted.forEach(id => items.delete(id));
+        tx.objectStore('meta').put(version, 'version');
+        return transactionDone(tx);
+    },
+
+    // 用全部记录替换缓存
+    replace(allItems, version) {
+        const tx = this.db.transaction(['items', 'meta'], 'readwrite');
+        const items = tx.objectStore('items');
+        items.clear();
+        allItems.forEach(item => items.put(item));
+        tx.objectStore('meta').put(version, 'version');
+        return transactionDone(tx);
+    },
+
+    // 删除缓存数据库（登出时）
+    destroy() {
+        if (!this.db) return Promise.resolve();
+        this.db.close();
+        this.db = null;
+        return new Promise((resolve) => {
+            const request = indexedDB.deleteDatabase(this.name);
+            request.onsuccess = request.onerror = request.onblocked = () => resolve();
+        });
+    }
+};
@@ -0,0 +1,179 @@
+"""
+统计信息维护
+
+clipboard_stats 表按类型保存记录数、字节数和最新时间，
+在插入/删除记录的同一事务中增量更新，/api/stats 只需读取几行数据。
+最新时间为该类型记录的最近出现时间 last_seen_at 的最大值（重复文本合并后会更新）。
+"""
+from typing import Iterable
+from sqlalchemy import LargeBinary, case, cast, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from models import ClipboardHistory, ClipboardStats, SessionLocal
+
+# 固定展示的类型（即使没有记录也返回 0）
+CLIP_TYPES = ["Text", "Image", "File", "Group"]
+
+
+def record_bytes(record) -> int:
+    """记录占用的字节数：文本按 UTF-8 编码长度（压缩保存的文本为 file_size 中的原文大小），文件按文件大小"""
+    if record.type == "Text":
+        if record.file_size is not None:
+            return record.file_size
+        return len((record.content or "").encode("utf-8"))
+    return record.file_size or 0
+
+
+def last_seen(record):
+    """记录的最近出现时间（未设置时即创建时间）"""
+    return record.last_seen_at or record.created_at
+
+
+def on_insert(db: Session, records: Iterable[ClipboardHistory]):
+    """新增记录后更新统计（调用方负责提交事务）"""
+    deltas = {}
+    for record in records:
+        count, total_bytes, latest_at = deltas.get(record.type, (0, 0, None))
+        seen_at = last_seen(record)
+        if latest_at is None or (seen_at and seen_at > latest_at):
+            latest_at = seen_at
+        deltas[record.type] = (count + 1, total_bytes + record_bytes(record), latest_at)
+
+    for clip_type, (count, total_bytes, latest_at) in deltas.items():
+        stmt = insert(ClipboardStats).values(
+            type=clip_type,
+            count=count,
+            total_bytes=total_bytes,
+            latest_at=latest_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ClipboardStats.type],
+            set_={
+                "count": ClipboardStats.count + stmt.excluded.count,
+                "total_bytes": ClipboardStats.total_bytes + stmt.excluded.total_bytes,
+                # SQLite 的多参数 max() 遇到 NULL 返回 NULL，先用 coalesce 兜底
+                "latest_at": func.max(
+                    func.coalesce(ClipboardStats.latest_at, stmt.excluded.latest_at),
+                    func.coalesce(stmt.excluded.latest_at, ClipboardStats.latest_at)
+                ),
+            }
+        )
+        db.execute(stmt)
+
+
+def on_seen(db: Session, records: Iterable[ClipboardHistory]):
+    """已有记录再次出现（重复文本合并）后更新最新时间（调用方负责提交事务）"""
+    latest = {}
+    for record in records:
+        if record.type not in latest or record.last_seen_at > latest[record.type]:
+            latest[record.type] = record.last_seen_at
+
+    for clip_type, seen_at in latest.items():
+        db.query(ClipboardStats).filter(ClipboardStats.type == clip_type).update(
+            {ClipboardStats.latest_at: func.max(func.coalesce(ClipboardStats.latest_at, seen_at), seen_at)},
+            synchronize_session=False
+        )
+
+
+def on_delete(db: Session, records: Iterable):
+    """
+    删除记录后更新统计（调用方负责提交事务）
+
+    records 需要提供 type / content / file_size 属性，
+    且对应的行已经在当前事务中删除。
+    """
+    on_delete_sizes(db, ((record.type, record_bytes(record)) for record in records))
+
+
+def on_delete_sizes(db: Session, sizes: Iterable[tuple]):
+    """
+    删除记录后更新统计（调用方负责提交事务）
+
+    sizes 为已删除记录的 (类型, 字节数)，如 DELETE ... RETURNING 返回的结果。
+    """
+    deltas = {}
+    for clip_type, size in sizes:
+        count, total_bytes = deltas.get(clip_type, (0, 0))
+        deltas[clip_type] = (count + 1, total_bytes + (size or 0))
+
+    if not deltas:
+        return
+
+    db.flush()
+    for clip_type, (count, total_bytes) in deltas.items():
+        # 最新时间可能被删除，重新取该类型的最大值（走 (type, last_seen_at) 索引；
+        # last_seen_at 由默认值和插入触发器保证不为空）
+        latest_at = db.query(func.max(ClipboardHistory.last_seen_at))\
+                      .filter(ClipboardHistory.type == clip_type)\
+                      .scalar()
+        db.query(ClipboardStats).filter(ClipboardStats.type == clip_type).update(
+            {
+                ClipboardStats.count: func.max(ClipboardStats.count - count, 0),
+                ClipboardStats.total_bytes: func.max(ClipboardStats.total_bytes - total_bytes, 0),
+                ClipboardStats.latest_at: latest_at,
+            },
+            synchronize_session=False
+        )
+
+
+def get_stats(db: Session) -> dict:
+    """读取统计信息"""
+    by_type = {type_name: 0 for type_name in CLIP_TYPES}
+    bytes_by_type = {type_name: 0 for type_name in CLIP_TYPES}
+    latest = None
+
+    for row in db.query(ClipboardStats).all():
+        by_type[row.type] = row.count
+        bytes_by_type[row.type] = row.total_bytes
+        if row.count and row.latest_at and (latest is None or row.latest_at > latest):
+            latest = row.latest_at
+
+    return {
+        "total_records": sum(by_type.values()),
+        "total_bytes": sum(bytes_by_type.values()),
+        "by_type": by_type,
+        "bytes_by_type": bytes_by_type,
+        "latest_sync": latest.isoformat() if latest else None
+    }
+
+
+def size_expression():
+    """与 record_bytes 一致的 SQL 表达式（文本按 UTF-8 字节数，文件按文件大小）"""
+    return case(
+        (ClipboardHistory.type == "Text",
+         func.coalesce(ClipboardHistory.file_size, func.length(cast(ClipboardHistory.content, LargeBinary)), 0)),
+        else_=func.coalesce(ClipboardHistory.file_size, 0)
+    )
+
+
+def rebuild_stats(db: Session) -> dict:
+    """根据 clipboard_history 全量重建统计信息"""
+    size_expr = size_expression()
+    rows = db.query(
+        ClipboardHistory.type,
+        func.count(ClipboardHistory.id),
+        func.sum(size_expr),
+        func.max(func.coalesce(ClipboardHistory.last_seen_at, ClipboardHistory.created_at))
+    ).group_by(ClipboardHistory.type).all()
+
+    db.query(ClipboardStats).delete(synchronize_session=False)
+    for clip_type, count, total_bytes, latest_at in rows:
+        db.add(ClipboardStats(
+            type=clip_type,
+            count=count,
+            total_bytes=total_bytes or 0,
+            latest_at=latest_at
+        ))
+    db.commit()
+    return get_stats(db)
+
+
+def ensure_stats():
+    """统计表为空但已有历史记录时（旧数据库升级），自动重建一次"""
+    db = SessionLocal()
+    try:
+        if db.query(ClipboardStats).first() is None and db.query(ClipboardHistory).first() is not None:
+            print("[Stats] 正在生成统计信息...")
+            rebuild_stats(db)
+    finally:
+        db.close()
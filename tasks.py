@@ -0,0 +1,98 @@
+"""
+后台定时任务
+
+每个任务在独立的守护线程中按固定间隔执行，应用退出时停止。
+任务抛出的异常只记录日志，不影响下一次执行。
+多进程部署时，exclusive 任务通过文件锁保证同一时刻只在一个进程中执行。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+from config import Config
+from locks import FileLock
+
+
+class PeriodicTask:
+    """按固定间隔执行的后台任务"""
+
+    def __init__(self, name: str, interval: float, func: Callable, initial_delay: float = 0,
+                 lock: Optional[FileLock] = None):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.initial_delay = initial_delay
+        self.lock = lock
+        self.last_run = None  # 上次执行完成的时间（time.time()）
+        self.last_result = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"task-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> bool:
+        """立即执行一次；其他进程正在执行同一任务时跳过并返回 False"""
+        if self.lock is not None and not self.lock.acquire(blocking=False):
+            return False
+        start = time.monotonic()
+        try:
+            self.last_result = self.func()
+        except Exception as e:
+            print(f"[Tasks] 任务 {self.name} 执行失败: {e}")
+        else:
+            print(f"[Tasks] 任务 {self.name} 完成，用时 {time.monotonic() - start:.1f}s")
+        finally:
+            self.last_run = time.time()
+            if self.lock is not None:
+                self.lock.release()
+        return True
+
+    def _run(self):
+        if self._stopping.wait(self.initial_delay):
+            return
+        while True:
+            self.run_once()
+            if self._stopping.wait(self.interval):
+                return
+
+
+class TaskScheduler:
+    """后台任务集合"""
+
+    def __init__(self):
+        self.tasks: Dict[str, PeriodicTask] = {}
+        self._started = False
+
+    def add(self, name: str, interval: float, func: Callable, initial_delay: float = 0,
+            exclusive: bool = False) -> PeriodicTask:
+        """注册任务；调度器已启动时立即开始执行。exclusive 任务在多个进程之间互斥"""
+        lock = FileLock(Config.LOCK_DIR / f"task-{name}.lock") if exclusive else None
+        task = PeriodicTask(name, interval, func, initial_delay, lock)
+        self.tasks[name] = task
+        if self._started:
+            task.start()
+        return task
+
+    def start(self):
+        self._started = True
+        for task in self.tasks.values():
+            task.start()
+
+    def stop(self):
+        self._started = False
+        for task in self.tasks.values():
+            task.stop()
+
+
+# 全局调度器
+scheduler = TaskScheduler()
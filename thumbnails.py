@@ -0,0 +1,155 @@
+"""
+图片缩略图
+
+缩略图按 (文件哈希, 宽度档位) 缓存在 DATA_DIR/thumbs 下，格式为 WebP：
+- 入库时在后台入库线程中生成默认宽度的缩略图，并记录原图尺寸
+- 其他宽度在首次请求时由进程池生成（解码大图是 CPU 密集操作，不占用事件循环）
+未安装 Pillow 或记录没有文件哈希（迁移前的旧记录）时不生成缩略图，接口直接返回原图。
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+from config import Config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+THUMB_MEDIA_TYPE = "image/webp"
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+
+# 缩略图宽度档位，请求的宽度向上取整到档位，避免缓存无限增长
+WIDTH_BUCKETS = (128, 256, 512, 1024)
+
+# 缩略图高度上限（相对宽度的倍数），防止超长截图生成巨大的缩略图
+MAX_ASPECT = 4
+
+_executor = None
+_pending = {}
+
+
+def available() -> bool:
+    """是否可以生成缩略图"""
+    return Image is not None
+
+
+def is_image(clip_type: str, filename: Optional[str]) -> bool:
+    """记录是否为图片（Image 类型或图片扩展名的 File）"""
+    if clip_type == "Image":
+        return True
+    if clip_type == "File" and filename:
+        return Path(filename).suffix.lower() in IMAGE_EXTENSIONS
+    return False
+
+
+def bucket_width(width: int) -> int:
+    """把请求的宽度映射到最近的不小于它的档位"""
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+def thumb_path(file_hash: str, width: int) -> Path:
+    """缩略图缓存路径"""
+    return Config.THUMB_DIR / file_hash[:2] / f"{file_hash}_{width}.webp"
+
+
+def thumb_url(record_id: int, width: int = None) -> str:
+    """缩略图访问地址"""
+    return f"/api/thumb/{record_id}?w={width or Config.THUMB_DEFAULT_WIDTH}"
+
+
+def image_size(src: Path) -> Optional[Tuple[int, int]]:
+    """读取图片尺寸（只解析文件头）"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(src) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def render_thumbnail(src: str, dest: str, width: int) -> Tuple[int, int]:
+    """
+    生成缩略图（可在子进程中执行）
+
+    Returns:
+        原图尺寸 (width, height)
+    """
+    with Image.open(src) as img:
+        original_size = img.size
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+        img.thumbnail((width, width * MAX_ASPECT), Image.LANCZOS)
+
+        dest_path = Path(dest)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest_path.with_name(f".{dest_path.name}.{os.getpid()}.tmp")
+        img.save(tmp, "WEBP", quality=80, method=4)
+        os.replace(tmp, dest_path)
+    return original_size
+
+
+def prepare(src: Path, file_hash: str) -> Optional[Tuple[int, int]]:
+    """
+    入库时调用：生成默认宽度缩略图，返回原图尺寸
+
+    失败（不是有效图片等）时返回 None，不影响入库。
+    """
+    if Image is None:
+        return None
+    try:
+        dest = thumb_path(file_hash, bucket_width(Config.THUMB_DEFAULT_WIDTH))
+        if dest.exists():
+            return image_size(src)
+        return render_thumbnail(str(src), str(dest), bucket_width(Config.THUMB_DEFAULT_WIDTH))
+    except Exception as e:
+        print(f"[Thumbnail] 生成缩略图失败 {src}: {e}")
+        return None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # 服务进程中有多个线程，不能直接 fork；forkserver 也不会在子进程中重新执行主模块
+        methods = multiprocessing.get_all_start_methods()
+        method = "forkserver" if "forkserver" in methods else "spawn"
+        _executor = ProcessPoolExecutor(
+            max_workers=Config.THUMB_WORKERS,
+            mp_context=multiprocessing.get_context(method)
+        )
+    return _executor
+
+
+async def get_thumbnail(src: Path, file_hash: str, width: int) -> Path:
+    """获取缩略图，不存在时在进程池中生成；同一缩略图的并发请求只生成一次"""
+    width = bucket_width(width)
+    dest = thumb_path(file_hash, width)
+    if dest.exists():
+        return dest
+
+    key = (file_hash, width)
+    future = _pending.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_get_executor(), render_thumbnail, str(src), str(dest), width)
+        _pending[key] = future
+        future.add_done_callback(lambda _: _pending.pop(key, None))
+    await future
+    return dest
+
+
+def shutdown():
+    """关闭进程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,295 @@
+"""
+历史记录的流式导出与导入（备份、迁移）
+
+- 记录导出为 NDJSON：每行一条记录（不含 id），按 id 分批读取，内存占用与总记录数无关
+- 文件导出为 tar 流：成员名为记录的 file_path（相对 DATA_DIR，位于 history/ 下），
+  每个文件只导出一次，逐块读取，不在内存中拼装整个归档
+- 导入时先导入文件再导入记录：文件按原路径写入（对象文件校验 SHA-256，已存在的跳过）；
+  记录按批在单个事务中插入，已存在的记录（类型、时间和内容/文件哈希均相同）跳过
+- 压缩保存的文本导出为完整文本，导入时按当前压缩配置重新压缩；压缩保存的对象文件（.gz）原样导出
+
+导出和导入都支持按类型和时间范围筛选（导入的筛选在导出时完成）。
+"""
+import hashlib
+import os
+import tarfile
+import zlib
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+from typing import BinaryIO, Iterator, Optional
+import orjson
+from sqlalchemy import insert
+from config import Config
+from models import ClipboardHistory, SessionLocal, text_hash
+import blobstore
+import compression
+import stats
+
+EXPORT_BATCH_SIZE = 1000  # 每次查询导出的记录数
+IMPORT_BATCH_SIZE = 5000  # 每个导入事务插入的记录数
+DEDUPE_CHUNK_SIZE = 500  # 查重时每条查询的时间数（受 SQLite 绑定参数数量限制）
+
+# 导出的列（id 由导入方重新分配）
+EXPORT_FIELDS = ("type", "content", "file_path", "file_hash", "file_size", "created_at",
+                 "extra_data", "favorited", "image_width", "image_height", "last_seen_at", "occurrences")
+# 导入时写入的列（另含文本哈希和按当前配置压缩后的文本）
+IMPORT_FIELDS = EXPORT_FIELDS + ("content_hash", "content_z", "content_length")
+
+
+def _filtered(query, clip_type: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    if clip_type:
+        query = query.filter(ClipboardHistory.type == clip_type)
+    if start:
+        query = query.filter(ClipboardHistory.created_at >= start)
+    if end:
+        query = query.filter(ClipboardHistory.created_at <= end)
+    return query
+
+
+def export_rows(clip_type: str = None, start: datetime = None, end: datetime = None) -> Iterator[bytes]:
+    """逐批生成 NDJSON（每批一个 bytes 块），批与批之间不持有读事务"""
+    columns = [ClipboardHistory.id, ClipboardHistory.content_z] + \
+              [getattr(ClipboardHistory, field) for field in EXPORT_FIELDS]
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = _filtered(db.query(*columns), clip_type, start, end)\
+                       .filter(ClipboardHistory.id > last_id)\
+                       .order_by(ClipboardHistory.id)\
+                       .limit(EXPORT_BATCH_SIZE)\
+                       .all()
+            db.rollback()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            yield b"".join(orjson.dumps(_export_dict(row)) + b"\n" for row in rows)
+    finally:
+        db.close()
+
+
+def _export_dict(row) -> dict:
+    data = {field: getattr(row, field) for field in EXPORT_FIELDS}
+    if row.content_z is not None:
+        # 导出完整文本；file_size 为压缩保存时记录的原文字节数，不导出
+        data["content"] = compression.full_text(row.content, row.content_z)
+        data["file_size"] = None
+    return data
+
+
+def _tar_member(path: Path, name: str) -> Iterator[bytes]:
+    """单个文件的 tar 头、内容和填充（按头中的大小输出，文件中途变化时截断或补零）"""
+    stat_result = path.stat()
+    info = tarfile.TarInfo(name)
+    info.size = stat_result.st_size
+    info.mtime = int(stat_result.st_mtime)
+    info.mode = 0o644
+    yield info.tobuf(tarfile.PAX_FORMAT)
+
+    remaining = info.size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(blobstore.CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    yield b"\0" * (remaining + (-info.size % tarfile.BLOCKSIZE))
+
+
+def export_files(clip_type: str = None, start: datetime = None, end: datetime = None) -> Iterator[bytes]:
+    """逐个文件生成 tar 流（只包含筛选出的记录引用且仍存在的文件）"""
+    db = SessionLocal()
+    try:
+        last_path = ""
+        while True:
+            paths = [path for (path,) in
+                     _filtered(db.query(ClipboardHistory.file_path), clip_type, start, end)
+                     .filter(ClipboardHistory.file_path > last_path)
+                     .distinct()
+                     .order_by(ClipboardHistory.file_path)
+                     .limit(EXPORT_BATCH_SIZE)]
+            db.rollback()
+            if not paths:
+                break
+            last_path = paths[-1]
+            for rel_path in paths:
+                try:
+                    yield from _tar_member(Config.DATA_DIR / rel_path, Path(rel_path).as_posix())
+                except FileNotFoundError:
+                    continue
+    finally:
+        db.close()
+    # 归档结束标记：两个全零块
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+
+def _member_path(name: str) -> Optional[Path]:
+    """校验 tar 成员名，只接受 history 目录下的相对路径"""
+    parts = PurePosixPath(name).parts
+    history_parts = Path(blobstore.relative_path(Config.HISTORY_DIR)).parts
+    if not parts or parts[0] == "/" or ".." in parts or parts[:len(history_parts)] != history_parts:
+        return None
+    if len(parts) == len(history_parts):
+        return None
+    return Config.DATA_DIR.joinpath(*parts)
+
+
+def import_files(fileobj: BinaryIO) -> dict:
+    """
+    从 tar 流导入文件（顺序读取，不需要可随机访问的文件）
+
+    对象文件的文件名必须等于内容的 SHA-256（.gz 对象为解压后内容的 SHA-256），否则视为损坏跳过。
+    新写入的文件在 ORPHAN_GRACE_SECONDS 内不会被维护任务当作孤立文件清理，应随后导入记录。
+    """
+    report = {"files": 0, "existing": 0, "invalid": 0, "bytes": 0}
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            dest = _member_path(member.name)
+            if dest is None:
+                print(f"[Transfer] 跳过无效的文件: {member.name}")
+                report["invalid"] += 1
+                continue
+            if dest.exists():
+                report["existing"] += 1
+                continue
+
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f".{dest.name}.{os.getpid()}.import")
+            sha256 = hashlib.sha256()
+            # gzip 保存的对象按解压后的内容校验
+            decompressor = zlib.decompressobj(wbits=31) if compression.is_compressed_path(dest) else None
+            src = tar.extractfile(member)
+            try:
+                with open(tmp, "wb") as f:
+                    while True:
+                        chunk = src.read(blobstore.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        sha256.update(decompressor.decompress(chunk) if decompressor else chunk)
+                        f.write(chunk)
+                name = dest.name.removesuffix(compression.GZIP_SUFFIX)
+                if dest.parent.is_relative_to(Config.BLOB_DIR) and name != sha256.hexdigest():
+                    print(f"[Transfer] 对象文件内容与哈希不一致，跳过: {member.name}")
+                    report["invalid"] += 1
+                    continue
+                os.replace(tmp, dest)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
+            report["files"] += 1
+            report["bytes"] += member.size
+    return report
+
+
+def _dedupe_key(row, content: Optional[str]) -> tuple:
+    """判断重复的键：类型、时间，以及文件哈希（文件类型）或完整内容的哈希（文本）"""
+    if row.file_hash:
+        digest = row.file_hash
+    else:
+        digest = text_hash(content)
+    return row.type, row.created_at, digest
+
+
+class RowImporter:
+    """
+    按批导入 NDJSON 记录
+
+    add_line() 返回 True 时表示当前批已满，调用方应调用 flush()；
+    结束时再调用一次 flush() 写入剩余记录。
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.report = {"imported": 0, "duplicates": 0, "missing_files": 0, "invalid": 0}
+        self._pending = []
+
+    def add_line(self, line: bytes) -> bool:
+        line = line.strip()
+        if not line:
+            return False
+        try:
+            data = orjson.loads(line)
+            row = SimpleNamespace(**{field: data.get(field) for field in EXPORT_FIELDS})
+            row.created_at = datetime.fromisoformat(row.created_at)
+            # 旧版本导出的记录没有出现次数信息
+            row.last_seen_at = datetime.fromisoformat(row.last_seen_at) if row.last_seen_at else row.created_at
+            row.occurrences = int(row.occurrences or 1)
+            row.favorited = bool(row.favorited)
+            if not row.type:
+                raise ValueError("missing type")
+        except (orjson.JSONDecodeError, AttributeError, TypeError, ValueError) as e:
+            self.report["invalid"] += 1
+            print(f"[Transfer] 跳过无效的记录: {e}")
+            return False
+        self._pending.append(row)
+        return len(self._pending) >= self.batch_size
+
+    def _existing_keys(self, db, rows) -> set:
+        times = sorted({row.created_at for row in rows})
+        keys = set()
+        for i in range(0, len(times), DEDUPE_CHUNK_SIZE):
+            existing = db.query(ClipboardHistory.type, ClipboardHistory.created_at, ClipboardHistory.content,
+                                ClipboardHistory.content_z, ClipboardHistory.file_hash)\
+                         .filter(ClipboardHistory.created_at.in_(times[i:i + DEDUPE_CHUNK_SIZE]))
+            keys.update(_dedupe_key(row, compression.full_text(row.content, row.content_z))
+                        for row in existing)
+        return keys
+
+    def _resolve_file(self, row) -> bool:
+        """确认记录引用的文件存在；原路径不存在时按哈希查找对象文件"""
+        if not row.file_path:
+            return True
+        if (Config.DATA_DIR / row.file_path).exists():
+            return True
+        blob = blobstore.find_blob(row.file_hash) if row.file_hash else None
+        if blob is not None:
+            row.file_path = blobstore.relative_path(blob)
+            return True
+        return False
+
+    def flush(self):
+        """在一个事务中插入当前批（持有对象存储锁，避免引用的文件被并发删除）"""
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            with blobstore.lock:
+                seen = self._existing_keys(db, rows)
+                values = []
+                records = []
+                for row in rows:
+                    key = _dedupe_key(row, row.content)
+                    if key in seen:
+                        self.report["duplicates"] += 1
+                        continue
+                    if not self._resolve_file(row):
+                        self.report["missing_files"] += 1
+                        continue
+                    seen.add(key)
+                    row.content_hash = text_hash(row.content) if row.type == "Text" else None
+                    row.content_z = row.content_length = None
+                    compression.apply_text(row)
+                    values.append({field: getattr(row, field) for field in IMPORT_FIELDS})
+                    records.append(row)
+                if values:
+                    db.execute(insert(ClipboardHistory), values)
+                    stats.on_insert(db, records)
+                    db.commit()
+            self.report["imported"] += len(values)
+        finally:
+            db.close()
+
+
+def import_rows(fileobj: BinaryIO, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """从 NDJSON 流导入记录"""
+    importer = RowImporter(batch_size)
+    for line in fileobj:
+        if importer.add_line(line):
+            importer.flush()
+    importer.flush()
+    return importer.report
@@ -0,0 +1,210 @@
+"""
+WebDAV 快速通道
+
+SyncClipboard 客户端只用 GET / HEAD / PUT 读写 /SyncClipboard.json 和 /file/<文件名>，
+这些请求直接在 ASGI 层处理，不经过 a2wsgi 工作线程：
+- GET / HEAD：当前剪贴板从内存缓存返回，其他文件流式发送，支持 If-None-Match
+- PUT：请求体按块写入同目录下的临时文件后原子替换，SyncClipboard.json 写入后直接提交到入库队列；
+  file/ 下的文件写入时同时计算摘要，入库时不再重新读取
+
+其他方法（PROPFIND、LOCK、MKCOL 等）、带锁令牌 / 条件 / Range 头的请求、被锁定的资源、
+不存在的资源以及认证失败的请求，都原样交给 WsgiDAV 处理。
+"""
+import hashlib
+import os
+import stat
+from urllib.parse import quote
+import anyio
+from starlette.responses import FileResponse, Response
+from wsgidav import util
+from auth import parse_basic_auth, verify_credentials_async
+from ingest import ingest_queue, new_update
+from metrics import DAV_HANDLER_SCOPE_KEY
+from webdav_provider import SYNC_JSON_PATH, upload_temp_path
+import blobstore
+
+FAST_METHODS = {"GET", "HEAD", "PUT"}
+
+# 存在这些请求头时交给 WsgiDAV 处理
+FALLBACK_HEADERS = {
+    b"if", b"if-match", b"if-modified-since", b"if-unmodified-since",
+    b"range", b"content-range", b"content-encoding",
+}
+
+
+class UploadAborted(Exception):
+    """客户端在上传完成前断开连接"""
+
+
+def is_fast_path(path: str) -> bool:
+    """SyncClipboard.json 或 file/ 目录下的文件"""
+    if path == SYNC_JSON_PATH:
+        return True
+    if not path.startswith("/file/"):
+        return False
+    name = path[len("/file/"):]
+    return name not in ("", ".", "..") and "/" not in name
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _write_chunk(f, hasher, chunk: bytes):
+    # 写入和计算摘要在同一次线程调用中完成，不占用事件循环
+    f.write(chunk)
+    if hasher is not None:
+        hasher.update(chunk)
+
+
+def _commit_upload(temp_path: str, file_path: str, hasher):
+    os.replace(temp_path, file_path)
+    if hasher is not None:
+        blobstore.remember_upload(file_path, hasher.digest())
+
+
+def etag_matches(if_none_match: bytes, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.decode("latin-1").split(",")]
+    return "*" in tags or any(tag.removeprefix("W/").strip('"') == etag for tag in tags)
+
+
+class DAVFastPath:
+    """
+    挂载在 /dav 上的 ASGI 应用，热点请求直接处理，其余交给 fallback（WsgiDAV）
+    """
+
+    def __init__(self, dav_app, fallback):
+        self.provider = dav_app.provider_map["/"]
+        self.lock_manager = dav_app.lock_manager
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in FAST_METHODS or not is_fast_path(scope["path"]):
+            return await self.fallback(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        if FALLBACK_HEADERS & headers.keys() or not await self._authorized(headers):
+            # 认证失败由 WsgiDAV 返回 401
+            return await self.fallback(scope, receive, send)
+
+        if scope["method"] == "PUT":
+            response = await self._put(scope["path"], receive)
+        else:
+            response = await self._get(scope["path"], scope["method"], headers)
+        if response is None:
+            return await self.fallback(scope, receive, send)
+        scope[DAV_HANDLER_SCOPE_KEY] = "fastpath"
+        await response(scope, receive, send)
+
+    @staticmethod
+    async def _authorized(headers: dict) -> bool:
+        credentials = parse_basic_auth(headers.get(b"authorization", b"").decode("latin-1"))
+        return credentials is not None and await verify_credentials_async(*credentials)
+
+    def _load(self, path: str):
+        """读取 GET / HEAD 需要的信息（在线程中执行），资源不是普通文件时返回 None"""
+        file_path = self.provider._loc_to_file_path(path)
+        cache = self.provider.hot_cache
+        entry = cache.get(path, file_path) if cache is not None else None
+        if entry is not None:
+            return entry, file_path, entry.stat, entry.etag
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+        if not self.provider.fs_opts.get("follow_symlinks") and os.path.islink(file_path):
+            return None
+        return None, file_path, stat_result, util.get_file_etag(file_path)
+
+    async def _get(self, path: str, method: str, headers: dict):
+        cache = self.provider.hot_cache
+        entry = cache.peek(path, self.provider._loc_to_file_path(path)) if cache is not None else None
+        if entry is not None:
+            file_path, stat_result, etag = None, entry.stat, entry.etag
+        else:
+            loaded = await anyio.to_thread.run_sync(self._load, path)
+            if loaded is None:
+                return None
+            entry, file_path, stat_result, etag = loaded
+
+        if b"if-none-match" in headers and etag_matches(headers[b"if-none-match"], etag):
+            return Response(status_code=304, headers={"ETag": f'"{etag}"'})
+
+        response_headers = {
+            "Content-Type": util.guess_mime_type(path),
+            "Last-Modified": util.get_rfc1123_time(stat_result.st_mtime),
+            "ETag": f'"{etag}"',
+            "Accept-Ranges": "bytes",
+        }
+        if entry is not None:
+            response_headers["Content-Length"] = str(len(entry.data))
+            return Response(entry.data if method == "GET" else b"", headers=response_headers)
+        return FileResponse(file_path, stat_result=stat_result, method=method, headers=response_headers)
+
+    def _prepare_put(self, path: str):
+        """检查能否直接写入（在线程中执行），返回 (文件路径, 是否已存在)，需要交给 WsgiDAV 时返回 None"""
+        # 资源或其父目录被锁定时，由 WsgiDAV 校验锁令牌
+        if self.lock_manager is not None and \
+                self.lock_manager.get_indirect_url_lock_list(quote(self.provider.share_path + path)):
+            return None
+        file_path = self.provider._loc_to_file_path(path)
+        if not os.path.isdir(os.path.dirname(file_path)) or os.path.isdir(file_path):
+            return None
+        return file_path, os.path.exists(file_path)
+
+    async def _put(self, path: str, receive):
+        prepared = await anyio.to_thread.run_sync(self._prepare_put, path)
+        if prepared is None:
+            return None
+        file_path, existed = prepared
+
+        is_sync_json = path == SYNC_JSON_PATH
+        temp_path = upload_temp_path(file_path)
+        body = bytearray() if is_sync_json else None
+        # SyncClipboard.json 保留原文提交入库，其他文件边写边计算摘要
+        hasher = None if is_sync_json else blobstore.StreamHasher()
+        try:
+            f = await anyio.to_thread.run_sync(open, temp_path, "wb")
+            try:
+                while True:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        raise UploadAborted()
+                    chunk = message.get("body", b"")
+                    if chunk:
+                        await anyio.to_thread.run_sync(_write_chunk, f, hasher, chunk)
+                        if body is not None:
+                            body += chunk
+                    if not message.get("more_body", False):
+                        break
+            finally:
+                await anyio.to_thread.run_sync(f.close)
+            # 原子替换，轮询的客户端不会读到写了一半的文件
+            await anyio.to_thread.run_sync(_commit_upload, temp_path, file_path, hasher)
+        except UploadAborted:
+            _remove(temp_path)
+            print(f"[ClipboardDAV] {path} 上传中断，客户端已断开")
+            return Response(status_code=400)
+        except BaseException:
+            _remove(temp_path)
+            raise
+
+        cache = self.provider.hot_cache
+        if cache is not None:
+            cache.invalidate(path)
+        if is_sync_json:
+            print(f"[ClipboardDAV] SyncClipboard.json 写入完成")
+            # 队列满时 submit 会等待并回退为同步入库，不能在事件循环中执行
+            await anyio.to_thread.run_sync(ingest_queue.submit, new_update(bytes(body)))
+
+        # 与随后 GET 返回的 ETag 一致：缓存的 SyncClipboard.json 使用内容的 md5
+        if cache is not None and is_sync_json:
+            etag = hashlib.md5(body).hexdigest()
+        else:
+            etag = await anyio.to_thread.run_sync(util.get_file_etag, file_path)
+        return Response(status_code=204 if existed else 201, headers={"ETag": f'"{etag}"'})
@@ -1,104 +1,320 @@
+import hashlib
+import io
 import json
 import os
-import shutil
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import secrets
+import threading
 from pathlib import Path
-from wsgidav.fs_dav_provider import FilesystemProvider, FileResource
+from typing import NamedTuple, Optional
+from wsgidav import util
+from wsgidav.dav_error import DAVError, HTTP_FORBIDDEN
+from wsgidav.dav_provider import DAVNonCollection
+from wsgidav.fs_dav_provider import BUFFER_SIZE, FilesystemProvider, FileResource, FolderResource
 from config import Config
-from models import SessionLocal, ClipboardHistory
+from ingest import ingest_queue, new_update
+import blobstore
 
+SYNC_JSON_PATH = "/SyncClipboard.json"
 
-class MonitoredFileResource(FileResource):
+
+class CacheEntry(NamedTuple):
+    """缓存的文件内容和属性"""
+    data: bytes
+    stat: os.stat_result
+    etag: str
+
+
+class HotCache:
+    """
+    当前剪贴板的内存缓存
+
+    客户端持续轮询 SyncClipboard.json 及其引用的 file/ 下的文件，
+    缓存后 GET / HEAD / PROPFIND 不再访问磁盘；通过 WebDAV 写入、删除、移动时失效。
+    revalidate 时每次命中都检查文件的 inode / 大小 / 修改时间（多进程部署时，
+    其他进程的写入不会使本进程的缓存失效），仍然省去读取文件内容。
+    """
+
+    def __init__(self, max_bytes: int, revalidate: bool = False):
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self._entries = {}
+        # 每次失效递增，防止失效前读取的旧内容在失效后写入缓存
+        self._generations = {}
+        self._current_file = None  # SyncClipboard.json 引用的文件路径
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        return "/" + path.lstrip("/")
+
+    def _cacheable(self, key: str) -> bool:
+        return key == SYNC_JSON_PATH or key == self._current_file
+
+    @staticmethod
+    def _changed(entry: CacheEntry, file_path: str) -> bool:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return True
+        return (st.st_ino, st.st_size, st.st_mtime_ns) != \
+            (entry.stat.st_ino, entry.stat.st_size, entry.stat.st_mtime_ns)
+
+    def peek(self, path: str, file_path: str) -> Optional[CacheEntry]:
+        """只查内存，不读取文件内容"""
+        key = self.normalize(path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.revalidate and self._changed(entry, file_path):
+            self.invalidate(key)
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def get(self, path: str, file_path: str) -> Optional[CacheEntry]:
+        """返回缓存条目；不需要缓存或文件不存在时返回 None"""
+        entry = self.peek(path, file_path)
+        if entry is not None:
+            return entry
+        key = self.normalize(path)
+        with self._lock:
+            if not self._cacheable(key):
+                return None
+            self.misses += 1
+            generation = self._generations.get(key, 0)
+
+        try:
+            with open(file_path, "rb") as f:
+                file_stat = os.fstat(f.fileno())
+                if file_stat.st_size > self.max_bytes:
+                    return None
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        entry = CacheEntry(data, file_stat, hashlib.md5(data).hexdigest())
+
+        current_file = self._referenced_file(data) if key == SYNC_JSON_PATH else None
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = entry
+                if key == SYNC_JSON_PATH:
+                    self._current_file = current_file
+        return entry
+
+    @staticmethod
+    def _referenced_file(data: bytes) -> Optional[str]:
+        """SyncClipboard.json 中 File 字段对应的 WebDAV 路径"""
+        try:
+            filename = json.loads(data.decode("utf-8")).get("File")
+        except (ValueError, AttributeError):
+            return None
+        return f"/file/{filename}" if filename else None
+
+    def invalidate(self, path: str):
+        key = self.normalize(path)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+            # 剪贴板内容变化后，旧的引用文件不再是热点
+            if key == SYNC_JSON_PATH and self._current_file:
+                self._entries.pop(self._current_file, None)
+                self._current_file = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(len(entry.data) for entry in self._entries.values()),
+            }
+
+
+def upload_temp_path(file_path: str) -> str:
+    """上传时写入的临时文件（与目标同目录，完成后原子替换）"""
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.{secrets.token_hex(4)}.part")
+
+
+class UploadWriter:
+    """
+    PUT 请求体的写入目标：写入临时文件，同时计算摘要
+
+    写入成功后由 commit() 原子替换目标文件：轮询的客户端不会读到写了一半的文件，
+    已保存为历史对象（硬链接）的旧文件也不会被原地覆盖。
+    """
+
+    def __init__(self, file_path: str):
+        self.temp_path = upload_temp_path(file_path)
+        self.hasher = blobstore.StreamHasher()
+        self._file = open(self.temp_path, "wb", BUFFER_SIZE)
+
+    def write(self, data: bytes) -> int:
+        self._file.write(data)
+        self.hasher.update(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+
+    def commit(self, file_path: str) -> blobstore.FileDigest:
+        self.close()
+        os.replace(self.temp_path, file_path)
+        return self.hasher.digest()
+
+    def discard(self):
+        self.close()
+        try:
+            os.unlink(self.temp_path)
+        except OSError:
+            pass
+
+
+class ClipboardFileResource(FileResource):
     """
-    继承 FileResource，在 SyncClipboard.json 写入完成时记录到数据库
+    继承 FileResource：有缓存条目时属性和内容直接来自内存，
+    写入时边写边计算摘要并原子替换，写入、删除、移动后使缓存失效
     """
-    
+
+    def __init__(self, path: str, environ: dict, file_path: str, entry: Optional[CacheEntry] = None):
+        if entry is None:
+            super().__init__(path, environ, file_path)
+        else:
+            # 不调用 FileResource.__init__，避免 os.stat()
+            DAVNonCollection.__init__(self, path, environ)
+            self._file_path = file_path
+            self.file_stat = entry.stat
+            self.name = util.to_str(os.path.basename(file_path))
+        self._entry = entry
+        self._writer = None
+
+    def get_etag(self):
+        if self._entry is not None:
+            return self._entry.etag
+        return super().get_etag()
+
+    def is_link(self):
+        if self._entry is not None:
+            return False
+        return super().is_link()
+
+    def get_content(self):
+        if self._entry is not None:
+            return io.BytesIO(self._entry.data)
+        return super().get_content()
+
+    def _invalidate(self, *paths):
+        cache = getattr(self.provider, "hot_cache", None)
+        if cache is not None:
+            for path in paths:
+                cache.invalidate(path)
+
+    def begin_write(self, *, content_type=None):
+        if self.provider.readonly:
+            raise DAVError(HTTP_FORBIDDEN)
+        self._writer = UploadWriter(self._file_path)
+        return self._writer
+
+    def end_write(self, *, with_errors):
+        super().end_write(with_errors=with_errors)
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            if with_errors:
+                writer.discard()
+            else:
+                digest = writer.commit(self._file_path)
+                # 入库时直接使用上传时计算的摘要（SyncClipboard.json 不需要）
+                if HotCache.normalize(self.path) != SYNC_JSON_PATH:
+                    blobstore.remember_upload(self._file_path, digest)
+        self._invalidate(self.path)
+        # 写入后内容已变化，PUT 响应中的 ETag 等属性按新文件计算
+        self._entry = None
+        self.file_stat = os.stat(self._file_path)
+
+    def delete(self):
+        super().delete()
+        self._invalidate(self.path)
+
+    def copy_move_single(self, dest_path, *, is_move):
+        # 复制会原地写入已存在的目标文件，先删除目标，避免修改以硬链接保存的历史对象
+        dest_file = self.provider._loc_to_file_path(dest_path, self.environ)
+        if os.path.isfile(dest_file):
+            os.unlink(dest_file)
+        super().copy_move_single(dest_path, is_move=is_move)
+        self._invalidate(dest_path, *([self.path] if is_move else []))
+
+    def move_recursive(self, dest_path):
+        super().move_recursive(dest_path)
+        self._invalidate(dest_path, self.path)
+
+
+class MonitoredFileResource(ClipboardFileResource):
+    """
+    在 SyncClipboard.json 写入完成时记录到数据库
+    """
+
     def end_write(self, *, with_errors):
         """重写 end_write 方法，添加写入完成回调"""
-        # 调用父类方法
+        # 调用父类方法（同时使缓存失效）
         super().end_write(with_errors=with_errors)
-        
+
         if with_errors:
             print(f"[ClipboardDAV] SyncClipboard.json 写入时发生错误")
             return
-            
+
         print(f"[ClipboardDAV] SyncClipboard.json 写入完成")
         self._on_clipboard_updated()
-    
+
     def _on_clipboard_updated(self):
-        """当 SyncClipboard.json 更新时的回调"""
+        """当 SyncClipboard.json 更新时的回调：读取内容后交给后台入库队列"""
         try:
             # _file_path 是字符串类型，需要转换为 Path 对象
             file_path = Path(self._file_path)
-            
+
             # 读取 JSON 文件
             if not file_path.exists():
                 return
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            clip_type = data.get("Type", "")
-            content = data.get("Clipboard", "")
-            filename = data.get("File", "")
-            
-            # 构建数据库记录
-            record = ClipboardHistory(
-                type=clip_type,
-                content=content if clip_type == "Text" else filename,
-                created_at=datetime.now(ZoneInfo(Config.TIMEZONE))
-            )
-            
-            # 如果是文件或图片类型，复制到 history 目录
-            if clip_type in ["Image", "File", "Group"] and filename:
-                # 使用 Config.FILE_DIR 而非手动拼接
-                source_file = Config.FILE_DIR / filename
-                if source_file.exists():
-                    # 生成唯一文件名（使用时间戳）
-                    timestamp = datetime.now(ZoneInfo(Config.TIMEZONE)).strftime("%Y%m%d_%H%M%S_%f")
-                    history_filename = f"{timestamp}_{filename}"
-                    dest_file = Config.HISTORY_DIR / history_filename
-                    
-                    # 复制文件
-                    shutil.copy2(source_file, dest_file)
-                    
-                    # 记录文件信息
-                    record.file_path = str(dest_file.relative_to(Config.DATA_DIR))
-                    record.file_size = dest_file.stat().st_size
-                    record.file_hash = data.get("Clipboard", "")  # 使用原有的 hash
-            
-            # 插入数据库
-            db = SessionLocal()
-            try:
-                db.add(record)
-                db.commit()
-                print(f"[ClipboardDAV] 记录已保存: type={clip_type}, content={content[:50] if content else filename}")
-            except Exception as e:
-                db.rollback()
-                print(f"[ClipboardDAV] 数据库错误: {e}")
-            finally:
-                db.close()
-                
+
+            # 立即读取原文，避免排队期间被下一次写入覆盖；解析和入库在后台完成
+            ingest_queue.submit(new_update(file_path.read_bytes()))
+
         except Exception as e:
             print(f"[ClipboardDAV] 处理剪贴板更新失败: {e}")
 
 
 class ClipboardDAVProvider(FilesystemProvider):
     """
-    自定义 WebDAV Provider，监听 SyncClipboard.json 文件变化并记录到数据库
+    自定义 WebDAV Provider，监听 SyncClipboard.json 文件变化并记录到数据库，
+    并在内存中缓存当前剪贴板内容
     """
-    
+
+    def __init__(self, root_folder, *args, **kwargs):
+        super().__init__(root_folder, *args, **kwargs)
+        self.hot_cache = HotCache(Config.DAV_CACHE_MAX_MB * 1024 * 1024, Config.DAV_CACHE_REVALIDATE) \
+            if Config.DAV_CACHE_ENABLED else None
+
     def get_resource_inst(self, path, environ):
-        """劫持资源获取过程，替换为 MonitoredFileResource"""
+        """劫持资源获取过程：SyncClipboard.json 使用 MonitoredFileResource，当前剪贴板文件走内存缓存"""
+        self._count_get_resource_inst += 1
+        fp = self._loc_to_file_path(path, environ)
         # path 是 WebDAV 路径（如 "/SyncClipboard.json"），需要和文件名比较
-        if path == "/SyncClipboard.json" or path == "SyncClipboard.json":
-            self._count_get_resource_inst += 1
-            fp = self._loc_to_file_path(path, environ)
-            # 文件不存在时返回 None，避免 FileResource.__init__ 中 os.stat() 抛出异常
-            if not os.path.exists(fp):
-                return None
-            return MonitoredFileResource(path, environ, fp)
-        else:
-            return super().get_resource_inst(path, environ)
-        
+        resource_cls = MonitoredFileResource if HotCache.normalize(path) == SYNC_JSON_PATH \
+            else ClipboardFileResource
+
+        if self.hot_cache is not None:
+            entry = self.hot_cache.get(path, fp)
+            if entry is not None:
+                return resource_cls(path, environ, fp, entry)
+
+        # 文件不存在时返回 None，避免 FileResource.__init__ 中 os.stat() 抛出异常
+        if not os.path.exists(fp):
+            return None
+        if not self.fs_opts.get("follow_symlinks") and os.path.islink(fp):
+            raise DAVError(HTTP_FORBIDDEN, f"Symlink support is disabled: {fp!r}")
+        if os.path.isdir(fp):
+            return FolderResource(path, environ, fp)
+        return resource_cls(path, environ, fp)
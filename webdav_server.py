@@ -1,11 +1,31 @@
+from wsgidav.dc.base_dc import BaseDomainController
 from wsgidav.wsgidav_app import WsgiDAVApp
+from auth import verify_credentials
 from config import Config
 from webdav_provider import ClipboardDAVProvider
 
+class ClipboardDomainController(BaseDomainController):
+    """
+    WebDAV 认证：与 API 共用 auth.verify_credentials（密码哈希 + 凭据缓存）
+    """
+
+    def get_domain_realm(self, path_info, environ):
+        return self._calc_realm_from_path_provider(path_info, environ)
+
+    def require_authentication(self, realm, environ):
+        return True
+
+    def basic_auth_user(self, realm, user_name, password, environ):
+        return verify_credentials(user_name, password)
+
+    def supports_http_digest_auth(self):
+        # 只保存密码哈希，无法计算 Digest 认证需要的 HA1
+        return False
+
 def create_webdav_app():
     """
     创建 WsgiDAV 应用
-    
+
     Returns:
         WsgiDAVApp: 配置好的 WebDAV 应用
     """
@@ -14,22 +34,11 @@ def create_webdav_app():
             "/": ClipboardDAVProvider(str(Config.DATA_DIR))
         },
         "http_authenticator": {
-            "domain_controller": None,  # 使用简单认证
+            "domain_controller": ClipboardDomainController,
             "accept_basic": True,
             "accept_digest": False,
             "default_to_digest": False,
         },
-        "simple_dc": {
-            "user_mapping": {
-                "*": {
-                    Config.USERNAME: {
-                        "password": Config.PASSWORD,
-                        "description": "Clipboard sync user",
-                        "roles": [],
-                    }
-                }
-            }
-        },
         "verbose": 1,
         "logging": {
             "enable_loggers": []
@@ -37,5 +46,5 @@ def create_webdav_app():
         "property_manager": True,
         "lock_storage": True,
     }
-    
+
     return WsgiDAVApp(config)